@@ -0,0 +1,203 @@
+"""
+100 Times AI Heroes - スループットベンチマーク
+
+疑似Ollamaサーバー（fake_ollama.py）に対してパイプライン全体（run_generation）を
+実行し、生成件数・並列数の組み合わせごとに次の値を計測する:
+
+    chars/s        1秒あたりのキャラクター生成数
+    calls/s        1秒あたりの推論呼び出し数
+    p50/p95        推論1回あたりのレイテンシ（クライアント側）
+    sampling(s)    シード属性サンプリングに費やした時間
+    storage(s)     出力・シード書き込みに費やした時間
+
+結果はJSONに保存し、--baseline で以前のコミットの結果と比較できる。
+chars/s が閾値以上に落ちたケースがあれば終了コード1を返す。
+
+使用方法:
+    # 既定のマトリクス（iterations 20,100 × concurrency 1,4,8）
+    python harness/bench_throughput.py
+
+    # レイテンシ分布・トークン生成速度・サーバー並列数を指定
+    python harness/bench_throughput.py -n 50 -c 1 8 --latency 0.05 --latency-sigma 0.4 \\
+        --tokens-per-sec 200 --parallel 4
+
+    # ヘッジリクエストあり（--hedge）となしで p95 を比較
+    python harness/bench_throughput.py -n 50 -c 4 --latency 0.05 --latency-sigma 1.0 --hedge
+
+    # 前回の結果と比較（chars/s が10%以上低下したら失敗）
+    python harness/bench_throughput.py --baseline bench_results/abc1234.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "harness"))
+
+from fake_ollama import FakeOllamaServer  # noqa: E402
+from ollama_hero_gen import Config, percentile, run_generation  # noqa: E402
+
+
+def current_commit() -> str:
+    """計測対象のコミット（git が使えなければ "unknown"）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_case(
+    iterations: int, concurrency: int, server_options: dict, model: str = "gpt-oss:20b", hedge: bool = False
+) -> dict:
+    """1ケース分のパイプラインを実行して計測値を返す"""
+    with FakeOllamaServer(models=(model,), **server_options) as server, \
+            tempfile.TemporaryDirectory() as data_dir:
+        config = Config(
+            model=model,
+            host=server.url,
+            data_dir=data_dir,
+            num_iterations=iterations,
+            concurrency=concurrency,
+            hedge=hedge,
+        )
+        # 進捗表示はベンチマークの出力に混ぜない
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine = asyncio.run(run_generation(config))
+            elapsed = time.perf_counter() - start
+
+        rows = engine.llm.metrics.summary()
+        latencies = engine.llm.metrics.latencies()
+        calls = sum(row["calls"] for row in rows)
+
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "hedge": hedge,
+        "elapsed": elapsed,
+        "chars_per_sec": iterations / elapsed if elapsed else 0.0,
+        "calls": calls,
+        "calls_per_sec": calls / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "sampling_time": engine.sampling_time,
+        "storage_time": engine.storage_time,
+        "server_max_in_flight": server.max_in_flight,
+        "hedges_fired": engine.llm.hedger.fired if engine.llm.hedger else 0,
+        "hedges_won": engine.llm.hedger.won if engine.llm.hedger else 0,
+    }
+
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """chars/s がベースラインより threshold 以上低下したケースを返す"""
+    def case(r: dict) -> tuple:
+        return r["iterations"], r["concurrency"], r.get("hedge", False)
+
+    previous = {case(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(case(result))
+        if not before or not before["chars_per_sec"]:
+            continue
+        change = result["chars_per_sec"] / before["chars_per_sec"] - 1.0
+        result["change"] = change
+        if change < -threshold:
+            regressions.append(result)
+    return regressions
+
+
+def print_table(results: list) -> None:
+    print(
+        f"{'iter':>5} {'conc':>5} {'elapsed(s)':>10} {'chars/s':>8} {'calls/s':>8} "
+        f"{'p50(s)':>7} {'p95(s)':>7} {'sampling(s)':>11} {'storage(s)':>10} {'hedges':>7} {'change':>7}"
+    )
+    for r in results:
+        change = f"{r['change']:+.1%}" if "change" in r else "-"
+        hedges = f"{r['hedges_won']}/{r['hedges_fired']}" if r.get("hedge") else "-"
+        print(
+            f"{r['iterations']:5d} {r['concurrency']:5d} {r['elapsed']:10.2f} {r['chars_per_sec']:8.2f} "
+            f"{r['calls_per_sec']:8.1f} {r['p50']:7.3f} {r['p95']:7.3f} {r['sampling_time']:11.3f} "
+            f"{r['storage_time']:10.3f} {hedges:>7} {change:>7}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against a fake Ollama server")
+    parser.add_argument("--iterations", "-n", type=int, nargs="+", default=[20, 100],
+                        help="Characters per run (default: 20 100)")
+    parser.add_argument("--concurrency", "-c", type=int, nargs="+", default=[1, 4, 8],
+                        help="Concurrency levels (default: 1 4 8)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Median per-request latency in seconds (default: 0.02)")
+    parser.add_argument("--latency-sigma", type=float, default=0.0,
+                        help="Log-normal sigma of the latency distribution (default: 0 = fixed)")
+    parser.add_argument("--tokens-per-sec", type=float, default=None,
+                        help="Simulated decode rate; adds response_tokens / rate per request")
+    parser.add_argument("--response-tokens", type=int, default=16,
+                        help="Tokens per simulated response (default: 16)")
+    parser.add_argument("--parallel", type=int, default=None,
+                        help="Server-side parallel slots like OLLAMA_NUM_PARALLEL (default: unlimited)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the latency distribution")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Also run every case with hedged requests and report both")
+    parser.add_argument("--output", "-o", default=None,
+                        help="Result JSON path (default: bench_results/<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="Previous result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed chars/s drop vs baseline before failing (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    server_options = {
+        "latency": args.latency,
+        "latency_sigma": args.latency_sigma,
+        "tokens_per_sec": args.tokens_per_sec,
+        "response_tokens": args.response_tokens,
+        "parallel": args.parallel,
+        "seed": args.seed,
+    }
+    results = [
+        run_case(iterations, concurrency, server_options, hedge=hedge)
+        for iterations in args.iterations
+        for concurrency in args.concurrency
+        for hedge in ((False, True) if args.hedge else (False,))
+    ]
+
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+
+    print_table(results)
+
+    commit = current_commit()
+    output = Path(args.output) if args.output else PROJECT_ROOT / "bench_results" / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps({"commit": commit, "server": server_options, "results": results}, indent=2),
+        encoding="utf-8",
+    )
+    print(f"\nResults saved: {output}")
+
+    if regressions:
+        print(f"\nRegression: chars/s dropped more than {args.threshold:.0%} in {len(regressions)} case(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+100 Times AI Heroes - テスト用の疑似Ollamaサーバー
+
+実際のOllamaを起動せずに /api/tags, /api/chat, /api/pull を応答する。
+OpenAI互換の /v1/models, /v1/chat/completions にも同じ挙動で応答する。
+/v1/completions はプロンプトのリストを1回の処理時間でまとめて返す（バッチデコード相当）。
+チャットテンプレートは template_endpoint（llama.cpp 風の /apply-template か vLLM 風の /tokenize）で適用する。
+ロードバランサーや並行生成のテストで、複数ホストをローカルに立てるために使う。
+
+使用方法:
+    with FakeOllamaServer(latency=0.05) as server:
+        config = Config(model="gpt-oss:20b", host=server.url, data_dir=...)
+
+    # レイテンシ分布・トークン生成速度・並列スロット数を指定（ベンチマーク用）
+    FakeOllamaServer(latency=0.2, latency_sigma=0.5, tokens_per_sec=80, parallel=4)
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _Server(ThreadingHTTPServer):
+    # 並列数が多いと既定の listen backlog (5) を超えて SYN 再送（約1秒）が起きる
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeOllamaServer:
+    """スレッドで動く疑似Ollamaサーバー
+
+    1リクエストの処理時間 = プリフィル相当の latency（latency_sigma > 0 なら
+    中央値 latency の対数正規分布）+ response_tokens / tokens_per_sec。
+    parallel を指定すると OLLAMA_NUM_PARALLEL のように同時処理数を制限し、
+    超過分はスロットが空くまで待たせる。load_time を指定すると最初の /api/chat が
+    モデルのロード時間を払い、load_duration として報告する。
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        models: tuple = ("gpt-oss:20b",),
+        latency_sigma: float = 0.0,
+        tokens_per_sec: Optional[float] = None,
+        response_tokens: int = 16,
+        parallel: Optional[int] = None,
+        seed: Optional[int] = None,
+        load_time: float = 0.0,
+        template_endpoint: str = "/apply-template",
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.response_tokens = response_tokens
+        self.models = list(models)
+        self.load_time = load_time
+        self.template_endpoint = template_endpoint
+        self.loaded = False
+        # 受け取った /api/chat の本文（keep_alive やメッセージの確認用）
+        self.requests: list = []
+        self.chat_requests = 0
+        # /v1/completions で受け取ったプロンプトのリストの長さ
+        self.batches: list = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._port = port
+        self._random = random.Random(seed)
+        self._slots = threading.Semaphore(parallel) if parallel else None
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._httpd = _Server(("127.0.0.1", self._port), self._handler_class())
+        self._port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _durations(self) -> tuple:
+        """(プリフィル相当の秒数, デコード秒数) を分布から引く"""
+        with self._lock:
+            prefill = self.latency
+            if self.latency_sigma > 0 and self.latency > 0:
+                prefill = self._random.lognormvariate(math.log(self.latency), self.latency_sigma)
+        decode = self.response_tokens / self.tokens_per_sec if self.tokens_per_sec else 0.0
+        return prefill, decode
+
+    def chat(self, body: dict) -> dict:
+        """/api/chat の応答を組み立てる"""
+        prefill, decode = self._durations()
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            load = 0.0 if self.loaded else self.load_time
+            self.loaded = True
+            self.requests.append(body)
+            self.chat_requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(load + prefill + decode)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+        fmt = body.get("format")
+        if isinstance(fmt, dict):
+            content = json.dumps({key: f"Fake {key}" for key in fmt.get("properties", {})})
+        else:
+            content = "Fake response"
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        return {
+            "model": body.get("model", ""),
+            "created_at": "2026-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((load + prefill + decode) * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_chars // 4,
+            "prompt_eval_duration": int(prefill * 1e9),
+            "eval_count": self.response_tokens,
+            "eval_duration": int(decode * 1e9),
+        }
+
+    def chat_completions(self, body: dict) -> dict:
+        """/v1/chat/completions（OpenAI互換）の応答を /api/chat と同じ処理で組み立てる"""
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("schema")
+        reply = self.chat(dict(body, format=schema))
+        return {
+            "id": f"chatcmpl-{self.chat_requests}",
+            "object": "chat.completion",
+            "model": reply["model"],
+            "choices": [{"index": 0, "message": reply["message"], "finish_reason": reply["done_reason"]}],
+            "usage": {
+                "prompt_tokens": reply["prompt_eval_count"],
+                "completion_tokens": reply["eval_count"],
+                "total_tokens": reply["prompt_eval_count"] + reply["eval_count"],
+            },
+        }
+
+    @staticmethod
+    def render(messages: list) -> str:
+        """疑似チャットテンプレート"""
+        return "".join(f"<|{m.get('role')}|>{m.get('content', '')}\n" for m in messages) + "<|assistant|>"
+
+    def completions(self, body: dict) -> dict:
+        """/v1/completions（OpenAI互換）の応答。プロンプトのリストを1回の処理でまとめて返す"""
+        prompts = body.get("prompt") or []
+        if not isinstance(prompts, list) or (prompts and isinstance(prompts[0], int)):
+            prompts = [prompts]
+        with self._lock:
+            self.batches.append(len(prompts))
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("schema")
+        text = "\n".join(p if isinstance(p, str) else f"{len(p)} tokens" for p in prompts)
+        reply = self.chat({"model": body.get("model", ""), "messages": [{"role": "user", "content": text}], "format": schema})
+        return {
+            "id": f"cmpl-{self.chat_requests}",
+            "object": "text_completion",
+            "model": reply["model"],
+            "choices": [
+                {"index": i, "text": reply["message"]["content"], "finish_reason": reply["done_reason"]}
+                for i in range(len(prompts))
+            ],
+            "usage": {
+                "prompt_tokens": reply["prompt_eval_count"],
+                "completion_tokens": reply["eval_count"] * len(prompts),
+                "total_tokens": reply["prompt_eval_count"] + reply["eval_count"] * len(prompts),
+            },
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, payload: dict, status: int = 200) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                try:
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # ヘッジで負けた側はクライアントが先に切断している
+                    pass
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self) -> None:
+                if self.path == "/api/tags":
+                    models = [{"name": m, "model": m} for m in server.models]
+                    self._send({"models": models})
+                elif self.path == "/v1/models":
+                    self._send({"object": "list", "data": [{"id": m, "object": "model"} for m in server.models]})
+                else:
+                    self._send({"error": "not found"}, status=404)
+
+            def do_POST(self) -> None:
+                body = self._body()
+                if self.path == "/api/chat":
+                    self._send(server.chat(body))
+                elif self.path == "/v1/chat/completions":
+                    self._send(server.chat_completions(body))
+                elif self.path == "/v1/completions":
+                    self._send(server.completions(body))
+                elif self.path == server.template_endpoint == "/apply-template":
+                    self._send({"prompt": server.render(body.get("messages", []))})
+                elif self.path == server.template_endpoint == "/tokenize":
+                    tokens = [ord(c) for c in server.render(body.get("messages", []))]
+                    self._send({"count": len(tokens), "max_model_len": 8192, "tokens": tokens})
+                elif self.path == "/api/pull":
+                    server.models.append(body.get("model", ""))
+                    self._send({"status": "success"})
+                else:
+                    self._send({"error": "not found"}, status=404)
+
+        return Handler
@@ -26,9 +26,10 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-# プロジェクトルートをパスに追加
+# プロジェクトルートとハーネス（fake_ollama）をパスに追加
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "harness"))
 
 FEATURES_PATH = PROJECT_ROOT / "harness" / "features.json"
 
@@ -522,6 +523,1761 @@ class TestIntegration(FeatureTest):
         pytest.skip("Run manually with: python ollama_hero_gen.py --iterations 100")
 
 
+# =============================================================================
+# Concurrency Tests (CON001-)
+# =============================================================================
+
+
+class TestConcurrency(FeatureTest):
+    """並行生成エンジンテスト"""
+
+    def test_concurrent_engine_ordering(self, tmp_path):
+        """CON001: 並行生成とインデックス順出力"""
+        self.feature_id = "CON001"
+
+        import asyncio
+        import csv
+
+        from ollama_hero_gen import Character, Config, GenerationEngine, LocalStorage
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            num_iterations=6,
+            concurrency=3,
+        )
+        storage = LocalStorage(config)
+        engine = GenerationEngine(config, llm=None, storage=storage)
+
+        in_flight = {"now": 0, "max": 0}
+
+        async def fake_generate_character(index):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            # 後のキャラクターほど早く終わるようにして完了順を入れ替える
+            await asyncio.sleep(0.01 * (config.num_iterations - index))
+            in_flight["now"] -= 1
+            character = Character(*([f"c{index}"] * len(Character.headers())))
+            return character, {"ability": f"ability-{index}"}
+
+        engine.generate_character = fake_generate_character
+        asyncio.run(engine.run())
+        storage.close()
+
+        with open(storage.output_file, encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == Character.headers()
+        assert [row[0] for row in rows[1:]] == [f"c{i}" for i in range(6)]
+        assert in_flight["max"] == 3
+
+        with open(storage.seed_files["ability"], encoding="utf-8") as f:
+            seeds = [row[0] for row in csv.reader(f)]
+        assert seeds[-6:] == [f"ability-{i}" for i in range(6)]
+
+
+    def test_concept_fanout_graph(self, tmp_path):
+        """CON002: concept依存タスクの同時実行"""
+        self.feature_id = "CON002"
+
+        import asyncio
+
+        from ollama_hero_gen import Config, GenerationEngine, LocalStorage
+
+        class FakeLLM:
+            def __init__(self):
+                self.calls = []
+                self.in_flight = 0
+                self.max_in_flight = 0
+
+            async def generate(self, prompt, task="default", **kwargs):
+                self.calls.append(prompt)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(0.01)
+                self.in_flight -= 1
+                return "CONCEPT" if len(self.calls) == 1 else f"out{len(self.calls)}"
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+        llm = FakeLLM()
+        engine = GenerationEngine(config, llm=llm, storage=LocalStorage(config))
+        character, new_seeds = asyncio.run(engine.generate_character(0))
+
+        assert len(llm.calls) == 7
+        # 1回目がconcept、残り6回は全てconceptを受け取り同時に実行される
+        assert "CONCEPT" not in llm.calls[0]
+        assert all("CONCEPT" in prompt for prompt in llm.calls[1:])
+        assert llm.max_in_flight == 6
+        assert character.concept == "CONCEPT"
+        assert set(new_seeds) == {"ability", "wants", "role"}
+
+
+# =============================================================================
+# Storage Tests (STO001-)
+# =============================================================================
+
+
+class TestStorage(FeatureTest):
+    """ローカルストレージテスト"""
+
+    def test_seed_pool_cache(self, tmp_path):
+        """STO001: シードプールのメモリキャッシュ"""
+        self.feature_id = "STO001"
+
+        import csv
+        import os
+
+        from ollama_hero_gen import Config, LocalStorage
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+        storage = LocalStorage(config)
+
+        reads = []
+        original = storage._read_seed_values
+        storage._read_seed_values = lambda seed_file: reads.append(seed_file) or original(seed_file)
+
+        for _ in range(20):
+            storage.get_random_attribute("ability")
+        assert len(reads) == 1
+
+        # append_seedはファイルとメモリの両方に反映され、再読込は発生しない
+        storage.append_seed("ability", "Can fold space")
+        assert "Can fold space" in storage._seed_pool("ability")
+        assert len(reads) == 1
+
+        # 外部でファイルが変更された場合のみ再読込する
+        seed_file = storage.seed_files["ability"]
+        with open(seed_file, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(["Edited by hand"])
+        stat = seed_file.stat()
+        os.utime(seed_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert "Edited by hand" in storage._seed_pool("ability")
+        assert len(reads) == 2
+
+
+    def test_buffered_writer_flush_policy(self, tmp_path, monkeypatch):
+        """STO002: バックグラウンド書き込みのフラッシュポリシー"""
+        self.feature_id = "STO002"
+
+        import csv
+        import time
+
+        from ollama_hero_gen import Config, LocalStorage
+
+        def read_rows(path):
+            with open(path, encoding="utf-8") as f:
+                return list(csv.reader(f))[1:]
+
+        def wait_for(predicate, timeout=3.0):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                if predicate():
+                    return True
+                time.sleep(0.01)
+            return False
+
+        # 行数ポリシー: 3行ごと
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path / "rows"),
+            flush_rows=3,
+            flush_interval=60.0,
+        )
+        storage = LocalStorage(config)
+        storage.append_output(["a"])
+        storage.append_output(["b"])
+        time.sleep(0.1)
+        assert read_rows(storage.output_file) == []
+        storage.append_output(["c"])
+        assert wait_for(lambda: len(read_rows(storage.output_file)) == 3)
+
+        # close時に残りがフラッシュされる
+        storage.append_output(["d"])
+        storage.append_seed("role", "Cartographer. Maps forgotten roads")
+        storage.close()
+        assert read_rows(storage.output_file)[-1] == ["d"]
+        assert read_rows(storage.seed_files["role"])[-1] == ["Cartographer. Maps forgotten roads"]
+
+        # close後の flush は待ち続けずに戻る
+        started = time.monotonic()
+        storage.flush()
+        assert time.monotonic() - started < 1.0
+
+        # 時間ポリシー: 0.05秒ごと
+        from dataclasses import replace
+
+        config = replace(config, data_dir=str(tmp_path / "interval"), flush_rows=100, flush_interval=0.05)
+        storage = LocalStorage(config)
+        storage.append_output(["e"])
+        assert wait_for(lambda: read_rows(storage.output_file) == [["e"]])
+        storage.close()
+
+        # 書き出し（fsync）中も、シードの抽選・追加はディスクI/Oを待たない
+        import os
+        import threading
+
+        fsync_started = threading.Event()
+
+        def slow_fsync(fd):
+            fsync_started.set()
+            time.sleep(0.5)
+
+        monkeypatch.setattr(os, "fsync", slow_fsync)
+        config = replace(config, data_dir=str(tmp_path / "fsync"), flush_rows=1, fsync=True)
+        storage = LocalStorage(config)
+        storage.append_output(["f"])
+        assert fsync_started.wait(3.0)
+        started = time.monotonic()
+        storage.get_random_attribute("role")
+        assert storage.append_seed("role", "Lamplighter. Keeps the harbor lit")
+        assert time.monotonic() - started < 0.2
+        storage.close()
+        assert read_rows(storage.seed_files["role"]).count(["Lamplighter. Keeps the harbor lit"]) == 1
+        assert storage.get_random_attribute("role")
+        with storage._lock:
+            assert storage._seed_pool("role").count("Lamplighter. Keeps the harbor lit") == 1
+
+
+# =============================================================================
+# Cache Tests (CCH001-)
+# =============================================================================
+
+
+class TestCache(FeatureTest):
+    """応答キャッシュテスト"""
+
+    def test_response_cache_lru(self, tmp_path):
+        """CCH001: 応答キャッシュのLRU削除とヒット率"""
+        self.feature_id = "CCH001"
+
+        from ollama_hero_gen import ResponseCache
+
+        cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=250)
+        keys = [ResponseCache.key("m", [{"role": "user", "content": str(i)}], {}) for i in range(3)]
+        assert len(set(keys)) == 3
+
+        cache.put(keys[0], "a" * 100)
+        cache.put(keys[1], "b" * 100)
+        assert cache.get(keys[0]) == "a" * 100  # keys[0] を最近参照に
+        cache.put(keys[2], "c" * 100)  # 上限超過 → 最も古い keys[1] を削除
+
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) == "c" * 100
+        stats = cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["evictions"] == 1
+        cache.close()
+
+        # 再オープンしても内容は残る
+        reopened = ResponseCache(tmp_path / "cache.sqlite", max_bytes=250)
+        assert reopened.get(keys[0]) == "a" * 100
+        reopened.close()
+
+    def test_inference_uses_cache(self, tmp_path):
+        """CCH002: 同一リクエストはサーバーを呼ばない"""
+        self.feature_id = "CCH002"
+
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from ollama_hero_gen import AsyncOllamaInference, Config
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            cache=True,
+        )
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(return_value={"message": {"content": " Kain Astralion \n"}})
+
+        async def scenario():
+            first = await llm.generate("name prompt")
+            second = await llm.generate("name prompt")
+            other = await llm.generate("another prompt")
+            await llm.close()
+            return first, second, other
+
+        first, second, other = asyncio.run(scenario())
+        assert first == second == other == "Kain Astralion"
+        assert llm.client.chat.await_count == 2
+        assert llm.cache.hits == 1
+        assert (tmp_path / "response_cache.sqlite").exists()
+
+
+# =============================================================================
+# Generation Profile Tests (PRF001-)
+# =============================================================================
+
+
+class TestGenerationProfiles(FeatureTest):
+    """タスク別生成オプションテスト"""
+
+    def test_task_option_profiles(self, tmp_path):
+        """PRF001: タスク別プロファイルと上書き"""
+        self.feature_id = "PRF001"
+
+        from unittest.mock import MagicMock
+
+        from ollama_hero_gen import (
+            Config,
+            OllamaInference,
+            parse_task_option,
+            resolve_profiles,
+        )
+
+        assert parse_task_option("name.num_predict=64") == ("name", "num_predict", 64)
+        assert parse_task_option('name.stop=["\\n"]') == ("name", "stop", ["\n"])
+        with pytest.raises(ValueError):
+            parse_task_option("num_predict=64")
+
+        profiles = resolve_profiles(
+            {"*": {"temperature": 0.5}, "name": {"num_predict": 64, "stop": ["\n"]}}
+        )
+        assert profiles["name"].to_options() == {
+            "num_predict": 64,
+            "temperature": 0.5,
+            "stop": ["\n"],
+        }
+        assert profiles["profile"].temperature == 0.5
+        assert profiles["name"].num_predict < profiles["default"].num_predict
+        with pytest.raises(ValueError):
+            resolve_profiles({"nmae": {"num_predict": 64}})
+        with pytest.raises(ValueError):
+            resolve_profiles({"name": {"max_tokens": 64}})
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            task_options={"catchphrase": {"num_ctx": 2048}},
+        )
+        with patch("ollama_hero_gen.ollama.Client") as client_cls:
+            client = MagicMock()
+            client.list.return_value = {"models": [{"name": "gpt-oss:20b"}]}
+            client.chat.return_value = {"message": {"content": "ok"}}
+            client_cls.return_value = client
+            llm = OllamaInference(config)
+            llm.generate("prompt", task="catchphrase")
+
+        options = client.chat.call_args.kwargs["options"]
+        assert options["num_ctx"] == 2048
+        assert options["num_predict"] == resolve_profiles({})["catchphrase"].num_predict
+
+
+# =============================================================================
+# Structured Output Tests (STR001-)
+# =============================================================================
+
+
+class TestStructuredOutput(FeatureTest):
+    """構造化出力モードテスト"""
+
+    def test_structured_generation(self, tmp_path, monkeypatch):
+        """STR001: JSONスキーマによる1キャラ3回生成"""
+        self.feature_id = "STR001"
+
+        import asyncio
+        import json as json_
+        from unittest.mock import AsyncMock
+
+        from ollama_hero_gen import (
+            AsyncOllamaInference,
+            Config,
+            GenerationEngine,
+            LocalStorage,
+            Prompts,
+        )
+
+        monkeypatch.setattr("ollama_hero_gen.asyncio.sleep", AsyncMock())
+
+        responses = {
+            "character_sheet": [
+                "not json",  # 1回目はパース失敗 → リトライ
+                json_.dumps({"name": "Kain", "profile": "彼は剣士です。", "catchphrase": "俺は進む。"}),
+            ],
+            "counterpart_seeds": [
+                json_.dumps(
+                    {
+                        "new_ability": "Can bend light.",
+                        "new_wants": "I want to see the sea.",
+                        "new_role": "Sailor. Navigates storms.",
+                    }
+                )
+            ],
+        }
+
+        async def fake_chat(model, messages, options, format=None, keep_alive=None):
+            if format is None:
+                return {"message": {"content": "A lone swordsman."}}
+            task = "character_sheet" if "name" in format["properties"] else "counterpart_seeds"
+            return {"message": {"content": responses[task].pop(0)}}
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            structured=True,
+        )
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(side_effect=fake_chat)
+        engine = GenerationEngine(config, llm=llm, storage=LocalStorage(config))
+        character, new_seeds = asyncio.run(engine.generate_character(0))
+
+        assert llm.client.chat.await_count == 4  # concept + sheet(2回) + seeds
+        assert character.name == "Kain"
+        assert character.catchphrase == "俺は進む。"
+        assert character.concept == "A lone swordsman."
+        assert new_seeds == {
+            "ability": "Can bend light.",
+            "wants": "I want to see the sea.",
+            "role": "Sailor. Navigates storms.",
+        }
+        assert "JSON" in Prompts.character_sheet("x")
+        assert set(Prompts.COUNTERPART_SEEDS_SCHEMA["required"]) == {
+            "new_ability",
+            "new_wants",
+            "new_role",
+        }
+
+
+# =============================================================================
+# Session Prefix Tests (SES001-)
+# =============================================================================
+
+
+class TestSessionPrefix(FeatureTest):
+    """共有プレフィックス再利用テスト"""
+
+    def test_session_prefix_reuse(self, tmp_path):
+        """SES001: system+conceptの共有プレフィックスとプリフィル集計"""
+        self.feature_id = "SES001"
+
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from ollama_hero_gen import (
+            AsyncOllamaInference,
+            Config,
+            GenerationEngine,
+            LocalStorage,
+            Prompts,
+        )
+
+        sent = []
+
+        async def fake_chat(model, messages, options, keep_alive=None):
+            sent.append(messages)
+            if len(sent) == 1:
+                return {"message": {"content": "A lone swordsman."}, "prompt_eval_count": 120}
+            # 2回目（最初の派生タスク）はプレフィックス全体、以降はキャッシュ済み
+            count = 300 if len(sent) == 2 else 40
+            return {"message": {"content": "out"}, "prompt_eval_count": count}
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            session=True,
+        )
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(side_effect=fake_chat)
+        engine = GenerationEngine(config, llm=llm, storage=LocalStorage(config))
+        asyncio.run(engine.generate_character(0))
+
+        assert len(sent) == 7
+        derived = sent[1:]
+        prefix = derived[0][:2]
+        assert prefix[1]["content"] == Prompts.concept_context("A lone swordsman.")
+        for messages in derived:
+            assert messages[:2] == prefix
+            assert "A lone swordsman." not in messages[2]["content"]
+        # 最初の派生タスクが単独で先行する（name）
+        assert derived[0][2]["content"] == Prompts.followup("name")
+
+        assert engine.prompt_eval_total == 300 + 40 * 5
+        assert engine.prompt_reused_total == (300 - 40) * 5
+
+
+# =============================================================================
+# Load Balancer Tests (LB001-)
+# =============================================================================
+
+
+class TestLoadBalancer(FeatureTest):
+    """複数ホスト振り分けテスト"""
+
+    def test_least_outstanding_routing(self, tmp_path):
+        """LB001: 複数ホストへの振り分けと障害ホストの除外・復帰"""
+        self.feature_id = "LB001"
+
+        import asyncio
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import AsyncOllamaInference, Config
+
+        with FakeOllamaServer(latency=0.05) as fast, FakeOllamaServer(latency=0.05) as down:
+            config = Config(
+                model="gpt-oss:20b",
+                host=f"{fast.url}, {down.url}",
+                data_dir=str(tmp_path),
+                health_check_interval=0.05,
+            )
+            assert config.hosts == [fast.url, down.url]
+
+            async def scenario():
+                llm = AsyncOllamaInference(config)
+                await llm.ensure_model_available()
+
+                # 同時8件は2台に均等に振り分けられる
+                await asyncio.gather(*(llm.generate(f"p{i}") for i in range(8)))
+                assert fast.chat_requests == 4
+                assert down.chat_requests == 4
+
+                # 1台停止 → 接続エラーでローテーションから外れ、残りのホストで完走
+                down.stop()
+                results = await asyncio.gather(*(llm.generate(f"q{i}") for i in range(6)))
+                assert all(r == "Fake response" for r in results)
+                assert not llm.pool.endpoints[1].healthy
+
+                # 再起動するとヘルスチェックで復帰する
+                down.start()
+                for _ in range(100):
+                    if llm.pool.endpoints[1].healthy:
+                        break
+                    await asyncio.sleep(0.02)
+                assert llm.pool.endpoints[1].healthy
+                await llm.close()
+
+            asyncio.run(scenario())
+
+
+# =============================================================================
+# Telemetry Tests (TEL001-)
+# =============================================================================
+
+
+class TestTelemetry(FeatureTest):
+    """推論計測テスト"""
+
+    def test_percentile(self):
+        """TEL001: パーセンタイル計算"""
+        self.feature_id = "TEL001"
+
+        from ollama_hero_gen import MetricsRecorder, percentile
+
+        assert percentile([], 95) == 0.0
+        assert percentile([3.0], 50) == 3.0
+        assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+        assert percentile(list(range(101)), 95) == 95
+
+        recorder = MetricsRecorder()
+        recorder.record("name", 0, 0, 1.0, response={"eval_count": 20, "eval_duration": 2e9})
+        recorder.record("name", 1, 0, 3.0, response={"eval_count": 20, "eval_duration": 2e9, "load_duration": 5e9})
+        recorder.record("name", 2, 0, 0.5, error=TimeoutError("slow"))
+        recorder.record("name", 3, 0, 0.0, cached=True)
+        (row,) = recorder.summary()
+        assert row["calls"] == 2
+        assert row["p50"] == 2.0
+        assert row["tokens_per_sec"] == 10.0
+        assert row["errors"] == 1
+        assert row["reloads"] == 1
+
+    def test_metrics_jsonl(self, tmp_path):
+        """TEL002: 推論ごとの計測値を metrics.jsonl に記録"""
+        self.feature_id = "TEL002"
+
+        import asyncio
+        import json as json_
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import (
+            AsyncOllamaInference,
+            Config,
+            GenerationEngine,
+            LocalStorage,
+            MetricsRecorder,
+        )
+
+        with FakeOllamaServer(latency=0.01) as server:
+            config = Config(
+                model="gpt-oss:20b",
+                host=server.url,
+                data_dir=str(tmp_path),
+                num_iterations=2,
+                concurrency=2,
+            )
+            storage = LocalStorage(config)
+            llm = AsyncOllamaInference(config)
+            llm.metrics = MetricsRecorder(on_record=storage.append_metrics)
+
+            async def scenario():
+                await GenerationEngine(config, llm, storage).run()
+                await llm.close()
+
+            asyncio.run(scenario())
+            storage.close()
+
+        with open(storage.metrics_file, encoding="utf-8") as f:
+            records = [json_.loads(line) for line in f]
+        assert len(records) == 14
+        assert {r["index"] for r in records} == {0, 1}
+        assert {r["task"] for r in records} >= {"concept", "name", "new_role"}
+        for record in records:
+            assert record["status"] == "ok"
+            assert record["attempt"] == 0
+            assert record["host"] == server.url
+            for key in ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration", "load_duration"):
+                assert key in record
+        summary = {row["task"]: row for row in llm.metrics.summary()}
+        assert summary["concept"]["calls"] == 2
+
+
+# =============================================================================
+# Benchmark Tests (BEN001-)
+# =============================================================================
+
+
+class TestBenchmark(FeatureTest):
+    """スループットベンチマークテスト"""
+
+    def test_bench_smoke(self):
+        """BEN001: 疑似サーバーでの計測と前回結果との比較"""
+        self.feature_id = "BEN001"
+
+        from bench_throughput import compare, run_case
+
+        result = run_case(2, 2, {"latency": 0.01, "latency_sigma": 0.3, "parallel": 2, "seed": 1})
+        assert result["calls"] == 1 + 14  # プリロード + 2体分
+        assert result["chars_per_sec"] > 0
+        assert result["calls_per_sec"] > result["chars_per_sec"]
+        assert result["p95"] >= result["p50"] > 0
+        assert result["server_max_in_flight"] <= 2
+
+        baseline = {"results": [dict(result, chars_per_sec=result["chars_per_sec"] * 2)]}
+        regressions = compare([dict(result)], baseline, threshold=0.1)
+        assert len(regressions) == 1
+        assert regressions[0]["change"] == pytest.approx(-0.5)
+        assert compare([dict(result)], baseline, threshold=0.6) == []
+
+
+# =============================================================================
+# Journal Tests (JRN001-)
+# =============================================================================
+
+
+class TestJournal(FeatureTest):
+    """実行ジャーナル・再開テスト"""
+
+    def test_resume_from_journal(self, tmp_path):
+        """JRN001: 中断した実行をジャーナルから再開"""
+        self.feature_id = "JRN001"
+
+        import asyncio
+        import csv
+        from dataclasses import replace
+
+        from ollama_hero_gen import Config, GenerationEngine, LocalStorage
+
+        class FakeLLM:
+            def __init__(self, fail_at=None):
+                self.calls = []
+                self.fail_at = fail_at
+
+            async def generate(self, prompt, task="default", index=None, **kwargs):
+                self.calls.append((index, task))
+                if (index, task) == self.fail_at:
+                    raise RuntimeError("crash")
+                return f"{task}-{index}"
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            num_iterations=4,
+        )
+
+        # 3体目の name で落ちる（concept などは完了済み）
+        storage = LocalStorage(config)
+        with pytest.raises(RuntimeError):
+            asyncio.run(GenerationEngine(config, FakeLLM(fail_at=(2, "name")), storage).run())
+        storage.close()
+        run_dir = storage.run_dir
+        ability_seeds = storage.seed_files["ability"].read_text(encoding="utf-8").splitlines()
+
+        # クラッシュ時の途中行を模擬: ジャーナルの書きかけ行・ジャーナル未記録の出力行
+        with open(storage.journal_file, "a", encoding="utf-8") as f:
+            f.write('{"type": "charac')
+        with open(storage.output_file, "a", encoding="utf-8") as f:
+            f.write("stray,row\n")
+
+        llm = FakeLLM()
+        storage = LocalStorage(replace(config, resume=str(run_dir)))
+        assert storage.run_dir == run_dir
+        engine = GenerationEngine(config, llm, storage)
+        assert engine.resumed == 2
+        asyncio.run(engine.run())
+        storage.close()
+
+        # 確定済みの2体は再生成せず、3体目は concept を再利用して残りだけ推論
+        assert {index for index, _ in llm.calls} == {2, 3}
+        assert (2, "concept") not in llm.calls
+        assert (2, "name") in llm.calls
+        assert engine.reused_calls >= 1
+
+        with open(storage.output_file, encoding="utf-8") as f:
+            rows = list(csv.reader(f))[1:]
+        assert [row[0] for row in rows] == [f"name-{i}" for i in range(4)]
+        assert [row[4] for row in rows] == [f"concept-{i}" for i in range(4)]
+
+        # シードは確定したキャラクターにつき1回ずつ
+        seeds = storage.seed_files["ability"].read_text(encoding="utf-8").splitlines()
+        assert seeds[: len(ability_seeds)] == ability_seeds
+        assert seeds[-4:] == [f"new_ability-{i}" for i in range(4)]
+
+
+# =============================================================================
+# Warm-up Tests (WRM001-)
+# =============================================================================
+
+
+class TestWarmup(FeatureTest):
+    """モデルのプリロード・ウォームアップテスト"""
+
+    def test_preload_and_keep_alive(self, tmp_path):
+        """WRM001: 起動時のプリロードでコールドスタートを先に払う"""
+        self.feature_id = "WRM001"
+
+        import asyncio
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import AsyncOllamaInference, Config, MetricsRecorder
+
+        with FakeOllamaServer(load_time=0.2) as server:
+            config = Config(
+                model="gpt-oss:20b",
+                host=server.url,
+                data_dir=str(tmp_path),
+                keep_alive="1h",
+            )
+
+            async def scenario():
+                llm = AsyncOllamaInference(config)
+                llm.metrics = MetricsRecorder()
+                try:
+                    (result,) = await llm.preload(warmup=True)
+                    await llm.generate("hello", task="name")
+                finally:
+                    await llm.close()
+                return llm, result
+
+            llm, result = asyncio.run(scenario())
+
+        # ロード時間はプリロードが払い、本番の呼び出しは再ロードしない
+        assert result["preload"] >= 0.2
+        assert result["preload_load"] == pytest.approx(0.2)
+        assert result["warmup_load"] == 0.0
+        summary = {row["task"]: row for row in llm.metrics.summary()}
+        assert summary["preload"]["reloads"] == 0  # 0.2秒は再ロード判定の閾値未満
+        assert summary["name"]["p50"] < 0.2
+
+        preload, warmup, name = server.requests
+        assert not preload.get("messages")
+        assert [m["role"] for m in warmup["messages"]] == ["system"]
+        assert warmup["options"]["num_predict"] == 1
+        assert warmup["options"].get("num_ctx") == name["options"].get("num_ctx")
+        assert all(body["keep_alive"] == "1h" for body in server.requests)
+
+
+# =============================================================================
+# Seed Dedup Tests (DUP001-)
+# =============================================================================
+
+
+class TestSeedDedup(FeatureTest):
+    """シード近似重複検出テスト"""
+
+    def test_near_duplicate_seeds_rejected(self, tmp_path):
+        """DUP001: 既存シードの言い換えは追加せず棄却数を数える"""
+        self.feature_id = "DUP001"
+
+        import csv
+        from dataclasses import replace
+
+        from ollama_hero_gen import Config, LocalStorage, NearDuplicateIndex
+
+        index = NearDuplicateIndex(threshold=0.6)
+        assert index.add_if_new("Can manipulate fire at will")
+        assert not index.add_if_new("can manipulate FIRE at will!")
+        assert not index.add_if_new("Has the power to manipulate fire at will")
+        assert index.add_if_new("Speaks with the spirits of drowned sailors")
+        assert index.add_if_new("炎を自在に操る")
+        assert not index.add_if_new("炎を自在に操る。")
+        assert len(index) == 3
+
+        # 定型の書き出しが同じだけの、中身の違うシードは残す
+        distinct = NearDuplicateIndex(threshold=0.5)
+        for value in (
+            "Has the ability to heal others",
+            "Has the ability to fly",
+            "Can control time for brief moments",
+            "Can control shadows for brief moments",
+            "I want to protect the innocent",
+            "I want to protect the forest",
+        ):
+            assert distinct.add_if_new(value), value
+        assert not distinct.add_if_new("I want to protect the innocent.")
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+        storage = LocalStorage(config)
+        # 初期シード "Can manipulate fire at will" の言い換え
+        assert not storage.append_seed("ability", "Can manipulate fire at will.")
+        assert storage.append_seed("ability", "Can fold paper into living birds")
+        assert not storage.append_seed("ability", "Can fold paper into living birds!")
+        storage.close()
+        assert storage.seed_rejections["ability"] == 2
+
+        with open(storage.seed_files["ability"], encoding="utf-8") as f:
+            seeds = [row[0] for row in csv.reader(f)][1:]
+        assert seeds.count("Can fold paper into living birds") == 1
+        assert "Can manipulate fire at will." not in seeds
+
+        # 閾値 0 で無効化
+        storage = LocalStorage(replace(config, seed_dedup_threshold=0))
+        assert storage.append_seed("ability", "Can fold paper into living birds")
+        storage.close()
+
+
+# =============================================================================
+# Sampler Tests (SMP001-)
+# =============================================================================
+
+
+class TestSeedSampler(FeatureTest):
+    """重み付きシードサンプラーテスト"""
+
+    def test_weighted_sampler(self, tmp_path):
+        """SMP001: Fenwick木による使用回数で減衰する重み付き抽選"""
+        self.feature_id = "SMP001"
+
+        import random
+        from collections import Counter
+
+        from ollama_hero_gen import Config, LocalStorage, WeightedSampler
+
+        rng = random.Random(0)
+
+        # decay=0 は一様抽選
+        sampler = WeightedSampler(decay=0)
+        for _ in range(5):
+            sampler.add()
+        counts = Counter(sampler.sample(rng) for _ in range(5000))
+        assert set(counts) == set(range(5))
+        assert all(800 < c < 1200 for c in counts.values())
+
+        # 使用回数で重みが下がり、偏りなく使われる
+        sampler = WeightedSampler(decay=1.0)
+        for _ in range(10):
+            sampler.add()
+        counts = Counter(sampler.draw(rng) for _ in range(1000))
+        assert max(counts.values()) - min(counts.values()) < 40
+        assert sampler.total == pytest.approx(sum(1 / (1 + c) for c in counts.values()))
+
+        # 後から追加した未使用の値は選ばれやすい
+        sampler.add()
+        assert Counter(sampler.draw(rng) for _ in range(5))[10] >= 3
+
+        # ストレージでも追加したシードが抽選対象になる（モジュールの random を使う）
+        random.seed(0)
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+        storage = LocalStorage(config)
+        pool_size = len(storage._seed_pool("age"))
+        seen = Counter(storage.get_random_attribute("age") for _ in range(pool_size * 3))
+        assert len(seen) == pool_size
+        assert max(seen.values()) <= 5
+        storage.append_seed("ability", "Can fold paper into living birds")
+        drawn = [storage.get_random_attribute("ability") for _ in range(len(storage._seed_pool("ability")) * 2)]
+        assert "Can fold paper into living birds" in drawn
+        storage.close()
+
+
+# =============================================================================
+# Output Format Tests (OUT001-)
+# =============================================================================
+
+
+class TestOutputFormats(FeatureTest):
+    """出力形式・シャード分割テスト"""
+
+    @staticmethod
+    def _write_characters(tmp_path, count, **overrides):
+        from ollama_hero_gen import Character, Config, LocalStorage
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            **overrides,
+        )
+        storage = LocalStorage(config)
+        characters = [
+            Character(*[f"{field}-{i}\n改行を含む" for field in Character.headers()])
+            for i in range(count)
+        ]
+        for character in characters:
+            storage.append_output(character.to_row())
+        storage.close()
+        return storage, characters
+
+    def test_jsonl_shards_and_reader(self, tmp_path):
+        """OUT001: JSONL(gzip)出力のシャード分割とストリーミング読み出し"""
+        self.feature_id = "OUT001"
+
+        import gzip
+        import json as json_
+
+        from ollama_hero_gen import read_characters
+
+        storage, characters = self._write_characters(
+            tmp_path / "gz", 5, output_format="jsonl.gz", shard_rows=2
+        )
+        assert [p.name for p in storage.output_files] == [
+            "output-00000.jsonl.gz",
+            "output-00001.jsonl.gz",
+            "output-00002.jsonl.gz",
+        ]
+        with gzip.open(storage.output_files[0], "rt", encoding="utf-8") as f:
+            assert json_.loads(f.readline())["name"] == "name-0\n改行を含む"
+        assert list(read_characters(storage.run_dir)) == characters
+
+        # サイズで分割（CSVは各シャードにヘッダー）
+        storage, characters = self._write_characters(
+            tmp_path / "csv", 40, flush_rows=1, shard_mb=2 / 1024
+        )
+        assert len(storage.output_files) > 1
+        assert all(p.stat().st_size < 4 * 1024 for p in storage.output_files)
+        assert list(read_characters(storage.run_dir)) == characters
+
+        # 既定は従来どおり output.csv 1ファイル
+        storage, characters = self._write_characters(tmp_path / "default", 3)
+        assert [p.name for p in storage.output_files] == ["output.csv"]
+        assert list(read_characters(storage.run_dir)) == characters
+
+    def test_optional_formats(self, tmp_path):
+        """OUT002: Parquet / zstd 出力（任意依存）"""
+        self.feature_id = "OUT002"
+
+        pytest.importorskip("pyarrow")
+        pytest.importorskip("zstandard")
+        from ollama_hero_gen import read_characters
+
+        for fmt in ("parquet", "jsonl.zst"):
+            storage, characters = self._write_characters(
+                tmp_path / fmt, 5, output_format=fmt, shard_rows=3
+            )
+            assert len(storage.output_files) == 2
+            assert list(read_characters(storage.run_dir)) == characters
+
+
+# =============================================================================
+# Catalog Tests (CAT001-)
+# =============================================================================
+
+
+class TestCatalog(FeatureTest):
+    """実行横断カタログテスト"""
+
+    def test_catalog_ingest_and_query(self, tmp_path, monkeypatch):
+        """CAT001: 実行ディレクトリの差分取り込み・索引検索・全文検索・エクスポート"""
+        self.feature_id = "CAT001"
+
+        import json as json_
+        import time
+
+        from ollama_hero_gen import Character, Config, LocalStorage, RunCatalog, catalog_main
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+
+        def make_run(characters, fmt="csv"):
+            from dataclasses import replace
+
+            storage = LocalStorage(replace(config, output_format=fmt))
+            for species, role, profile in characters:
+                values = dict.fromkeys(Character.headers(), "x")
+                values.update(name=f"{species}-{role}", species=species, role=role, profile=profile)
+                storage.append_output(Character(**values).to_row())
+            storage.append_metrics({"task": "concept", "status": "ok", "latency": 1.5, "eval_count": 10})
+            storage.append_metrics({"task": "name", "status": "error", "latency": 0.5})
+            storage.close()
+            time.sleep(0.01)  # 実行ディレクトリ名（マイクロ秒）を分ける
+            return storage.run_dir
+
+        make_run(
+            [
+                ("Elf", "Healer. A compassionate soul", "森で薬草を育てる癒し手"),
+                ("Dwarf", "Warrior. A skilled fighter", "炎の鍛冶場で生まれた戦士"),
+            ]
+        )
+        make_run([("elf", "Healer. Mends broken spirits", "炎を恐れる治癒師")], fmt="jsonl")
+
+        catalog = RunCatalog(tmp_path / "catalog.sqlite")
+        assert catalog.ingest(tmp_path) == {"ingested": 2, "skipped": 0, "failed": 0, "characters": 3}
+        # 変更のない実行は読み飛ばす
+        assert catalog.ingest(tmp_path) == {"ingested": 0, "skipped": 2, "failed": 0, "characters": 0}
+
+        healers = list(catalog.query(species="Elf", role="Healer"))
+        assert [r["name"] for r in healers] == ["Elf-Healer. A compassionate soul", "elf-Healer. Mends broken spirits"]
+        assert healers[0]["model"] == "gpt-oss:20b"
+        assert [r["species"] for r in catalog.query(text="炎")] == ["Dwarf", "elf"]
+        assert [r["species"] for r in catalog.query(text="鍛冶場で")] == ["Dwarf"]
+        assert list(catalog.query(species="Elf", since="2999-01")) == []
+        (run,) = [r for r in catalog.runs() if r["characters"] == 2]
+        assert (run["calls"], run["errors"], run["inference_seconds"], run["eval_tokens"]) == (2, 1, 2.0, 10)
+
+        # 新しい実行だけを取り込む。書き込み中の実行のジャーナルは変更せず、壊れた実行は飛ばして続ける
+        live = make_run([("Angel", "Scholar. A seeker", "古文書を読む天使")])
+        with open(live / "journal.jsonl", "a", encoding="utf-8") as f:
+            f.write('{"type": "start", "ind')
+        journal_bytes = (live / "journal.jsonl").read_bytes()
+        broken = make_run([("Demon", "Noble. A schemer", "壊れた実行")])
+        (broken / "journal.jsonl").write_text("not json\n", encoding="utf-8")
+        with open(broken / "output.csv", "a", encoding="utf-8") as f:
+            f.write(",".join(["extra"] * 20) + "\n")  # ヘッダーより列が多い行
+        counts = catalog.ingest(tmp_path)
+        assert (counts["ingested"], counts["failed"]) == (1, 1)
+        assert (live / "journal.jsonl").read_bytes() == journal_bytes
+        assert [r["species"] for r in catalog.query(text="古文書")] == ["Angel"]
+        catalog.close()
+
+        monkeypatch.setenv("DATA_DIR", str(tmp_path))
+        export = tmp_path / "healers.jsonl"
+        assert catalog_main(["query", "--role", "healer", "--export", str(export)]) == 0
+        rows = [json_.loads(line) for line in export.read_text(encoding="utf-8").splitlines()]
+        assert len(rows) == 2
+        assert all(row["role"].startswith("Healer") for row in rows)
+
+
+# =============================================================================
+# Adaptive Concurrency Tests (ADP001-)
+# =============================================================================
+
+
+class TestAdaptiveConcurrency(FeatureTest):
+    """同時推論数の自動調整テスト"""
+
+    def test_adaptive_limiter(self, tmp_path):
+        """ADP001: AIMDで上限を増減し、サーバーの並列スロット付近に落ち着く"""
+        self.feature_id = "ADP001"
+
+        import asyncio
+
+        import httpx
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import AdaptiveLimiter, AsyncOllamaInference, Config, MetricsRecorder
+
+        # タイムアウトで半減、スループットが保てている間は1ずつ増やす
+        limiter = AdaptiveLimiter(initial=8, maximum=16)
+        limiter.observe("name", 1.0, error=httpx.ReadTimeout("timeout"))
+        assert limiter.limit == 4
+        limiter.observe("name", 1.0, error=ValueError("parse"))
+        assert limiter.limit == 4
+        for _ in range(4):
+            limiter.observe("name", 0.1, eval_count=16)
+        assert limiter.limit == 5
+        # レイテンシがタスク別の最速値の数倍に伸びたら待ち行列とみなして下げる
+        for _ in range(5):
+            limiter.observe("name", 0.5, eval_count=16)
+        assert limiter.limit == 4
+        assert (limiter.increases, limiter.decreases, limiter.peak) == (1, 2, 8)
+        # サーバーの処理時間が報告されれば、処理時間自体のばらつきは待ち行列とみなさない
+        for i in range(8):
+            latency = 0.02 if i == 0 else 0.5
+            limiter.observe("name", latency, eval_count=16, service_time=latency * 0.95)
+        assert (limiter.limit, limiter.decreases) == (5, 2)
+
+        with FakeOllamaServer(latency=0.05, parallel=4) as server:
+            config = Config(
+                model="gpt-oss:20b",
+                host=server.url,
+                data_dir=str(tmp_path),
+                adaptive=True,
+                max_in_flight=16,
+            )
+
+            records = []
+
+            async def scenario():
+                llm = AsyncOllamaInference(config)
+                llm.metrics = MetricsRecorder(on_record=records.append)
+                try:
+                    await asyncio.gather(*(llm.generate(f"hello {i}", task="name") for i in range(160)))
+                finally:
+                    await llm.close()
+                return llm
+
+            llm = asyncio.run(scenario())
+
+        assert 1 < llm.limiter.peak <= 16
+        assert 2 <= llm.limiter.limit <= 10
+        assert llm.limiter.in_flight == 0
+        assert server.max_in_flight <= 4
+        assert len(records) == 160
+        assert all(record["limit"] >= 1 for record in records)
+
+        # レイテンシがばらついても、上限はサーバーの並列スロット数（8）まで上がる
+        with FakeOllamaServer(latency=0.05, latency_sigma=0.5, parallel=8, seed=1) as server:
+            config = Config(
+                model="gpt-oss:20b",
+                host=server.url,
+                data_dir=str(tmp_path / "variance"),
+                adaptive=True,
+                max_in_flight=32,
+            )
+
+            async def variance():
+                llm = AsyncOllamaInference(config)
+                try:
+                    await asyncio.gather(*(llm.generate(f"hello {i}", task="name") for i in range(240)))
+                finally:
+                    await llm.close()
+                return llm
+
+            llm = asyncio.run(variance())
+
+        assert llm.limiter.peak >= 8
+        assert llm.limiter.limit >= 3
+
+
+# =============================================================================
+# Priority Scheduling Tests (PRI001-)
+# =============================================================================
+
+
+class TestPriorityScheduling(FeatureTest):
+    """優先度付きスケジューリングテスト"""
+
+    def test_priority_scheduling(self, tmp_path):
+        """PRI001: キャラクターの確定を優先し、シード進化は空き枠で実行・期限切れで破棄"""
+        self.feature_id = "PRI001"
+
+        import asyncio
+        import contextlib
+        import io
+        import json as json_
+        import time
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import (
+            PRIORITY_BACKGROUND,
+            PRIORITY_CRITICAL,
+            Config,
+            PriorityGate,
+            TaskDropped,
+            read_characters,
+            run_generation,
+        )
+
+        async def gate_scenario():
+            gate = PriorityGate(1)
+            order = []
+
+            async def request(name, priority, deadline=None):
+                try:
+                    async with gate.slot(priority, deadline):
+                        order.append(name)
+                        await asyncio.sleep(0.01)
+                except TaskDropped:
+                    order.append(f"{name}:dropped")
+
+            first = asyncio.ensure_future(request("first", PRIORITY_CRITICAL))
+            await asyncio.sleep(0)
+            background = asyncio.ensure_future(request("background", PRIORITY_BACKGROUND))
+            expired = asyncio.ensure_future(
+                request("expired", PRIORITY_BACKGROUND, deadline=time.monotonic() + 0.005)
+            )
+            await asyncio.sleep(0)
+            critical = asyncio.ensure_future(request("critical", PRIORITY_CRITICAL))
+            await asyncio.gather(first, background, expired, critical)
+            return gate, order
+
+        gate, order = asyncio.run(gate_scenario())
+        # 後から来た高優先度が先に枠を得て、期限までに始まらなかったものは破棄
+        assert order == ["first", "expired:dropped", "critical", "background"]
+        assert (gate.in_flight, gate.dropped) == (0, 1)
+
+        def run(data_dir, **options):
+            with FakeOllamaServer(latency=0.03, parallel=2) as server:
+                config = Config(
+                    model="gpt-oss:20b",
+                    host=server.url,
+                    data_dir=str(data_dir),
+                    num_iterations=8,
+                    concurrency=2,
+                    priority=True,
+                    **options,
+                )
+                with contextlib.redirect_stdout(io.StringIO()):
+                    engine = asyncio.run(run_generation(config))
+            run_dir = engine.storage.run_dir
+            metrics = [json_.loads(line) for line in open(run_dir / "metrics.jsonl", encoding="utf-8")]
+            journal = [json_.loads(line) for line in open(run_dir / "journal.jsonl", encoding="utf-8")]
+            return engine, [m for m in metrics if m["task"] != "preload"], journal
+
+        background = {"new_ability", "new_wants", "new_role"}
+        engine, metrics, journal = run(tmp_path / "deferred")
+        assert len(list(read_characters(engine.storage.run_dir))) == 8
+        assert engine.seeds_dropped == 0
+        # シード進化は後回しにされ、確定済みキャラクターの番号順に追加される
+        tasks = [m["task"] for m in metrics]
+        half = len(tasks) // 2
+        assert sum(t in background for t in tasks[:half]) < sum(t in background for t in tasks[half:])
+        assert tasks[-1] in background
+        seeds = [r for r in journal if r["type"] == "seeds"]
+        assert [r["index"] for r in seeds] == list(range(8))
+        assert all(len(r["seeds"]) == 3 for r in seeds)
+
+        engine, metrics, journal = run(tmp_path / "deadline", seed_deadline=0.01)
+        assert len(list(read_characters(engine.storage.run_dir))) == 8
+        assert engine.seeds_dropped > 0
+        assert sum(m["status"] == "dropped" for m in metrics) == engine.seeds_dropped
+
+
+# =============================================================================
+# Output Validation Tests (VAL001-)
+# =============================================================================
+
+
+class TestOutputValidation(FeatureTest):
+    """出力検証・部分再生成テスト"""
+
+    def test_validation_regenerates_failing_fields(self, tmp_path):
+        """VAL001: ルール違反のフィールドだけを上限回数まで再生成し、ルール別に数える"""
+        self.feature_id = "VAL001"
+
+        import asyncio
+        import json as json_
+        from dataclasses import replace
+        from unittest.mock import AsyncMock
+
+        from ollama_hero_gen import AsyncOllamaInference, Config, GenerationEngine, LocalStorage, Prompts
+
+        assert Prompts.validate("name", "Kain Astralion") == []
+        assert Prompts.validate("name", "Kain\n(A hero)") == ["single_line", "short"]
+        assert Prompts.validate("profile", "He is brave.") == ["japanese"]
+        assert Prompts.validate("catchphrase", "「俺は負けない！」") == []
+        assert Prompts.validate("new_wants", "I want to fly. And swim.") == ["one_sentence"]
+
+        instructions = {task: template[0] for task, template in Prompts._DERIVED_TEMPLATES.items()}
+        seeds = {
+            "new_ability": "Can bend light.",
+            "new_wants": "I want to see the sea.",
+            "new_role": "Sailor. Navigates storms.",
+        }
+        responses = {
+            "name": ["Kain\n(A hero)", "Kain"],
+            "profile": ["He is brave."] * 3,
+            "catchphrase": ["君を守る！", "私は戦う。そして勝つ。", "俺は負けない！"],
+            **{task: [value] for task, value in seeds.items()},
+        }
+        sent = []
+
+        async def fake_chat(model, messages, options, format=None, keep_alive=None):
+            prompt = messages[-1]["content"]
+            sent.append((prompt, format))
+            if format is not None:
+                if "name" in format["properties"]:
+                    sheet = {"name": "Kain\nthe brave", "profile": "彼は剣士です。", "catchphrase": "俺は進む。"}
+                else:
+                    sheet = seeds
+                return {"message": {"content": json_.dumps(sheet, ensure_ascii=False)}}
+            for task, instruction in instructions.items():
+                if prompt.startswith(instruction):
+                    return {"message": {"content": responses[task].pop(0)}}
+            return {"message": {"content": "A lone swordsman."}}
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            validate=True,
+            validation_attempts=2,
+        )
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(side_effect=fake_chat)
+        engine = GenerationEngine(config, llm=llm, storage=LocalStorage(config))
+        character, _ = asyncio.run(engine.generate_character(0))
+
+        # concept 1 + name 2 + profile 3（上限） + catchphrase 3 + シード3
+        assert llm.client.chat.await_count == 12
+        assert character.name == "Kain"
+        assert character.catchphrase == "俺は負けない！"
+        assert character.profile == "He is brave."  # 上限まで直らなければ最後の応答を使う
+        assert llm.rule_failures == {
+            "name.single_line": 1,
+            "name.short": 1,
+            "profile.japanese": 3,
+            "catchphrase.first_person": 1,
+            "catchphrase.one_sentence": 1,
+        }
+        assert (llm.regenerations, llm.unresolved) == (5, 1)
+
+        # 構造化出力では違反したフィールドだけを単独のプロンプトで作り直す
+        responses["name"] = ["Kain"]
+        sent.clear()
+        config = replace(config, structured=True)
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(side_effect=fake_chat)
+        engine = GenerationEngine(config, llm=llm, storage=LocalStorage(config))
+        character, _ = asyncio.run(engine.generate_character(0))
+
+        assert (character.name, character.profile, character.catchphrase) == ("Kain", "彼は剣士です。", "俺は進む。")
+        repairs = [prompt for prompt, fmt in sent if fmt is None and prompt.startswith(instructions["name"])]
+        assert repairs == [Prompts.name("A lone swordsman.")]
+        assert llm.rule_failures == {"name.single_line": 1}
+
+
+# =============================================================================
+# Retry Policy Tests (RTY001-)
+# =============================================================================
+
+
+class TestRetryPolicy(FeatureTest):
+    """リトライ方針・時間予算・サーキットブレーカーテスト"""
+
+    def test_retry_policy_and_circuit_breaker(self, tmp_path):
+        """RTY001: エラー種別ごとのリトライ、期限切れの打ち切り、障害中の一時停止"""
+        self.feature_id = "RTY001"
+
+        import asyncio
+        import contextlib
+        import io
+        import json as json_
+        import time
+        from dataclasses import replace
+        from unittest.mock import AsyncMock
+
+        import httpx
+        import ollama
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import (
+            AsyncOllamaInference,
+            Config,
+            DeadlineExceeded,
+            RetryPolicy,
+            read_characters,
+            run_generation,
+        )
+
+        policy = RetryPolicy(base=1.0, cap=4.0)
+        assert policy.classify(httpx.ReadTimeout("slow")) == "timeout"
+        assert policy.classify(ConnectionError("refused")) == "connection"
+        assert policy.classify(httpx.ConnectTimeout("syn")) == "connection"
+        assert policy.classify(ollama.ResponseError("busy", 503)) == "server"
+        assert policy.classify(ollama.ResponseError("model not found", 404)) == "client"
+        assert policy.classify(ValueError("bad json")) == "other"
+        assert all(0 <= policy.delay(n) <= min(4.0, 2**n) for n in range(8))
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+
+        def attempts(error) -> int:
+            llm = AsyncOllamaInference(config)
+            llm.retry_policy = RetryPolicy(base=0.001)
+            llm.client.chat = AsyncMock(side_effect=error)
+            with pytest.raises(type(error)):
+                asyncio.run(llm.generate("hello"))
+            return llm.client.chat.await_count
+
+        assert attempts(ollama.ResponseError("model not found", 404)) == 1  # 4xx は再送しない
+        assert attempts(httpx.ReadTimeout("stuck")) == 2  # タイムアウトは1回だけ再送
+        assert attempts(ollama.ResponseError("busy", 503)) == 3
+
+        with FakeOllamaServer(latency=0.05) as server:
+            config = replace(config, host=server.url, breaker_threshold=2, breaker_reset=0.05)
+
+            async def outage():
+                llm = AsyncOllamaInference(config)
+                llm.retry_policy = RetryPolicy(base=0.01)
+                try:
+                    # 期限を超える応答は待たない
+                    started = time.monotonic()
+                    with pytest.raises(DeadlineExceeded):
+                        server.latency = 0.5
+                        await llm.generate("slow", deadline=time.monotonic() + 0.1)
+                    assert time.monotonic() - started < 0.4
+                    server.latency = 0.05
+
+                    # 停止中はブレーカーが開いて送信を止め、復旧後に再開する
+                    server.stop()
+                    pending = asyncio.gather(*(llm.generate(f"p{i}") for i in range(4)))
+                    await asyncio.sleep(0.3)
+                    assert llm.breaker.is_open
+                    server.start()
+                    return llm, await pending
+                finally:
+                    await llm.close()
+
+            llm, results = asyncio.run(outage())
+            assert results == ["Fake response"] * 4
+            assert llm.breaker.trips == 1
+            assert llm.breaker.paused_time > 0.1
+
+            # 復旧しないまま max_outage を超えたら、期限がなくても待ちをやめて ConnectionError
+            async def stays_down():
+                llm = AsyncOllamaInference(replace(config, breaker_max_outage=0.3))
+                llm.retry_policy = RetryPolicy(base=0.01)
+                try:
+                    server.stop()
+                    started = time.monotonic()
+                    results = await asyncio.gather(
+                        *(llm.generate(f"p{i}") for i in range(3)), return_exceptions=True
+                    )
+                    elapsed = time.monotonic() - started
+                    with pytest.raises(ConnectionError):
+                        await llm.generate("late")
+                    return results, elapsed
+                finally:
+                    await llm.close()
+                    server.start()
+
+            results, elapsed = asyncio.run(stays_down())
+            assert all(isinstance(r, ConnectionError) for r in results)
+            assert elapsed < 2.0
+
+        with FakeOllamaServer(latency=0.02) as server:
+            config = replace(config, host=server.url, num_iterations=40, concurrency=2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                # キャラクター単位の予算を超えたものは飛ばす
+                engine = asyncio.run(run_generation(replace(config, num_iterations=2, character_deadline=0.01)))
+                assert (engine.skipped, engine.committed) == (2, 2)
+                assert list(read_characters(engine.storage.run_dir)) == []
+
+                # 実行全体の予算を超えたら打ち切り、--resume で続きから完走する
+                engine = asyncio.run(run_generation(replace(config, run_deadline=0.3)))
+                run_dir = engine.storage.run_dir
+                assert engine.deadline_reached
+                assert 0 < engine.committed < 40
+                engine = asyncio.run(run_generation(replace(config, resume=str(run_dir))))
+            assert not engine.deadline_reached
+            assert len(list(read_characters(run_dir))) == 40
+            journal = [json_.loads(line) for line in open(run_dir / "journal.jsonl", encoding="utf-8")]
+            assert sorted(r["index"] for r in journal if r["type"] == "character") == list(range(40))
+
+
+# =============================================================================
+# Hedged Request Tests (HED001-)
+# =============================================================================
+
+
+class TestHedging(FeatureTest):
+    """ヘッジリクエストテスト"""
+
+    def test_hedged_requests(self, tmp_path):
+        """HED001: p95 を超えた呼び出しを重複送信し、先に返った方を使って遅い方をキャンセル"""
+        self.feature_id = "HED001"
+
+        import asyncio
+        import time
+        from unittest.mock import AsyncMock
+
+        from ollama_hero_gen import AsyncOllamaInference, Config, MetricsRecorder
+
+        sent = []
+        cancelled = []
+
+        async def fake_chat(model, messages, options, keep_alive=None):
+            # 25件に1件だけ極端に遅い（長い推論・モデルの入れ替え相当）
+            slow = len(sent) % 25 == 10
+            sent.append(messages[-1]["content"])
+            try:
+                await asyncio.sleep(1.0 if slow else 0.005)
+            except asyncio.CancelledError:
+                cancelled.append(slow)
+                raise
+            return {"message": {"content": "ok"}}
+
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            hedge=True,
+        )
+        llm = AsyncOllamaInference(config)
+        llm.client.chat = AsyncMock(side_effect=fake_chat)
+        records = []
+        llm.metrics = MetricsRecorder(on_record=records.append)
+
+        async def scenario():
+            for i in range(100):
+                assert await llm.generate(f"p{i}", task="name") == "ok"
+
+        started = time.perf_counter()
+        asyncio.run(scenario())
+        elapsed = time.perf_counter() - started
+
+        stats = llm.hedger.stats()
+        # サンプル集め（最初の20件）の後の遅い呼び出しはヘッジが勝ち、元のリクエストはキャンセルされる
+        assert stats["won"] >= 3
+        assert stats["fired"] <= 0.1 * stats["calls"]
+        assert stats["saved"] > 0.5  # サンプル集め中の遅い呼び出し（1秒）を含む p95 超えの平均との差から推定
+        assert cancelled.count(True) >= 3
+        assert elapsed < 2.5  # ヘッジなしなら遅い呼び出しだけで約4秒
+        assert sum(bool(r.get("hedged")) for r in records) == stats["won"]
+        assert len(sent) == 100 + stats["fired"]
+
+
+class TestPromptProfiler(FeatureTest):
+    """プロンプトトークン計測テスト"""
+
+    def test_prompt_token_budget(self, tmp_path, monkeypatch, capsys):
+        """TOK001: テンプレート別・キャラクター別のプロンプトトークン数と予算超過の検出"""
+        self.feature_id = "TOK001"
+
+        import json as json_
+        from dataclasses import replace
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import PROMPT_BUDGET_FILE, Config, PromptProfiler, Prompts, prompts_main
+
+        monkeypatch.setenv("DATA_DIR", str(tmp_path))
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path))
+
+        profile = PromptProfiler(config).profile()
+        templates = profile["templates"]
+        assert profile["counter"] == "estimate"
+        assert set(templates) >= {"concept", "name", "character_sheet", "session.new_role"}
+        # 先に送ったリクエストと共通のシステムプロンプト・設定メッセージは数えない
+        assert templates["session.profile"] < templates["session.name"] < templates["name"] + 10
+        assert profile["per_character"]["standard"] == sum(
+            templates[t] for t in ("concept", "name", "profile", "catchphrase", "new_ability", "new_wants", "new_role")
+        )
+        assert profile["per_character"]["session"] < profile["per_character"]["standard"]
+
+        # 同梱の予算に収まっている（テンプレートを伸ばしたらここで気付く）
+        assert prompts_main([]) == 0
+        assert PROMPT_BUDGET_FILE.exists()
+
+        # 予算の保存と超過の検出
+        budget = tmp_path / "budget.json"
+        assert prompts_main(["--budget", str(budget), "--save-budget", "--headroom", "0"]) == 0
+        assert prompts_main(["--budget", str(budget)]) == 0
+        monkeypatch.setitem(
+            Prompts._DERIVED_TEMPLATES,
+            "name",
+            (Prompts._DERIVED_TEMPLATES["name"][0] + " 追加の長い説明文。" * 5,) + Prompts._DERIVED_TEMPLATES["name"][1:],
+        )
+        capsys.readouterr()
+        assert prompts_main(["--budget", str(budget)]) == 1
+        out = capsys.readouterr().out
+        assert "name" in out and "OVER" in out
+        # 通常・セッションの name テンプレートと、それを含む生成モードだけが超過する
+        over = PromptProfiler.over_budget(PromptProfiler(config).profile(), json_.loads(budget.read_text()))
+        assert {name for _, name, _, _ in over} == {"name", "session.name", "standard", "session"}
+
+        # サーバー計測は prompt_eval_count を使い、推定の予算とは比較しない
+        with FakeOllamaServer() as server:
+            monkeypatch.setenv("OLLAMA_HOST", server.url)
+            profiler = PromptProfiler(replace(config, host=server.url), server=True)
+            measured = profiler.profile()
+            assert measured["counter"] == "ollama:gpt-oss:20b"
+            assert server.chat_requests == len(measured["templates"])
+            assert all(r["options"] == {"num_predict": 1} for r in server.requests)
+            # 疑似サーバーは 文字数 // 4 を prompt_eval_count として返す
+            chars = sum(len(m["content"]) for m in server.requests[0]["messages"])
+            assert measured["templates"]["concept"] == chars // 4
+            assert prompts_main(["--server", "--budget", str(budget)]) == 2
+
+
+class TestBackends(FeatureTest):
+    """推論バックエンドテスト"""
+
+    def test_inference_backends(self, tmp_path):
+        """BKD001: 設定で選んだバックエンド（Ollama / OpenAI互換 / 疑似）で同じパイプラインを実行"""
+        self.feature_id = "BKD001"
+
+        import asyncio
+        import contextlib
+        import io
+        from dataclasses import replace
+
+        import httpx
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import (
+            Config,
+            FakeBackend,
+            OpenAICompatibleBackend,
+            RetryPolicy,
+            create_backend,
+            read_characters,
+            run_generation,
+        )
+
+        config = Config(model="gpt-oss:20b", host="http://localhost:11434", data_dir=str(tmp_path), num_iterations=3)
+        assert type(create_backend(config, config.host)).__module__ == "ollama._client"
+        with pytest.raises(ValueError, match="Unknown inference backend"):
+            create_backend(replace(config, backend="tgi"), config.host)
+
+        def run(config):
+            with contextlib.redirect_stdout(io.StringIO()):
+                engine = asyncio.run(run_generation(config))
+            return list(read_characters(engine.storage.run_dir))
+
+        # OpenAI互換サーバー: 生成オプション・スキーマを変換し、usage をトークン数として扱う
+        with FakeOllamaServer() as server:
+            openai = replace(config, backend="openai", host=server.url + "/v1", data_dir=str(tmp_path / "openai"))
+            characters = run(replace(openai, structured=True))
+            assert len(characters) == 3
+            assert characters[0].name == "Fake name"
+            # 疑似サーバーは response_format のスキーマを format として記録する
+            sheet = next(r for r in server.requests if r["format"] and "name" in r["format"]["properties"])
+            assert sheet["response_format"]["type"] == "json_schema"
+            assert sheet["max_tokens"] == 2048  # character_sheet の num_predict
+            assert all("keep_alive" not in r and "options" not in r for r in server.requests)
+            assert all("max_tokens" in r for r in server.requests)
+
+            async def chat():
+                client = create_backend(openai, openai.host)
+                assert isinstance(client, OpenAICompatibleBackend)
+                try:
+                    models = await client.list()
+                    response = await client.chat(
+                        "gpt-oss:20b", [{"role": "user", "content": "x" * 40}], {"num_predict": 8, "num_ctx": 4096}
+                    )
+                    with pytest.raises(RuntimeError, match="pull"):
+                        await client.pull("other")
+                    return models, response
+                finally:
+                    await client.close()
+
+            models, response = asyncio.run(chat())
+            assert models["models"][0]["name"] == "gpt-oss:20b"
+            assert (response["prompt_eval_count"], response["eval_count"]) == (10, 16)
+            assert server.requests[-1]["max_tokens"] == 8
+            assert "num_ctx" not in server.requests[-1]
+
+        # HTTPエラーは既存のリトライ分類にそのまま乗る
+        error = httpx.HTTPStatusError("busy", request=httpx.Request("POST", "http://x"), response=httpx.Response(503))
+        assert RetryPolicy.classify(error) == "server"
+
+        # 疑似バックエンド: サーバーなしで動き、同じリクエストには同じ応答
+        fake = replace(config, backend="fake", data_dir=str(tmp_path / "fake"))
+        assert len(run(fake)) == 3
+        backend = FakeBackend("gpt-oss:20b")
+        messages = [{"role": "user", "content": "hello"}]
+
+        async def twice(options):
+            return [(await backend.chat("gpt-oss:20b", messages, options))["message"]["content"] for _ in range(2)]
+
+        first, second = asyncio.run(twice({"seed": 1}))
+        assert first == second
+        assert asyncio.run(twice({"seed": 2}))[0] != first
+
+
+class TestBatching(FeatureTest):
+    """マイクロバッチングテスト"""
+
+    def test_request_batching(self, tmp_path, monkeypatch):
+        """BAT001: 複数キャラクターの同じタスクのリクエストを1回のバッチで送り、応答を呼び出し元へ振り分け"""
+        self.feature_id = "BAT001"
+
+        import asyncio
+        import contextlib
+        import io
+        from dataclasses import replace
+
+        from fake_ollama import FakeOllamaServer
+        from ollama_hero_gen import (
+            INFERENCE_BACKENDS,
+            AsyncOllamaInference,
+            Config,
+            FakeBackend,
+            RequestBatcher,
+            read_characters,
+            run_generation,
+        )
+
+        sent = []
+
+        async def send(requests):
+            sent.append([r["messages"] for r in requests])
+            await asyncio.sleep(0.01)
+            return [ValueError("bad") if r["messages"] == "bad" else r["messages"].upper() for r in requests]
+
+        async def scenario():
+            batcher = RequestBatcher(send, max_size=4, window=0.05)
+
+            def submit(messages, task="name"):
+                return asyncio.ensure_future(batcher.submit({"messages": messages, "options": {"task": task}}))
+
+            names = [submit(f"n{i}") for i in range(9)]
+            roles = [submit("r0", "role"), submit("bad", "role")]
+            cancelled = submit("gone", "role")
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            results = await asyncio.gather(*names, *roles, return_exceptions=True)
+            await batcher.close()
+            return batcher, results
+
+        batcher, results = asyncio.run(scenario())
+        assert results[:9] == [f"N{i}" for i in range(9)]
+        assert results[9] == "R0"
+        assert isinstance(results[10], ValueError)  # 失敗した要素だけがエラーになる
+        # 上限（4件）に達したら窓を待たずに送り、キャンセルされた呼び出しは送らない
+        assert sorted(len(batch) for batch in sent) == [1, 2, 4, 4]
+        assert ["r0", "bad"] in sent
+        assert batcher.stats() == {"batches": 4, "requests": 11, "largest": 4, "mean": 2.75}
+
+        # パイプライン全体: 並行するキャラクターの同じタスクがまとめて送られる
+        backends = []
+
+        def fake(config, host):
+            backends.append(FakeBackend(config.model, latency=0.02))
+            return backends[-1]
+
+        monkeypatch.setitem(INFERENCE_BACKENDS, "fake", fake)
+        config = Config(
+            model="gpt-oss:20b",
+            host="http://localhost:11434",
+            data_dir=str(tmp_path),
+            num_iterations=8,
+            concurrency=8,
+            backend="fake",
+            batch_size=8,
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = asyncio.run(run_generation(config))
+        assert len(list(read_characters(engine.storage.run_dir))) == 8
+        (backend,) = backends
+        assert max(backend.batches) > 1
+        assert sum(backend.batches) == engine.llm.batcher.requests
+        assert engine.llm.batcher.batches < 8 * 7  # 1キャラクター7回の推論より少ないリクエスト数
+
+        # OpenAI互換サーバーへは /v1/completions にプロンプトのリストとして送る
+        # （チャットテンプレートは llama.cpp 風の /apply-template、なければ vLLM 風の /tokenize）
+        for endpoint in ("/apply-template", "/tokenize"):
+            with FakeOllamaServer(latency=0.02, template_endpoint=endpoint) as server:
+                openai = replace(
+                    config, backend="openai", host=server.url + "/v1", data_dir=str(tmp_path / endpoint.strip("/"))
+                )
+                for structured in (False, True):
+                    server.batches.clear()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        engine = asyncio.run(run_generation(replace(openai, structured=structured)))
+                    assert len(list(read_characters(engine.storage.run_dir))) == 8
+                    assert max(server.batches) > 1
+                    assert sum(server.batches) == engine.llm.batcher.requests
+
+        # 複数プロンプトを受け付けないバックエンドでは、クライアントを作る前にエラー
+        created = []
+        monkeypatch.setitem(INFERENCE_BACKENDS, "ollama", lambda config, host: created.append(host))
+        with pytest.raises(ValueError, match="not supported by the ollama backend"):
+            AsyncOllamaInference(replace(config, backend="ollama"))
+        assert created == []
+        assert AsyncOllamaInference(replace(config, backend="ollama", batch_size=1)).batcher is None
+
+
 # =============================================================================
 # CLI Runner
 # =============================================================================
@@ -606,6 +2362,34 @@ def update_features_from_results():
         "test_e2e_single_character": "INT001",
         "test_e2e_ten_characters": "INT002",
         "test_e2e_hundred_characters": "INT003",
+        "test_concurrent_engine_ordering": "CON001",
+        "test_concept_fanout_graph": "CON002",
+        "test_seed_pool_cache": "STO001",
+        "test_buffered_writer_flush_policy": "STO002",
+        "test_response_cache_lru": "CCH001",
+        "test_inference_uses_cache": "CCH002",
+        "test_task_option_profiles": "PRF001",
+        "test_structured_generation": "STR001",
+        "test_session_prefix_reuse": "SES001",
+        "test_least_outstanding_routing": "LB001",
+        "test_percentile": "TEL001",
+        "test_metrics_jsonl": "TEL002",
+        "test_bench_smoke": "BEN001",
+        "test_resume_from_journal": "JRN001",
+        "test_preload_and_keep_alive": "WRM001",
+        "test_near_duplicate_seeds_rejected": "DUP001",
+        "test_weighted_sampler": "SMP001",
+        "test_jsonl_shards_and_reader": "OUT001",
+        "test_optional_formats": "OUT002",
+        "test_catalog_ingest_and_query": "CAT001",
+        "test_adaptive_limiter": "ADP001",
+        "test_priority_scheduling": "PRI001",
+        "test_validation_regenerates_failing_fields": "VAL001",
+        "test_retry_policy_and_circuit_breaker": "RTY001",
+        "test_hedged_requests": "HED001",
+        "test_prompt_token_budget": "TOK001",
+        "test_inference_backends": "BKD001",
+        "test_request_batching": "BAT001",
     }
 
     output = result.stdout + result.stderr
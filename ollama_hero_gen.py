@@ -6,6 +6,10 @@ Usage:
     python ollama_hero_gen.py --iterations 10
     python ollama_hero_gen.py --model gpt-oss:20b-q4_K_M  # 量子化版
     python ollama_hero_gen.py --model gpt-oss:120b          # 高性能版
+    python ollama_hero_gen.py -n 1000 --concurrency 4       # 4キャラ並行生成
+    python ollama_hero_gen.py --resume data/run_20260101_120000_000000  # 中断した実行を再開
+    python ollama_hero_gen.py catalog ingest                # 全実行をカタログに取り込む
+    python ollama_hero_gen.py catalog query --species Elf --role Healer --since 2026-10
 
 Available models:
     gpt-oss:20b          標準（デフォルト）: 12GB VRAM、バランス重視
@@ -15,15 +19,35 @@ Available models:
 
 from __future__ import annotations
 
+import abc
+import asyncio
+import array
+import atexit
+import collections
+import contextlib
 import csv
+import functools
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
 import os
+import queue
 import random
+import re
+import sqlite3
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Protocol
 
+import httpx
 import ollama
 from dotenv import load_dotenv
 
@@ -33,6 +57,10 @@ from dotenv import load_dotenv
 # =============================================================================
 
 
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
 @dataclass(frozen=True)
 class Config:
     """不変の設定オブジェクト"""
@@ -41,6 +69,64 @@ class Config:
     host: str
     data_dir: str
     num_iterations: int = 100
+    concurrency: int = 1
+    # 同時推論数をAIMDで自動調整する（concurrency は初期値、max_in_flight は上限）
+    adaptive: bool = False
+    max_in_flight: int = 32
+    # シード進化をバックグラウンドの低優先度キューへ回す（concurrency はサーバー全体の並列スロット数）
+    priority: bool = False
+    # バックグラウンドの推論がこの秒数内に開始できなければ破棄（0 = 破棄しない）
+    seed_deadline: float = 0.0
+    # 出力を Prompts.RULES で検証し、違反したフィールドだけを再生成（最大 validation_attempts 回）
+    validate: bool = False
+    validation_attempts: int = 2
+    # 1リクエストのタイムアウトと、キャラクター単位・実行全体の時間予算（秒、0 = 無制限）
+    request_timeout: float = 120.0
+    character_deadline: float = 0.0
+    run_deadline: float = 0.0
+    # 連続 breaker_threshold 回の障害でリクエストを止め、breaker_reset 秒ごとに復旧を確認
+    breaker_threshold: int = 5
+    breaker_reset: float = 15.0
+    # ブレーカーが開いたまま復旧しない場合に諦めるまでの秒数（0 = 待ち続ける）
+    breaker_max_outage: float = 300.0
+    # タスク別 p95 を超えた呼び出しを別ホスト・スロットへ重複送信（全呼び出しの hedge_max_rate まで）
+    hedge: bool = False
+    hedge_max_rate: float = 0.1
+    # 推論バックエンド（ollama / openai / fake）と、OpenAI互換サーバーのAPIキー（不要なら空）
+    backend: str = "ollama"
+    api_key: str = ""
+    # 同じタスクのリクエストを batch_window 秒・最大 batch_size 件まで集めて1回で送る（1 = 無効）
+    batch_size: int = 1
+    batch_window: float = 0.02
+    flush_rows: int = 20
+    flush_interval: float = 1.0
+    fsync: bool = False
+    # 出力形式（csv / jsonl / jsonl.gz / jsonl.zst / parquet）とシャード分割（0 で分割しない）
+    output_format: str = "csv"
+    shard_rows: int = 0
+    shard_mb: float = 0.0
+    cache: bool = False
+    cache_max_mb: int = 512
+    # 既存シードとの近似重複（定型の書き出しを除いた内容語のJaccard係数がこの値以上）は追加しない。0 で無効
+    seed_dedup_threshold: float = 0.5
+    # シード抽選の重み 1 / (1 + 使用回数) ** decay。0 で一様抽選
+    seed_usage_decay: float = 1.0
+    structured: bool = False
+    session: bool = False
+    health_check_interval: float = 10.0
+    # 実行中はモデルをアンロードさせない（各リクエストの keep_alive。Ollamaの既定は5分）
+    keep_alive: str = "30m"
+    # 起動時に SYSTEM_PROMPT を送ってプロンプトキャッシュを温める
+    warmup: bool = False
+    # 再開する既存の実行ディレクトリ（None なら新規の run_* を作成）
+    resume: Optional[str] = None
+    # タスク名 → 生成オプションの上書き（例: {"name": {"num_predict": 64}}）
+    task_options: dict = field(default_factory=dict)
+
+    @property
+    def hosts(self) -> list:
+        """OLLAMA_HOST のカンマ区切りリスト"""
+        return [h.strip() for h in self.host.split(",") if h.strip()]
 
     @classmethod
     def from_env(cls) -> "Config":
@@ -49,7 +135,1261 @@ class Config:
             model=os.getenv("OLLAMA_MODEL", "gpt-oss:20b"),
             host=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
             data_dir=os.getenv("DATA_DIR", "./data"),
+            concurrency=int(os.getenv("CONCURRENCY", "1")),
+            adaptive=_env_flag("ADAPTIVE_CONCURRENCY"),
+            max_in_flight=int(os.getenv("MAX_IN_FLIGHT", "32")),
+            priority=_env_flag("PRIORITY_SCHEDULING"),
+            seed_deadline=float(os.getenv("SEED_DEADLINE", "0")),
+            validate=_env_flag("VALIDATE_OUTPUT"),
+            validation_attempts=int(os.getenv("VALIDATION_ATTEMPTS", "2")),
+            request_timeout=float(os.getenv("REQUEST_TIMEOUT", "120")),
+            character_deadline=float(os.getenv("CHARACTER_DEADLINE", "0")),
+            run_deadline=float(os.getenv("RUN_DEADLINE", "0")),
+            breaker_threshold=int(os.getenv("BREAKER_THRESHOLD", "5")),
+            breaker_reset=float(os.getenv("BREAKER_RESET", "15")),
+            breaker_max_outage=float(os.getenv("BREAKER_MAX_OUTAGE", "300")),
+            hedge=_env_flag("HEDGE_REQUESTS"),
+            hedge_max_rate=float(os.getenv("HEDGE_MAX_RATE", "0.1")),
+            backend=os.getenv("INFERENCE_BACKEND", "ollama"),
+            api_key=os.getenv("OPENAI_API_KEY", ""),
+            batch_size=int(os.getenv("BATCH_SIZE", "1")),
+            batch_window=float(os.getenv("BATCH_WINDOW", "0.02")),
+            flush_rows=int(os.getenv("WRITE_FLUSH_ROWS", "20")),
+            flush_interval=float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0")),
+            fsync=_env_flag("WRITE_FSYNC"),
+            output_format=os.getenv("OUTPUT_FORMAT", "csv"),
+            shard_rows=int(os.getenv("OUTPUT_SHARD_ROWS", "0")),
+            shard_mb=float(os.getenv("OUTPUT_SHARD_MB", "0")),
+            cache=_env_flag("RESPONSE_CACHE"),
+            cache_max_mb=int(os.getenv("RESPONSE_CACHE_MAX_MB", "512")),
+            seed_dedup_threshold=float(os.getenv("SEED_DEDUP_THRESHOLD", "0.5")),
+            seed_usage_decay=float(os.getenv("SEED_USAGE_DECAY", "1.0")),
+            structured=_env_flag("STRUCTURED_OUTPUT"),
+            session=_env_flag("SESSION_PREFIX"),
+            health_check_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+            warmup=_env_flag("WARMUP"),
+            task_options=json.loads(os.getenv("TASK_OPTIONS") or "{}"),
+        )
+
+
+# =============================================================================
+# Generation Profiles
+# =============================================================================
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """推論タスクごとの生成オプション
+
+    num_ctx は None ならサーバー既定値。Ollamaは num_ctx が変わるとモデルを
+    再ロードするため、タスク間で異なる値を混在させないこと。
+    """
+
+    num_predict: int = 2048
+    temperature: float = 0.8
+    stop: tuple = ()
+    num_ctx: Optional[int] = None
+
+    def to_options(self) -> dict:
+        options = {
+            "num_predict": self.num_predict,
+            "temperature": self.temperature,
+        }
+        if self.stop:
+            options["stop"] = list(self.stop)
+        if self.num_ctx is not None:
+            options["num_ctx"] = self.num_ctx
+        return options
+
+
+# 既定のタスク別プロファイル。gpt-oss は推論過程（thinking）も num_predict を
+# 消費し stop も適用されるため、短いタスクでも上限には余裕を持たせ、
+# 改行stopは既定では付けない（TASK_OPTIONS で有効化できる）。
+DEFAULT_PROFILES = {
+    "default": GenerationProfile(),
+    "concept": GenerationProfile(num_predict=1536),
+    "name": GenerationProfile(num_predict=512),
+    "profile": GenerationProfile(num_predict=1536),
+    "catchphrase": GenerationProfile(num_predict=512),
+    "new_ability": GenerationProfile(num_predict=768),
+    "new_wants": GenerationProfile(num_predict=768),
+    "new_role": GenerationProfile(num_predict=768),
+    # 構造化出力モード（複数フィールドを1回で生成）
+    "character_sheet": GenerationProfile(num_predict=2048),
+    "counterpart_seeds": GenerationProfile(num_predict=1536),
+}
+
+
+def resolve_profiles(task_options: dict) -> dict:
+    """既定プロファイルに上書き設定を適用する
+
+    task_options のキーはタスク名、"*" は全タスク共通。値は GenerationProfile の
+    フィールド名 → 値 の辞書。
+    """
+    common = task_options.get("*", {})
+    unknown = set(task_options) - set(DEFAULT_PROFILES) - {"*"}
+    if unknown:
+        raise ValueError(f"Unknown task in task options: {sorted(unknown)}")
+
+    profiles = {}
+    for task, profile in DEFAULT_PROFILES.items():
+        override = {**common, **task_options.get(task, {})}
+        if "stop" in override:
+            override["stop"] = tuple(override["stop"])
+        try:
+            profiles[task] = replace(profile, **override)
+        except TypeError as e:
+            raise ValueError(f"Invalid option for task {task}: {override}") from e
+
+    num_ctx_values = {p.num_ctx for p in profiles.values()}
+    if len(num_ctx_values) > 1:
+        print(
+            "Warning: num_ctx differs between tasks; Ollama reloads the model "
+            "whenever num_ctx changes."
         )
+    return profiles
+
+
+def parse_task_option(spec: str) -> tuple:
+    """CLIの "task.key=value" を (task, key, value) に分解（値はJSONとして解釈）"""
+    target, sep, raw = spec.partition("=")
+    task, dot, key = target.partition(".")
+    if not sep or not dot:
+        raise ValueError(f"Expected TASK.KEY=VALUE, got: {spec}")
+    try:
+        value = json.loads(raw)
+    except json.JSONDecodeError:
+        value = raw
+    return task, key, value
+
+
+# =============================================================================
+# Response Cache
+# =============================================================================
+
+
+class ResponseCache:
+    """推論結果の永続キャッシュ（SQLite・内容アドレス）
+
+    (モデル, システムプロンプト, ユーザープロンプト, オプション) のハッシュを
+    キーに応答本文を保存する。合計サイズが上限を超えたら最終参照が古い順に削除
+    （LRU）。クラッシュした実行の再開やテストハーネスの再実行でGPU時間を使わない。
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)"
+        )
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._total_bytes = total
+
+    @classmethod
+    def from_config(cls, config: Config) -> Optional["ResponseCache"]:
+        """設定で有効な場合のみ data_dir/response_cache.sqlite を開く"""
+        if not config.cache:
+            return None
+        data_dir = Path(config.data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        return cls(data_dir / "response_cache.sqlite", config.cache_max_mb * 1024 * 1024)
+
+    @staticmethod
+    def key(model: str, messages: list, options: dict, fmt: Optional[dict] = None) -> str:
+        request = {"model": model, "messages": messages, "options": options}
+        if fmt is not None:
+            request["format"] = fmt
+        payload = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """合計サイズが上限の9割を下回るまで古いエントリを削除"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# =============================================================================
+# Telemetry
+# =============================================================================
+
+
+def percentile(values: list, q: float) -> float:
+    """線形補間によるパーセンタイル（q は 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class MetricsRecorder:
+    """推論1回ごとの計測値を記録し、タスク別に集計する
+
+    各レコードは on_record（通常は LocalStorage.append_metrics → metrics.jsonl）に
+    渡され、集計用にタスク別のレイテンシとトークン数をメモリに保持する。
+    Ollamaの応答に含まれる時間はナノ秒なので秒に換算して記録する。
+    """
+
+    TIMING_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+    COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+    # この時間を超える load_duration はモデルの（再）ロードとみなす
+    RELOAD_THRESHOLD = 1.0
+
+    def __init__(self, on_record=None):
+        self._on_record = on_record
+        self._tasks: dict = {}
+
+    def record(
+        self,
+        task: str,
+        index: Optional[int],
+        attempt: int,
+        latency: float,
+        host: str = "",
+        response=None,
+        error: Optional[BaseException] = None,
+        cached: bool = False,
+        limit: Optional[int] = None,
+        dropped: bool = False,
+        hedged: bool = False,
+    ) -> dict:
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "task": task,
+            "index": index,
+            "attempt": attempt,
+            "host": host,
+            "status": (
+                "error" if error is not None else "dropped" if dropped else "cached" if cached else "ok"
+            ),
+            "latency": round(latency, 4),
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        if limit is not None:
+            record["limit"] = limit
+        if hedged:
+            record["hedged"] = True
+        if response is not None:
+            for name in self.COUNT_FIELDS:
+                record[name] = response.get(name) or 0
+            for name in self.TIMING_FIELDS:
+                record[name] = (response.get(name) or 0) / 1e9
+
+        stats = self._tasks.setdefault(
+            task,
+            {"latencies": [], "eval_count": 0, "eval_duration": 0.0, "errors": 0, "reloads": 0, "dropped": 0},
+        )
+        if error is not None:
+            stats["errors"] += 1
+        elif dropped:
+            stats["dropped"] += 1
+        elif not cached:
+            stats["latencies"].append(latency)
+            stats["eval_count"] += record.get("eval_count", 0)
+            stats["eval_duration"] += record.get("eval_duration", 0.0)
+            if record.get("load_duration", 0.0) > self.RELOAD_THRESHOLD:
+                stats["reloads"] += 1
+
+        if self._on_record is not None:
+            self._on_record(record)
+        return record
+
+    def summary(self) -> list:
+        """タスク別の集計（呼び出し回数、p50/p95レイテンシ、tokens/s、エラー、再ロード、破棄）"""
+        rows = []
+        for task, stats in self._tasks.items():
+            latencies = stats["latencies"]
+            rows.append(
+                {
+                    "task": task,
+                    "calls": len(latencies),
+                    "p50": percentile(latencies, 50),
+                    "p95": percentile(latencies, 95),
+                    "total": sum(latencies),
+                    "tokens_per_sec": (
+                        stats["eval_count"] / stats["eval_duration"] if stats["eval_duration"] else 0.0
+                    ),
+                    "errors": stats["errors"],
+                    "reloads": stats["reloads"],
+                    "dropped": stats["dropped"],
+                }
+            )
+        return rows
+
+    def latencies(self) -> list:
+        """全タスクの成功した呼び出しのレイテンシ"""
+        return [latency for stats in self._tasks.values() for latency in stats["latencies"]]
+
+    def print_summary(self) -> None:
+        rows = self.summary()
+        if not rows:
+            return
+        print("\nInference metrics (per task):")
+        print(f"  {'task':18} {'calls':>6} {'p50(s)':>8} {'p95(s)':>8} {'total(s)':>9} {'tok/s':>7} {'errors':>6} {'reloads':>7}")
+        for row in sorted(rows, key=lambda r: r["total"], reverse=True):
+            print(
+                f"  {row['task']:18} {row['calls']:6d} {row['p50']:8.2f} {row['p95']:8.2f} "
+                f"{row['total']:9.1f} {row['tokens_per_sec']:7.1f} {row['errors']:6d} {row['reloads']:7d}"
+            )
+
+
+# =============================================================================
+# Inference Backends
+# =============================================================================
+
+
+class InferenceBackend(Protocol):
+    """推論サーバーのドライバー（ollama.AsyncClient と同じ形のインターフェース）
+
+    chat() は Ollama の /api/chat と同じ引数を受け取り、同じ形の応答
+    （message.content, prompt_eval_count, eval_count, *_duration）を返す。
+    リトライ・ヘッジ・計測・ホストプールはこの形だけに依存する。
+    """
+
+    async def chat(
+        self,
+        model: str,
+        messages: Optional[list] = None,
+        options: Optional[dict] = None,
+        keep_alive=None,
+        format=None,
+    ): ...
+
+    async def list(self): ...
+
+    async def pull(self, model: str): ...
+
+    async def close(self) -> None: ...
+
+
+class BatchInferenceBackend(InferenceBackend, Protocol):
+    """1回のリクエストで複数のプロンプトを処理できるバックエンド（RequestBatcher の送信先）"""
+
+    async def chat_batch(self, requests: list) -> list:
+        """chat() の引数の辞書のリストを受け取り、同じ順の応答（失敗した要素は例外）を返す"""
+        ...
+
+
+class OpenAICompatibleBackend:
+    """OpenAI互換の /v1/chat/completions を持つサーバー（llama.cpp server, vLLM など）のドライバー
+
+    Ollama の生成オプションを対応するパラメーターに変換し（num_predict → max_tokens など）、
+    応答を Ollama の形（usage → prompt_eval_count / eval_count）に揃える。num_ctx と
+    keep_alive はサーバー起動時の設定なので送らない。モデルの pull はできない。
+
+    chat_batch は同じタスクの会話をプロンプトのリストとして /v1/completions へ1回で送る。
+    /v1/completions はメッセージを受け付けないため、各会話はサーバーのチャットテンプレートで
+    先にプロンプトにする（llama.cpp server は /apply-template、vLLM は /tokenize）。
+    """
+
+    # Ollama の options → リクエストのパラメーター（対応のないもの・num_ctx は送らない）
+    OPTION_NAMES = {
+        "num_predict": "max_tokens",
+        "temperature": "temperature",
+        "top_p": "top_p",
+        "stop": "stop",
+        "seed": "seed",
+        "presence_penalty": "presence_penalty",
+        "frequency_penalty": "frequency_penalty",
+    }
+
+    def __init__(self, host: str, timeout: Optional[float] = None, api_key: str = ""):
+        # OLLAMA_HOST に .../v1 まで書かれていても同じURLになるようにする
+        base_url = host.rstrip("/").removesuffix("/v1")
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        self._client = httpx.AsyncClient(base_url=base_url, timeout=timeout, headers=headers)
+        # チャットテンプレートを適用するエンドポイント（最初の chat_batch で決める）
+        self._template_route: Optional[str] = None
+
+    async def chat(
+        self,
+        model: str,
+        messages: Optional[list] = None,
+        options: Optional[dict] = None,
+        keep_alive=None,
+        format=None,
+    ) -> dict:
+        if not messages:
+            # Ollama のモデル読み込みだけのリクエストに当たるものはない（起動時に読み込み済み）
+            return {"model": model, "message": {"role": "assistant", "content": ""}, "done": True}
+        body = {"model": model, "messages": messages, **self._params(options, format)}
+        response = await self._client.post("/v1/chat/completions", json=body)
+        response.raise_for_status()
+        data = response.json()
+        choice = data["choices"][0]
+        usage = data.get("usage") or {}
+        return {
+            "model": data.get("model", model),
+            "message": {"role": "assistant", "content": choice["message"].get("content") or ""},
+            "done": True,
+            "done_reason": choice.get("finish_reason"),
+            "prompt_eval_count": usage.get("prompt_tokens", 0),
+            "eval_count": usage.get("completion_tokens", 0),
+        }
+
+    async def chat_batch(self, requests: list) -> list:
+        """同じモデル・オプション・format の会話を /v1/completions の1回のリクエストで送る
+
+        usage はバッチ全体の合計なので、prompt_eval_count / eval_count はプロンプト・応答の
+        長さで按分する。
+        """
+        first = requests[0]
+        model = first["model"]
+        prompts = list(await asyncio.gather(*(self._render(model, r.get("messages") or []) for r in requests)))
+        body = {"model": model, "prompt": prompts, **self._params(first.get("options"), first.get("format"))}
+        response = await self._client.post("/v1/completions", json=body)
+        response.raise_for_status()
+        data = response.json()
+        choices: list = [None] * len(requests)
+        for choice in data["choices"]:
+            choices[choice["index"]] = choice
+        usage = data.get("usage") or {}
+        texts = [(c or {}).get("text") or "" for c in choices]
+        prompt_tokens = self._share(usage.get("prompt_tokens", 0), [len(p) for p in prompts])
+        completion_tokens = self._share(usage.get("completion_tokens", 0), [len(t) for t in texts])
+        responses: list = []
+        for choice, text, prompt_count, eval_count in zip(choices, texts, prompt_tokens, completion_tokens):
+            if choice is None:
+                responses.append(RuntimeError("No completion returned for this prompt"))
+                continue
+            responses.append(
+                {
+                    "model": data.get("model", model),
+                    "message": {"role": "assistant", "content": text},
+                    "done": True,
+                    "done_reason": choice.get("finish_reason"),
+                    "prompt_eval_count": prompt_count,
+                    "eval_count": eval_count,
+                }
+            )
+        return responses
+
+    async def _render(self, model: str, messages: list):
+        """会話をサーバーのチャットテンプレートで /v1/completions のプロンプト（文字列かトークン列）にする"""
+        if self._template_route in (None, "/apply-template"):
+            response = await self._client.post("/apply-template", json={"messages": messages})
+            if response.status_code != 404:
+                response.raise_for_status()
+                self._template_route = "/apply-template"
+                return response.json()["prompt"]
+            self._template_route = "/tokenize"
+        response = await self._client.post(
+            "/tokenize", json={"model": model, "messages": messages, "add_generation_prompt": True}
+        )
+        response.raise_for_status()
+        return response.json()["tokens"]
+
+    @classmethod
+    def _params(cls, options: Optional[dict], format) -> dict:
+        """Ollama の options・format をリクエストのパラメーターに変換"""
+        params = {}
+        for name, value in (options or {}).items():
+            if name in cls.OPTION_NAMES:
+                params[cls.OPTION_NAMES[name]] = value
+        if isinstance(format, dict):
+            params["response_format"] = {"type": "json_schema", "json_schema": {"name": "response", "schema": format}}
+        elif format == "json":
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    @staticmethod
+    def _share(total: int, weights: list) -> list:
+        """バッチ全体のトークン数を重みで按分（合計は total に一致）"""
+        weight = sum(weights)
+        if not weight:
+            return [0] * len(weights)
+        shares = [total * w // weight for w in weights]
+        shares[weights.index(max(weights))] += total - sum(shares)
+        return shares
+
+    async def list(self) -> dict:
+        """/v1/models を Ollama の /api/tags と同じ形で返す"""
+        response = await self._client.get("/v1/models")
+        response.raise_for_status()
+        models = [m["id"] for m in response.json().get("data", [])]
+        return {"models": [{"name": m, "model": m} for m in models]}
+
+    async def pull(self, model: str):
+        raise RuntimeError(f"Model {model} is not served by this server (pull is only supported by Ollama)")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class FakeBackend:
+    """ネットワークを使わない決定的な疑似バックエンド（テスト・オーケストレーションの計測用）
+
+    同じリクエスト（メッセージ・オプション・format）には常に同じ応答を返す。format に
+    JSONスキーマを渡すと各プロパティに値を入れたJSONを返し、プロンプトトークン数は
+    PromptProfiler.estimate_tokens で見積もる。chat_batch はバッチ全体で latency を
+    1回だけ払う（バッチデコード相当）。
+    """
+
+    def __init__(self, model: str, latency: float = 0.0):
+        self.model = model
+        self.latency = latency
+        self.requests: list = []
+        # chat_batch で受け取ったバッチの大きさ
+        self.batches: list = []
+
+    async def chat(
+        self,
+        model: str,
+        messages: Optional[list] = None,
+        options: Optional[dict] = None,
+        keep_alive=None,
+        format=None,
+    ) -> dict:
+        await asyncio.sleep(self.latency)
+        return self._respond(model, messages, options, format)
+
+    async def chat_batch(self, requests: list) -> list:
+        self.batches.append(len(requests))
+        await asyncio.sleep(self.latency)
+        return [
+            self._respond(r["model"], r.get("messages"), r.get("options"), r.get("format")) for r in requests
+        ]
+
+    def _respond(self, model: str, messages: Optional[list], options: Optional[dict], format) -> dict:
+        messages = messages or []
+        self.requests.append({"model": model, "messages": messages, "options": options, "format": format})
+        key = json.dumps([messages, options, format], ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+        if isinstance(format, dict):
+            content = json.dumps({name: f"Fake {name} {digest}" for name in format.get("properties", {})})
+        else:
+            content = f"Fake response {digest}" if messages else ""
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": PromptProfiler.estimate_tokens(messages),
+            "eval_count": len(content.split()),
+        }
+
+    async def list(self) -> dict:
+        return {"models": [{"name": self.model, "model": self.model}]}
+
+    async def pull(self, model: str) -> dict:
+        self.model = model
+        return {"status": "success"}
+
+    async def close(self) -> None:
+        pass
+
+
+# chat_batch（1回のリクエストで複数のプロンプト）に対応するバックエンド
+BATCH_BACKENDS = ("openai", "fake")
+
+# バックエンド名（config.backend）→ ホストごとのクライアントを作る関数
+INFERENCE_BACKENDS = {
+    "ollama": lambda config, host: ollama.AsyncClient(host=host, timeout=config.request_timeout),
+    "openai": lambda config, host: OpenAICompatibleBackend(
+        host, timeout=config.request_timeout, api_key=config.api_key
+    ),
+    "fake": lambda config, host: FakeBackend(config.model),
+}
+
+
+def check_batching(config: Config) -> None:
+    """バッチ非対応のバックエンドに batch_size > 1 が指定されていれば ValueError"""
+    if config.batch_size > 1 and config.backend not in BATCH_BACKENDS:
+        # 1リクエスト1会話のバックエンドで黙って無効にすると、効いていない設定に気づけない
+        raise ValueError(
+            f"--batch-size {config.batch_size} is not supported by the {config.backend} backend "
+            f"(it sends one prompt per request; batching works with: {', '.join(BATCH_BACKENDS)}). "
+            "Use --concurrency instead"
+        )
+
+
+def create_backend(config: Config, host: str) -> InferenceBackend:
+    """config.backend のドライバーで host 用のクライアントを作る"""
+    if config.backend not in INFERENCE_BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend: {config.backend} (choose from {', '.join(INFERENCE_BACKENDS)})"
+        )
+    return INFERENCE_BACKENDS[config.backend](config, host)
+
+
+# =============================================================================
+# Host Pool (Load Balancing)
+# =============================================================================
+
+
+class Endpoint:
+    """1台のOllamaサーバーと、その処理中リクエスト数・稼働状態"""
+
+    def __init__(self, host: str, client):
+        self.host = host
+        self.client = client
+        self.in_flight = 0
+        self.healthy = True
+
+
+class HostPool:
+    """複数のOllamaサーバーへリクエストを振り分けるプール
+
+    処理中リクエストが最も少ない稼働中ホストを選ぶ（least outstanding requests）。
+    接続エラーを起こしたホストはローテーションから外し、バックグラウンドの
+    ヘルスチェック（/api/tags）が成功したら戻す。
+    """
+
+    def __init__(self, hosts: list, client_factory, health_check_interval: float = 10.0):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.endpoints = [Endpoint(host, client_factory(host)) for host in hosts]
+        self.health_check_interval = health_check_interval
+        self._rotation = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def is_connection_error(error: BaseException) -> bool:
+        """ホスト自体に到達できないことを示すエラーか"""
+        return isinstance(error, (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout))
+
+    def can_failover(self, error: BaseException) -> bool:
+        """接続エラーで、かつ別の稼働中ホストに切り替えられるか"""
+        return self.is_connection_error(error) and any(ep.healthy for ep in self.endpoints)
+
+    def select(self) -> Endpoint:
+        """稼働中で処理中リクエストが最少のホスト（全滅時は全ホストから選ぶ）"""
+        candidates = [ep for ep in self.endpoints if ep.healthy] or self.endpoints
+        # 同数の場合に同じホストへ偏らないよう、開始位置をずらして比較する
+        self._rotation = (self._rotation + 1) % len(candidates)
+        ordered = candidates[self._rotation:] + candidates[: self._rotation]
+        return min(ordered, key=lambda ep: ep.in_flight)
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """ホストを1つ選び、処理中カウントを増やした状態で渡す"""
+        self._start_health_checks()
+        endpoint = self.select()
+        endpoint.in_flight += 1
+        try:
+            yield endpoint
+        except Exception as e:
+            if self.is_connection_error(e):
+                self.mark_down(endpoint, e)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+
+    def mark_down(self, endpoint: Endpoint, error: BaseException) -> None:
+        if endpoint.healthy and len(self.endpoints) > 1:
+            print(f"Host out of rotation: {endpoint.host} ({error})")
+        endpoint.healthy = False
+
+    async def check(self, endpoint: Endpoint) -> bool:
+        """ヘルスチェック（/api/tags）を行い稼働状態を更新"""
+        try:
+            await endpoint.client.list()
+        except Exception as e:
+            self.mark_down(endpoint, e)
+            return False
+        if not endpoint.healthy:
+            print(f"Host back in rotation: {endpoint.host}")
+        endpoint.healthy = True
+        return True
+
+    def _start_health_checks(self) -> None:
+        if len(self.endpoints) > 1 and self._health_task is None:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self.check(ep) for ep in self.endpoints))
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+
+# =============================================================================
+# Retry Policy
+# =============================================================================
+
+
+class DeadlineExceeded(TimeoutError):
+    """キャラクター単位・実行全体の時間予算を使い切った"""
+
+
+class RetryPolicy:
+    """推論エラーの種類ごとのリトライ方針
+
+    エラーは次のいずれかに分類する:
+        timeout     応答が返らない（モデルが詰まっている）。同じ待ちを何度も繰り返さない
+        connection  サーバーに到達できない（接続拒否など）
+        server      5xx・429（サーバー側の一時的な失敗・過負荷）
+        client      4xx（モデルが存在しない等）。リトライしても直らない
+        other       応答のパース失敗など
+    待ち時間は full jitter（0〜min(cap, base × 2^n) の一様乱数）で、同時に失敗した
+    リクエストが同じ瞬間に再送しないようにする。
+    """
+
+    # 種類ごとのリトライ回数（最初の1回を除く）
+    RETRIES = {"timeout": 1, "connection": 2, "server": 2, "client": 0, "other": 2}
+
+    def __init__(self, base: float = 1.0, cap: float = 30.0, retries: Optional[dict] = None):
+        self.base = base
+        self.cap = cap
+        self.retries = {**self.RETRIES, **(retries or {})}
+
+    @staticmethod
+    def classify(error: BaseException) -> str:
+        if HostPool.is_connection_error(error):
+            return "connection"
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+            return "timeout"
+        status = getattr(error, "status_code", None)
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+        if isinstance(status, int) and (status >= 500 or status == 429):
+            return "server"
+        if isinstance(status, int) and 400 <= status < 500:
+            return "client"
+        return "other"
+
+    def should_retry(self, kind: str, failures: int) -> bool:
+        """kind のエラーが failures 回目なら、もう一度送るか"""
+        return failures <= self.retries.get(kind, 0)
+
+    def delay(self, attempt: int) -> float:
+        """attempt 回目（0始まり）の失敗後の待ち時間"""
+        return random.uniform(0, min(self.cap, self.base * 2**attempt))
+
+
+class CircuitBreaker:
+    """サーバー障害時にパイプライン全体を止めるサーキットブレーカー
+
+    接続エラー・タイムアウト・5xx が threshold 回続くと開き、以降のリクエストは
+    サーバーへ送らずに wait() で待たせる（1件ずつタイムアウトを払わない）。
+    開いている間は reset_timeout 秒ごとに probe()（ヘルスチェック）を行い、
+    成功したら閉じて待っていたリクエストを再開する。開いてから max_outage 秒
+    （0 = 無制限）たっても復旧しなければ、待っているリクエストと以降の wait() は
+    ConnectionError になる（期限のない実行が停止したサーバーを待ち続けない）。
+    """
+
+    FAILURES = ("timeout", "connection", "server")
+
+    def __init__(self, probe, threshold: int = 5, reset_timeout: float = 15.0, max_outage: float = 300.0):
+        self.probe = probe
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.max_outage = max_outage
+        self.failures = 0
+        self.trips = 0
+        self.paused_time = 0.0
+        self._opened_at: Optional[float] = None
+        self._waiters: list = []
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold and not self.is_open:
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            print(
+                f"Circuit open after {self.failures} consecutive failures ({error}); "
+                f"pausing requests, probing every {self.reset_timeout:g}s"
+            )
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def wait(self, deadline: Optional[float] = None) -> None:
+        """閉じるまで待つ
+
+        deadline までに閉じなければ DeadlineExceeded、障害が max_outage 秒を超えたら ConnectionError。
+        """
+        if not self.is_open:
+            return
+        give_up = self._opened_at + self.max_outage if self.max_outage > 0 else None
+        ends = [t for t in (deadline, give_up) if t is not None]
+        if give_up is not None and time.monotonic() >= give_up:
+            raise self._outage_error()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        timeout = max(0.0, min(ends) - time.monotonic()) if ends else None
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if give_up is None or (deadline is not None and deadline <= give_up):
+                raise DeadlineExceeded("deadline exceeded while the server is unavailable") from None
+            raise self._outage_error() from None
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _outage_error(self) -> ConnectionError:
+        return ConnectionError(f"Server unavailable for more than {self.max_outage:g}s; giving up")
+
+    async def _probe_loop(self) -> None:
+        while self.is_open:
+            await asyncio.sleep(self.reset_timeout)
+            if await self.probe():
+                self._close()
+            else:
+                print(f"Server still unavailable, paused {time.monotonic() - self._opened_at:.0f}s")
+
+    def _close(self) -> None:
+        paused = time.monotonic() - self._opened_at
+        self.paused_time += paused
+        self._opened_at = None
+        self.failures = 0
+        print(f"Circuit closed after {paused:.1f}s; resuming requests")
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+
+# =============================================================================
+# Request Hedging
+# =============================================================================
+
+
+class Hedger:
+    """テールレイテンシを削るヘッジリクエスト
+
+    呼び出しがタスク別のレイテンシの p95（直近 window 件）を超えても返らなければ、
+    同じリクエストをもう1本（処理中の少ない別ホスト、単一ホストなら別スロット）へ送り、
+    先に返った応答を使ってもう一方をキャンセルする。ヘッジが増えすぎてサーバーを
+    圧迫しないよう、発火は全呼び出しの max_rate 以下に抑える。
+
+    ヘッジが勝った場合の短縮時間は、直近のサンプルのうち p95 を超えた呼び出しの
+    平均レイテンシ（元のリクエストを待っていた場合の期待値）との差として推定する。
+    キャンセルした側の本当のレイテンシは分からないため、遅い呼び出しがサンプルから
+    外れるほど控えめ（0寄り）の推定になる。
+    """
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, percentile: float = 95.0, max_rate: float = 0.1, window: int = 200):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self._latencies: dict = {}  # タスク → 直近のレイテンシ
+        self._window = window
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.saved = 0.0
+
+    def threshold(self, task: str) -> Optional[float]:
+        """ヘッジを送るまでの待ち時間（サンプル不足・発火率の上限なら None）"""
+        samples = self._latencies.get(task)
+        if not samples or len(samples) < self.MIN_SAMPLES:
+            return None
+        if self.fired >= self.max_rate * self.calls:
+            return None
+        return percentile(list(samples), self.percentile)
+
+    def _observe(self, task: str, latency: float) -> None:
+        samples = self._latencies.setdefault(task, collections.deque(maxlen=self._window))
+        samples.append(latency)
+
+    def _tail_mean(self, task: str, threshold: float) -> float:
+        tail = [v for v in self._latencies.get(task, ()) if v > threshold]
+        return sum(tail) / len(tail) if tail else threshold
+
+    async def run(self, task: str, send) -> tuple:
+        """send()（コルーチン関数）を実行し (結果, ヘッジが勝ったか) を返す"""
+        self.calls += 1
+        threshold = self.threshold(task)
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(send())
+        racers = {primary}
+        try:
+            done, _ = await asyncio.wait(racers, timeout=threshold)
+            if not done:
+                self.fired += 1
+                racers.add(asyncio.ensure_future(send()))
+            error = None
+            while racers:
+                done, racers = await asyncio.wait(racers, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        error = future.exception()
+                        continue
+                    latency = time.perf_counter() - started
+                    hedged = future is not primary
+                    if hedged:
+                        self.won += 1
+                        self.saved += max(0.0, self._tail_mean(task, threshold) - latency)
+                    self._observe(task, latency)
+                    return future.result(), hedged
+            raise error
+        finally:
+            # 負けた側（と呼び出し元のキャンセル時は両方）を止める
+            for future in racers:
+                future.cancel()
+            if racers:
+                await asyncio.gather(*racers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "saved": self.saved,
+            "rate": self.fired / self.calls if self.calls else 0.0,
+        }
+
+
+# =============================================================================
+# Request Batching
+# =============================================================================
+
+
+class RequestBatcher:
+    """複数キャラクターの同じタスクのリクエストを1回のバッチ推論にまとめるマイクロバッチャー
+
+    model・options・format・keep_alive が同じ（＝同じタスクの）リクエストを、最初の1件から
+    window 秒の間、最大 max_size 件まで集めて send(リクエストのリスト) で送る。max_size に
+    達したら窓を待たずに送る。send は入力と同じ順の応答のリストを返し、要素が例外なら
+    その呼び出し元だけが失敗する（send 自体の例外はバッチ全員に伝える）。
+    待っている間にキャンセルされた呼び出し（ヘッジの負け・期限切れ）は送らない。
+    """
+
+    def __init__(self, send, max_size: int = 16, window: float = 0.02):
+        self.send = send
+        self.max_size = max_size
+        self.window = window
+        self._groups: dict = {}  # キー → [(リクエスト, Future)]
+        self._timers: dict = {}
+        self._dispatches: set = set()
+        self.batches = 0
+        self.requests = 0
+        self.largest = 0
+
+    @staticmethod
+    def key(request: dict) -> str:
+        """同じバッチにまとめられるリクエストのキー（messages 以外の全パラメーター）"""
+        params = {name: value for name, value in request.items() if name != "messages"}
+        return json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+    async def submit(self, request: dict):
+        """request をバッチに加え、その応答を返す"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self.key(request)
+        group = self._groups.setdefault(key, [])
+        group.append((request, future))
+        if len(group) >= self.max_size:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = [(request, future) for request, future in self._groups.pop(key, []) if not future.done()]
+        if group:
+            dispatch = asyncio.ensure_future(self._dispatch(group))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, group: list) -> None:
+        self.batches += 1
+        self.requests += len(group)
+        self.largest = max(self.largest, len(group))
+        try:
+            responses = await self.send([request for request, _ in group])
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(group, responses):
+            if future.done():
+                continue
+            if isinstance(response, BaseException):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+    async def close(self) -> None:
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "largest": self.largest,
+            "mean": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+# =============================================================================
+# Concurrency Control
+# =============================================================================
+
+# 推論の優先度（小さいほど先に枠を得る）
+PRIORITY_CRITICAL = 0  # キャラクターの確定に必要なタスク（concept / name / profile / catchphrase）
+PRIORITY_BACKGROUND = 1  # シード進化（new_ability / new_wants / new_role）
+
+
+class TaskDropped(Exception):
+    """期限までに推論枠を確保できず、リクエストが破棄された"""
+
+
+class PriorityGate:
+    """同時推論数を limit 件に制限し、空いた枠を優先度順に割り当てるゲート
+
+    同じ優先度の間は到着順。待っている高優先度のリクエストがあれば、低優先度の
+    リクエストは空き枠があっても割り込まない。slot() に deadline（time.monotonic()
+    の値）を渡すと、それまでに枠を得られなかったリクエストは TaskDropped になる。
+    """
+
+    def __init__(self, limit: int = 1):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.dropped = 0
+        self._waiters: list = []  # (優先度, 到着順, Future) のヒープ
+        self._arrivals = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_CRITICAL, deadline: Optional[float] = None):
+        """枠を確保して1リクエストを実行する"""
+        await self._acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+    def _blocked(self, priority: int) -> bool:
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return self.in_flight >= self.limit or bool(self._waiters and self._waiters[0][0] <= priority)
+
+    async def _acquire(self, priority: int, deadline: Optional[float]) -> None:
+        if not self._blocked(priority):
+            self.in_flight += 1
+            return
+        # 枠は _wake() が in_flight を数えた上で受け渡す
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), waiter))
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return
+            waiter.cancel()
+            self.dropped += 1
+            raise TaskDropped(f"no inference slot within deadline (priority {priority})") from None
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+            raise
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class AdaptiveLimiter(PriorityGate):
+    """AIMD方式で同時推論リクエスト数の上限を調整するリミッター
+
+    推論の完了をウィンドウ（おおむね上限数ぶんのリクエスト）単位で集計し、
+    - タイムアウト・接続エラー: 上限を backoff 倍に下げる（乗法的減少）
+    - 待ち行列の伸び（レイテンシとサーバーでの処理時間の比の p95 が queue_threshold 超）:
+      上限を 0.8 倍に下げる
+    - tokens/s が前のウィンドウ以上（5%の揺らぎは許容）: 上限を1増やす（加法的増加）
+    サーバーの並列スロットを使い切ると、それ以上の同時実行はサーバー側で待たされて
+    レイテンシだけが伸びるため、上限はスロット数の付近に落ち着く。
+
+    処理時間はサーバーが報告する load/prompt_eval/eval の所要時間の合計で、プロンプトや
+    応答の長さによるばらつきは比に入らない。報告しないバックエンド（OpenAI互換など）では
+    直近 BASELINE_WINDOWS ウィンドウ内のタスク別最速レイテンシを代わりに使う（全期間の
+    最速値だと一度の外れ値で比が下がらなくなる）。
+    """
+
+    BASELINE_WINDOWS = 8
+
+    def __init__(
+        self,
+        initial: int = 1,
+        minimum: int = 1,
+        maximum: int = 32,
+        queue_threshold: float = 2.0,
+        backoff: float = 0.5,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        super().__init__(min(max(initial, self.minimum), self.maximum))
+        self.queue_threshold = queue_threshold
+        self.backoff = backoff
+        self.peak = self.limit
+        self.increases = 0
+        self.decreases = 0
+        # タスク → 直近ウィンドウごとの最速レイテンシ（処理時間の報告がない場合の基準）
+        self._baseline: dict = {}
+        self._window_fastest: dict = {}  # タスク → 現在のウィンドウの最速レイテンシ
+        self._window: list = []  # (レイテンシ比, 生成トークン数)
+        self._window_started = time.monotonic()
+        self._last_rate = 0.0
+
+    @staticmethod
+    def is_overload(error: BaseException) -> bool:
+        """サーバーが処理しきれていないことを示すエラーか"""
+        return isinstance(
+            error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)
+        ) or HostPool.is_connection_error(error)
+
+    @staticmethod
+    def service_time(response) -> Optional[float]:
+        """応答が報告するサーバーでの処理時間（秒）。報告がなければ None"""
+        nanos = sum(response.get(key) or 0 for key in ("load_duration", "prompt_eval_duration", "eval_duration"))
+        return nanos / 1e9 if nanos > 0 else None
+
+    def observe(
+        self,
+        task: str,
+        latency: float,
+        eval_count: int = 0,
+        error: Optional[BaseException] = None,
+        service_time: Optional[float] = None,
+    ) -> None:
+        """推論1回の結果を反映（service_time はサーバーでの処理時間）"""
+        if error is not None:
+            if self.is_overload(error):
+                self._set_limit(int(self.limit * self.backoff))
+            return
+        fastest = self._window_fastest.get(task)
+        if fastest is None or latency < fastest:
+            self._window_fastest[task] = fastest = latency
+        if service_time is not None:
+            # サーバーでの処理時間を超えた分が待ち行列（とネットワーク）の時間
+            baseline = min(service_time, latency)
+        else:
+            baseline = min([fastest, *self._baseline.get(task, ())])
+        self._window.append((latency / baseline if baseline > 0 else 1.0, eval_count))
+        if len(self._window) >= max(self.limit, 4):
+            self._end_window()
+
+    def _end_window(self) -> None:
+        for task, fastest in self._window_fastest.items():
+            self._baseline.setdefault(task, collections.deque(maxlen=self.BASELINE_WINDOWS)).append(fastest)
+        self._window_fastest = {}
+        elapsed = time.monotonic() - self._window_started
+        rate = sum(tokens for _, tokens in self._window) / elapsed if elapsed > 0 else 0.0
+        queueing = percentile([ratio for ratio, _ in self._window], 95)
+        if queueing > self.queue_threshold:
+            self._set_limit(int(self.limit * 0.8))
+        elif rate >= self._last_rate * 0.95:
+            self._set_limit(self.limit + 1)
+        self._last_rate = rate
+        self._window = []
+        self._window_started = time.monotonic()
+
+    def _set_limit(self, limit: int) -> None:
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit > self.limit:
+            self.increases += 1
+        elif limit < self.limit:
+            self.decreases += 1
+            # 下げた直後のウィンドウは混雑時の値なので捨てる
+            self._window = []
+            self._window_started = time.monotonic()
+            self._last_rate = 0.0
+        self.limit = limit
+        self.peak = max(self.peak, limit)
+        self._wake()
 
 
 # =============================================================================
@@ -57,75 +1397,1178 @@ class Config:
 # =============================================================================
 
 
-class OllamaInference:
-    """Ollama推論クライアント"""
+class _InferenceBase:
+    """同期・非同期クライアント共通のリクエスト組み立て"""
 
     SYSTEM_PROMPT = (
         "人間の仕事を助ける優秀なAIアシスタントとして、"
         "指示に従い、必要な情報のみを端的に出力します。"
     )
 
+    config: Config
+    profiles: dict
+    cache: Optional[ResponseCache] = None
+    metrics: Optional[MetricsRecorder] = None
+
+    def _messages(self, prompt: str, context: Optional[str] = None) -> list:
+        """context は共有プレフィックス（システムプロンプト直後の独立したメッセージ）"""
+        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        if context is not None:
+            messages.append({"role": "user", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _options(self, task: str) -> dict:
+        profile = self.profiles.get(task, self.profiles["default"])
+        return profile.to_options()
+
+    def _cache_lookup(self, messages: list, options: dict, fmt: Optional[dict] = None) -> tuple:
+        """(キャッシュキー, キャッシュ済み応答) を返す。キャッシュ無効時は (None, None)"""
+        if self.cache is None:
+            return None, None
+        key = ResponseCache.key(self.config.model, messages, options, fmt)
+        return key, self.cache.get(key)
+
+    def _cache_store(self, key: Optional[str], content: str) -> None:
+        if self.cache is not None and key is not None:
+            self.cache.put(key, content)
+
+    @staticmethod
+    def _parse_json_fields(content: str, schema: dict) -> dict:
+        """JSON応答をパースし、スキーマの必須フィールドが空でない文字列か検証"""
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON response: {content[:80]!r}") from e
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected JSON object, got: {content[:80]!r}")
+        values = {}
+        for key in schema["required"]:
+            value = data.get(key)
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"Missing or empty field in JSON response: {key}")
+            values[key] = value.strip()
+        return values
+
+    def _needs_pull(self, models) -> bool:
+        """モデル一覧に設定モデルが含まれていなければTrue"""
+        model_list = models.get("models", [])
+
+        # モデルリストの形式に対応（新旧両方）
+        available = []
+        for m in model_list:
+            if hasattr(m, "model"):
+                available.append(m.model)
+            elif isinstance(m, dict) and "name" in m:
+                available.append(m["name"])
+
+        return not any(self.config.model in name for name in available)
+
+    def _connection_error(self) -> ConnectionError:
+        if self.config.backend != "ollama":
+            return ConnectionError(f"Inference server ({self.config.backend}) not available at {self.config.host}")
+        return ConnectionError(
+            f"Ollama server not running at {self.config.host}. "
+            f"Start with: ollama serve"
+        )
+
+
+class OllamaInference(_InferenceBase):
+    """Ollama推論クライアント"""
+
     def __init__(self, config: Config):
         self.config = config
-        self.client = ollama.Client(host=config.host, timeout=120)
+        self.client = ollama.Client(host=config.hosts[0], timeout=config.request_timeout)
+        self.retry_policy = RetryPolicy()
+        self.profiles = resolve_profiles(config.task_options)
+        self.cache = ResponseCache.from_config(config)
         self._ensure_model_available()
 
     def _ensure_model_available(self) -> None:
         """モデルの存在確認、なければpull"""
         try:
-            models = self.client.list()
-            model_list = models.get("models", [])
-
-            # モデルリストの形式に対応（新旧両方）
-            available = []
-            for m in model_list:
-                if hasattr(m, "model"):
-                    available.append(m.model)
-                elif isinstance(m, dict) and "name" in m:
-                    available.append(m["name"])
-
-            model_name = self.config.model
-
-            if not any(model_name in name for name in available):
-                print(f"Pulling model: {model_name}")
-                self.client.pull(model_name)
+            if self._needs_pull(self.client.list()):
+                print(f"Pulling model: {self.config.model}")
+                self.client.pull(self.config.model)
         except Exception as e:
-            raise ConnectionError(
-                f"Ollama server not running at {self.config.host}. "
-                f"Start with: ollama serve"
-            ) from e
+            raise self._connection_error() from e
 
-    def generate(self, prompt: str, max_retries: int = 3) -> str:
-        """リトライ付き推論"""
+    def generate(self, prompt: str, task: str = "default", max_retries: int = 3) -> str:
+        """リトライ付き推論（task で生成オプションのプロファイルを選択）"""
+        messages = self._messages(prompt)
+        options = self._options(task)
+        key, cached = self._cache_lookup(messages, options)
+        if cached is not None:
+            return cached
+
+        failures: dict = {}
         for attempt in range(max_retries):
             try:
                 response = self.client.chat(
                     model=self.config.model,
-                    messages=[
-                        {"role": "system", "content": self.SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt},
-                    ],
-                    options={
-                        "num_predict": 2048,
-                        "temperature": 0.8,
-                    },
+                    messages=messages,
+                    options=options,
+                    keep_alive=self.config.keep_alive,
                 )
-                return response["message"]["content"].strip()
+                content = response["message"]["content"].strip()
+                self._cache_store(key, content)
+                return content
             except Exception as e:
-                if attempt == max_retries - 1:
+                kind = self.retry_policy.classify(e)
+                failures[kind] = failures.get(kind, 0) + 1
+                if attempt == max_retries - 1 or not self.retry_policy.should_retry(kind, failures[kind]):
                     raise
-                delay = 2**attempt
-                print(f"Retry {attempt + 1}/{max_retries}: {e}")
+                delay = self.retry_policy.delay(attempt)
+                print(f"Retry {attempt + 1}/{max_retries} ({kind}): {e}")
                 time.sleep(delay)
 
         raise RuntimeError("Unreachable")
 
 
+class AsyncOllamaInference(_InferenceBase):
+    """非同期推論クライアント（サーバーとの通信は config.backend のドライバーが行う）
+
+    イベントループ上で複数リクエストを同時に発行できるため、
+    OLLAMA_NUM_PARALLEL>1 のサーバーや連続バッチングを行うサーバーの並列スロットを埋められる。
+    """
+
+    def __init__(self, config: Config):
+        # クライアントを作る前に検証する（作ってから失敗すると接続が閉じられずに残る）
+        check_batching(config)
+        self.config = config
+        self.pool = HostPool(
+            config.hosts,
+            lambda host: create_backend(config, host),
+            health_check_interval=config.health_check_interval,
+        )
+        self.retry_policy = RetryPolicy()
+        self.breaker = CircuitBreaker(
+            self._probe,
+            threshold=config.breaker_threshold,
+            reset_timeout=config.breaker_reset,
+            max_outage=config.breaker_max_outage,
+        )
+        self.hedger = Hedger(max_rate=config.hedge_max_rate) if config.hedge else None
+        self.batcher = None
+        if config.batch_size > 1:
+            self.batcher = RequestBatcher(self._send_batch, max_size=config.batch_size, window=config.batch_window)
+        self.profiles = resolve_profiles(config.task_options)
+        self.cache = ResponseCache.from_config(config)
+        self.limiter = (
+            AdaptiveLimiter(initial=config.concurrency, maximum=config.max_in_flight)
+            if config.adaptive
+            else None
+        )
+        # 優先度付きスケジューリングでは、適応リミッターがなければ固定の枠数で制限する
+        self.gate = self.limiter
+        if self.gate is None and config.priority:
+            self.gate = PriorityGate(config.concurrency)
+        # 出力検証の集計（"フィールド.ルール" → 違反回数、再生成回数、上限まで直らなかった件数）
+        self.rule_failures: dict = {}
+        self.regenerations = 0
+        self.unresolved = 0
+
+    @property
+    def client(self):
+        """先頭ホストのクライアント（単一ホスト構成ではこれが唯一のクライアント）"""
+        return self.pool.endpoints[0].client
+
+    async def _probe(self) -> bool:
+        """サーキットブレーカーの復旧確認（いずれかのホストのヘルスチェックが通るか）"""
+        results = await asyncio.gather(*(self.pool.check(ep) for ep in self.pool.endpoints))
+        return any(results)
+
+    async def ensure_model_available(self) -> None:
+        """全ホストでモデルの存在確認、なければpull（1台でも使えれば続行）"""
+        results = await asyncio.gather(
+            *(self._ensure_model_on(ep) for ep in self.pool.endpoints),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for endpoint, result in zip(self.pool.endpoints, results):
+            if isinstance(result, BaseException):
+                self.pool.mark_down(endpoint, result)
+        if len(errors) == len(results):
+            raise self._connection_error() from errors[0]
+
+    async def _ensure_model_on(self, endpoint: Endpoint) -> None:
+        if self._needs_pull(await endpoint.client.list()):
+            print(f"Pulling model: {self.config.model} ({endpoint.host})")
+            await endpoint.client.pull(self.config.model)
+
+    async def preload(self, warmup: bool = False) -> list:
+        """稼働中の全ホストにモデルを読み込ませ、ホストごとのコールドスタート計測値を返す
+
+        messages なしの chat はモデルのロードだけを行い、keep_alive の間は常駐させる。
+        warmup=True なら続けて SYSTEM_PROMPT のみのリクエスト（1トークン生成）を送り、
+        全リクエスト共通の先頭部分をサーバーのプロンプトキャッシュに載せる。
+        """
+        endpoints = [ep for ep in self.pool.endpoints if ep.healthy]
+        results = await asyncio.gather(
+            *(self._preload_on(ep, warmup) for ep in endpoints),
+            return_exceptions=True,
+        )
+        loaded = []
+        for endpoint, result in zip(endpoints, results):
+            if isinstance(result, BaseException):
+                self.pool.mark_down(endpoint, result)
+            else:
+                loaded.append(result)
+        if not loaded:
+            raise self._connection_error() from results[0]
+        return loaded
+
+    async def _preload_on(self, endpoint: Endpoint, warmup: bool) -> dict:
+        result = {"host": endpoint.host}
+
+        async def timed(task: str, **kwargs) -> None:
+            started = time.perf_counter()
+            response = await endpoint.client.chat(
+                model=self.config.model, keep_alive=self.config.keep_alive, **kwargs
+            )
+            latency = time.perf_counter() - started
+            if self.metrics is not None:
+                self.metrics.record(task, None, 0, latency, endpoint.host, response)
+            result[task] = latency
+            result[f"{task}_load"] = (response.get("load_duration") or 0) / 1e9
+
+        await timed("preload")
+        if warmup:
+            # num_ctx などは本番と同じにしないとモデルが再ロードされる
+            options = dict(self._options("default"), num_predict=1)
+            messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+            await timed("warmup", messages=messages, options=options)
+        return result
+
+    async def generate(
+        self,
+        prompt: str,
+        task: str = "default",
+        max_retries: int = 3,
+        context: Optional[str] = None,
+        usage: Optional[list] = None,
+        index: Optional[int] = None,
+        priority: int = PRIORITY_CRITICAL,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """リトライ付き推論（非同期）
+
+        context を渡すと [system, context, prompt] の順で送信し、同じ context を持つ
+        リクエスト間でサーバーのプロンプト（KV）キャッシュを再利用させる。
+        usage にはサーバーが報告したトークン数を追記する。index はキャラクター番号
+        （計測レコード用）。priority は推論枠の優先度（優先度付きスケジューリング時）。
+        deadline（time.monotonic() の値）を過ぎるとリトライせず DeadlineExceeded を送出する。
+        """
+        return await self._complete(
+            prompt,
+            task,
+            str.strip,
+            max_retries=max_retries,
+            context=context,
+            usage=usage,
+            index=index,
+            priority=priority,
+            deadline=deadline,
+        )
+
+    async def generate_json(
+        self,
+        prompt: str,
+        schema: dict,
+        task: str = "default",
+        max_retries: int = 3,
+        index: Optional[int] = None,
+        priority: int = PRIORITY_CRITICAL,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """JSONスキーマ（Ollamaの format）を指定して複数フィールドを1回で生成
+
+        パース・検証に失敗した応答も1回の失敗としてリトライする。
+        """
+
+        def parse(content: str) -> dict:
+            return self._parse_json_fields(content, schema)
+
+        return await self._complete(
+            prompt,
+            task,
+            parse,
+            fmt=schema,
+            max_retries=max_retries,
+            index=index,
+            priority=priority,
+            deadline=deadline,
+        )
+
+    async def _complete(
+        self,
+        prompt: str,
+        task: str,
+        parse,
+        fmt: Optional[dict] = None,
+        max_retries: int = 3,
+        context: Optional[str] = None,
+        usage: Optional[list] = None,
+        index: Optional[int] = None,
+        priority: int = PRIORITY_CRITICAL,
+        deadline: Optional[float] = None,
+    ):
+        """推論し parse(応答本文) を返す。parse の例外もリトライ対象
+
+        バックグラウンド優先度のリクエストは、seed_deadline 秒以内に推論枠を
+        確保できなければ TaskDropped になる（リトライしない）。
+        出力検証が有効なら、task のルール（Prompts.RULES）に違反した応答は
+        キャッシュせずに最大 validation_attempts 回まで再生成する。
+        """
+        messages = self._messages(prompt, context)
+        options = self._options(task)
+        key, cached = self._cache_lookup(messages, options, fmt)
+        if cached is not None:
+            if self.metrics is not None:
+                self.metrics.record(task, index, 0, 0.0, cached=True)
+            return parse(cached)
+
+        start_by = None
+        if priority > PRIORITY_CRITICAL and self.config.seed_deadline > 0:
+            start_by = time.monotonic() + self.config.seed_deadline
+        attempts = self.config.validation_attempts if self.config.validate else 0
+        for regeneration in range(attempts + 1):
+            if regeneration and "seed" in options:
+                # 固定シードのままでは同じ応答が返るのでずらす
+                options = dict(options, seed=options["seed"] + regeneration)
+            content, value = await self._request(
+                messages, options, fmt, parse, task, max_retries, usage, index, priority, start_by, deadline
+            )
+            failed = self.check(task, value) if self.config.validate else []
+            if not failed:
+                self._cache_store(key, content)
+                return value
+            if regeneration < attempts:
+                self.regenerations += 1
+                print(f"Regenerating {task} ({', '.join(failed)}): {content[:40]!r}")
+        self.unresolved += 1
+        print(f"Validation failed for {task} after {attempts + 1} attempts ({', '.join(failed)})")
+        return value
+
+    def check(self, name: str, value: str) -> list:
+        """value をフィールド name のルールで検証し、違反をルール別に数える"""
+        failed = Prompts.validate(name, value)
+        for rule in failed:
+            key = f"{name}.{rule}"
+            self.rule_failures[key] = self.rule_failures.get(key, 0) + 1
+        return failed
+
+    async def _request(
+        self,
+        messages: list,
+        options: dict,
+        fmt: Optional[dict],
+        parse,
+        task: str,
+        max_retries: int,
+        usage: Optional[list],
+        index: Optional[int],
+        priority: int,
+        start_by: Optional[float],
+        deadline: Optional[float],
+    ) -> tuple:
+        """1回分の推論（エラーは RetryPolicy に従ってリトライ）。(応答本文, parse の結果) を返す
+
+        サーキットブレーカーが開いている間は送信せずに待つ（ブレーカーを開いた失敗も
+        リトライ回数に数える）。deadline を過ぎる待ち・送信は DeadlineExceeded にする。
+        """
+        extra = {"format": fmt} if fmt is not None else {}
+        failures: dict = {}
+        attempt = 0
+        while True:
+            await self.breaker.wait(deadline)
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise DeadlineExceeded(f"{task}: deadline exceeded")
+            started = time.perf_counter()
+            host = ""
+            response = None
+            limit = self.limiter.limit if self.limiter is not None else None
+            try:
+                async with self._slot(priority, start_by):
+                    started = time.perf_counter()
+                    request = dict(
+                        model=self.config.model,
+                        messages=messages,
+                        options=options,
+                        keep_alive=self.config.keep_alive,
+                        **extra,
+                    )
+                    # 残り時間を超えてタイムアウトまで待たない
+                    host, response, hedged = await asyncio.wait_for(self._chat(task, request), timeout)
+                self.breaker.record_success()
+                latency = time.perf_counter() - started
+                if self.limiter is not None:
+                    self.limiter.observe(
+                        task,
+                        latency,
+                        response.get("eval_count") or 0,
+                        service_time=AdaptiveLimiter.service_time(response),
+                    )
+                content = response["message"]["content"].strip()
+                value = parse(content)
+                if self.metrics is not None:
+                    self.metrics.record(
+                        task, index, attempt, latency, host, response, limit=limit, hedged=hedged
+                    )
+                if usage is not None:
+                    usage.append(
+                        {
+                            "task": task,
+                            "prompt_eval_count": response.get("prompt_eval_count") or 0,
+                            "eval_count": response.get("eval_count") or 0,
+                        }
+                    )
+                return content, value
+            except TaskDropped:
+                if self.metrics is not None:
+                    self.metrics.record(task, index, attempt, 0.0, dropped=True)
+                raise
+            except Exception as e:
+                latency = time.perf_counter() - started
+                if self.limiter is not None and response is None:
+                    self.limiter.observe(task, latency, error=e)
+                if self.metrics is not None:
+                    self.metrics.record(task, index, attempt, latency, host, response, error=e, limit=limit)
+                kind = self.retry_policy.classify(e)
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded(f"{task}: deadline exceeded ({kind}: {e})") from e
+                if kind in CircuitBreaker.FAILURES:
+                    self.breaker.record_failure(e)
+                    if self.breaker.is_open:
+                        # 復旧を待ってから送り直す（次のループの breaker.wait）。この失敗も試行回数に数える
+                        attempt += 1
+                        if attempt >= max_retries:
+                            raise
+                        continue
+                attempt += 1
+                failures[kind] = failures.get(kind, 0) + 1
+                if attempt >= max_retries or not self.retry_policy.should_retry(kind, failures[kind]):
+                    raise
+                # 別ホストへ切り替えられる接続エラーは待たずに再送
+                delay = 0 if self.pool.can_failover(e) else self.retry_policy.delay(attempt - 1)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceeded(f"{task}: no time left to retry ({kind}: {e})") from e
+                print(f"Retry {attempt}/{max_retries - 1} ({kind}): {e}")
+                await asyncio.sleep(delay)
+
+    async def _send(self, request: dict) -> tuple:
+        if self.batcher is not None:
+            return await self.batcher.submit(request)
+        async with self.pool.lease() as endpoint:
+            return endpoint.host, await endpoint.client.chat(**request)
+
+    async def _send_batch(self, requests: list) -> list:
+        """まとめたリクエストを1台のホストへ1回で送り、(ホスト, 応答) のリストを返す"""
+        async with self.pool.lease() as endpoint:
+            responses = await endpoint.client.chat_batch(requests)
+        return [r if isinstance(r, BaseException) else (endpoint.host, r) for r in responses]
+
+    async def _chat(self, task: str, request: dict) -> tuple:
+        """1リクエストを送り (ホスト, 応答, ヘッジが勝ったか) を返す"""
+        if self.hedger is None:
+            return (*await self._send(request), False)
+        (host, response), hedged = await self.hedger.run(task, lambda: self._send(request))
+        return host, response, hedged
+
+    def _slot(self, priority: int, deadline: Optional[float]):
+        """推論枠（適応リミッター・優先度付きスケジューリングがともに無効なら何もしない）"""
+        if self.gate is None:
+            return contextlib.nullcontext()
+        return self.gate.slot(priority, deadline)
+
+    async def close(self) -> None:
+        await self.breaker.stop()
+        if self.batcher is not None:
+            await self.batcher.close()
+        await self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+# =============================================================================
+# Character
+# =============================================================================
+
+
+@dataclass(frozen=True)
+class Character:
+    """生成済みキャラクター1件（output.csvの1行に対応）"""
+
+    name: str
+    profile: str
+    catchphrase: str
+    image_prompt: str
+    concept: str
+    age: str
+    gender: str
+    species: str
+    ability: str
+    wants: str
+    role: str
+
+    @classmethod
+    def headers(cls) -> list:
+        """output.csvのヘッダー（フィールド定義順）"""
+        return [f.name for f in fields(cls)]
+
+    def to_row(self) -> list:
+        return [getattr(self, name) for name in self.headers()]
+
+
 # =============================================================================
 # Local Storage (CSV)
 # =============================================================================
 
 
+class FileAppender(abc.ABC):
+    """ファイルへの追記バッファ（BufferedWriterのスレッドからのみ操作）
+
+    レコードはメモリ上に溜め、flush() で初めてファイルへ書き出す。ファイルの内容が
+    変わるのはフラッシュ時だけなので、読み手はフラッシュ単位で状態を把握できる。
+    """
+
+    # True のシンクは同じフラッシュ内で他のシンクより先に書き出す
+    flush_first = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._buffer = io.StringIO()
+        self._file = None
+        # 行数と書き出し済みバイト数（シャード分割の判定用）
+        self.rows = 0
+        self.bytes_written = 0
+
+    @abc.abstractmethod
+    def write(self, record) -> None:
+        """1レコードをバッファに追加（形式ごとに実装）"""
+
+    def _open(self):
+        return open(self.path, "a", newline="", encoding="utf-8")
+
+    def _encode(self, data: str):
+        """バッファの内容をファイルに書く形に変換（圧縮形式で上書き）"""
+        return data
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._buffer.tell()
+
+    def flush(self, fsync: bool = False) -> None:
+        data = self._buffer.getvalue()
+        if not data:
+            return
+        if self._file is None:
+            self._file = self._open()
+        encoded = self._encode(data)
+        self._file.write(encoded)
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+        self.bytes_written += len(encoded)
+        self._buffer = io.StringIO()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CsvAppender(FileAppender):
+    """CSVの1行（リスト）を追記"""
+
+    def write(self, record: list) -> None:
+        csv.writer(self._buffer).writerow(record)
+        self.rows += 1
+
+
+class JsonlAppender(FileAppender):
+    """JSONの1レコード（辞書）を1行として追記"""
+
+    def write(self, record: dict) -> None:
+        self._buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+
+class GzipJsonlAppender(JsonlAppender):
+    """gzip圧縮JSONL。フラッシュごとに独立したgzipメンバーを追記する
+
+    連結されたgzipメンバーはそのまま1つのgzipとして読めるため、クラッシュしても
+    最後にフラッシュした分までは読み出せる。
+    """
+
+    def _open(self):
+        return open(self.path, "ab")
+
+    def _encode(self, data: str) -> bytes:
+        return gzip.compress(data.encode("utf-8"))
+
+
+class ZstdJsonlAppender(JsonlAppender):
+    """zstd圧縮JSONL（要 zstandard）。フラッシュごとに独立したフレームを追記する"""
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._compressor = _optional_import("zstandard").ZstdCompressor()
+
+    def _open(self):
+        return open(self.path, "ab")
+
+    def _encode(self, data: str) -> bytes:
+        return self._compressor.compress(data.encode("utf-8"))
+
+
+class ParquetAppender(FileAppender):
+    """Parquet（要 pyarrow）。フラッシュごとに1つの行グループを書き出す
+
+    Parquetはフッターを書くまで読めないため、書き込み中のシャードは close()
+    （シャード切り替え・実行終了時）の後に読めるようになる。
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._pa = _optional_import("pyarrow")
+        self._pq = _optional_import("pyarrow.parquet", "pyarrow")
+        self._schema = self._pa.schema([(name, self._pa.string()) for name in Character.headers()])
+        self._records: list = []
+
+    def write(self, record: dict) -> None:
+        self._records.append(record)
+        self.rows += 1
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(len(v) for record in self._records for v in record.values())
+
+    def flush(self, fsync: bool = False) -> None:
+        if not self._records:
+            return
+        if self._file is None:
+            self._file = self._pq.ParquetWriter(str(self.path), self._schema, compression="zstd")
+        self._file.write_table(self._pa.Table.from_pylist(self._records, schema=self._schema))
+        self.bytes_written = self.path.stat().st_size
+        self._records = []
+
+
+def _optional_import(module: str, package: Optional[str] = None):
+    """任意依存のモジュールを読み込む（未インストールならインストール方法を示す）"""
+    import importlib
+
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f"{module} is required for this output format: pip install {package or module}") from e
+
+
+# 出力形式 → (ファイル拡張子, アペンダー, レコードを辞書で渡すか)
+OUTPUT_FORMATS = {
+    "csv": (".csv", CsvAppender, False),
+    "jsonl": (".jsonl", JsonlAppender, True),
+    "jsonl.gz": (".jsonl.gz", GzipJsonlAppender, True),
+    "jsonl.zst": (".jsonl.zst", ZstdJsonlAppender, True),
+    "parquet": (".parquet", ParquetAppender, True),
+}
+
+
+class ShardedOutput:
+    """キャラクター出力のシンク（出力形式の選択とシャード分割）
+
+    BufferedWriter からは1つのシンクとして扱われ、行数（shard_rows）または
+    書き出しサイズ（shard_bytes）が上限に達すると次のシャードへ切り替える。
+    分割しない場合のファイル名は output.<ext>、分割する場合は output-00000.<ext> …。
+    """
+
+    flush_first = False
+
+    def __init__(self, run_dir: Path, fmt: str = "csv", shard_rows: int = 0, shard_bytes: int = 0):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {fmt} (choose from {', '.join(OUTPUT_FORMATS)})")
+        self.run_dir = run_dir
+        self.format = fmt
+        self.shard_rows = shard_rows
+        self.shard_bytes = shard_bytes
+        self.paths: list = []
+        self._suffix, self._appender, self._as_dict = OUTPUT_FORMATS[fmt]
+        self._current = self._open_shard()
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.shard_rows or self.shard_bytes)
+
+    @staticmethod
+    def existing(run_dir: Path) -> list:
+        """実行ディレクトリ内の出力ファイル（シャード順）"""
+        paths = []
+        for suffix, _, _ in OUTPUT_FORMATS.values():
+            paths += glob.glob(str(run_dir / f"output{suffix}"))
+            paths += glob.glob(str(run_dir / f"output-[0-9]*{suffix}"))
+        return sorted(Path(p) for p in set(paths))
+
+    def _open_shard(self):
+        name = f"output-{len(self.paths):05d}{self._suffix}" if self.sharded else f"output{self._suffix}"
+        path = self.run_dir / name
+        self.paths.append(path)
+        appender = self._appender(path)
+        if self.format == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(Character.headers())
+        return appender
+
+    def _full(self) -> bool:
+        shard = self._current
+        if self.shard_rows and shard.rows >= self.shard_rows:
+            return True
+        return bool(self.shard_bytes) and shard.bytes_written + shard.pending_bytes >= self.shard_bytes
+
+    def write(self, row: list) -> None:
+        if self.sharded and self._current.rows and self._full():
+            self._current.flush()
+            self._current.close()
+            self._current = self._open_shard()
+        self._current.write(dict(zip(Character.headers(), row)) if self._as_dict else row)
+
+    def flush(self, fsync: bool = False) -> None:
+        self._current.flush(fsync)
+
+    def close(self) -> None:
+        self._current.close()
+
+
+def read_characters(run_dir) -> Iterator[Character]:
+    """実行ディレクトリの出力（全シャード・全形式）を1件ずつ Character として読む
+
+    ファイル全体をメモリに載せず、行（Parquetは行グループ）単位でストリーミングする。
+    """
+    for path in ShardedOutput.existing(Path(run_dir)):
+        name = path.name
+        if name.endswith(".csv"):
+            with open(path, newline="", encoding="utf-8") as f:
+                for record in csv.DictReader(f):
+                    yield Character(**record)
+        elif name.endswith(".parquet"):
+            parquet_file = _optional_import("pyarrow.parquet", "pyarrow").ParquetFile(str(path))
+            for batch in parquet_file.iter_batches():
+                for record in batch.to_pylist():
+                    yield Character(**record)
+        else:
+            if name.endswith(".gz"):
+                stream = gzip.open(path, "rt", encoding="utf-8")
+            elif name.endswith(".zst"):
+                raw = _optional_import("zstandard").ZstdDecompressor().stream_reader(
+                    open(path, "rb"), read_across_frames=True, closefd=True
+                )
+                stream = io.TextIOWrapper(raw, encoding="utf-8")
+            else:
+                stream = open(path, encoding="utf-8")
+            with stream:
+                for line in stream:
+                    yield Character(**json.loads(line))
+
+
+class JournalAppender(JsonlAppender):
+    """実行ジャーナル（output.csv・シードより先にフラッシュされる）"""
+
+    flush_first = True
+
+
+def _truncate_partial_line(path: Path) -> None:
+    """クラッシュで途中まで書かれた最終行を切り詰める"""
+    if not path.exists():
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class RunJournal:
+    """実行ジャーナル（journal.jsonl）の内容
+
+    各行は次のいずれかのレコード:
+        {"type": "run", ...}                               実行時の設定
+        {"type": "start", "index", "attributes"}           サンプリングした属性
+        {"type": "call", "index", "task", "result"}        完了した推論タスク
+        {"type": "character", "index", "row", "seeds"}     確定したキャラクター
+        {"type": "seeds", "index", "seeds"}                 バックグラウンドで進化したシード
+
+    ジャーナルは同じフラッシュ内で output.csv・シードより先に書き出されるため、
+    ファイルに残った行は常にジャーナルに記録済み。再開時はジャーナルを正として
+    出力ファイル（形式・シャード分割は再開時の設定に従う）を作り直し、欠けたシードを補う。
+    """
+
+    def __init__(self):
+        self.header: Optional[dict] = None
+        self.characters: dict = {}
+        self.attributes: dict = {}
+        self.calls: dict = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "RunJournal":
+        journal = cls()
+        _truncate_partial_line(path)
+        if not path.exists():
+            return journal
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                kind = record["type"]
+                if kind == "run":
+                    journal.header = record
+                elif kind == "start":
+                    journal.attributes[record["index"]] = record["attributes"]
+                elif kind == "call":
+                    journal.calls.setdefault(record["index"], {})[record["task"]] = record["result"]
+                elif kind == "character":
+                    journal.characters[record["index"]] = record
+                elif kind == "seeds":
+                    journal.characters[record["index"]]["seeds"].update(record["seeds"])
+        return journal
+
+    @staticmethod
+    def read_header(path: Path) -> dict:
+        """先頭の実行設定レコードだけを読む（ファイルは変更しない。読めなければ空）
+
+        実行中・中断した実行のジャーナルも読むため、load と違って書きかけの行を切り詰めない。
+        """
+        try:
+            with open(path, "rb") as f:
+                record = json.loads(f.readline())
+        except (OSError, ValueError):
+            return {}
+        return record if isinstance(record, dict) and record.get("type") == "run" else {}
+
+    @property
+    def committed(self) -> int:
+        """先頭から連続して確定済みのキャラクター数"""
+        count = 0
+        while count in self.characters:
+            count += 1
+        return count
+
+
+class BufferedWriter:
+    """書き込み専用スレッドによるwrite-behindライター
+
+    submit() は有界キューに積むだけで戻るため、推論側はファイルI/Oを待たない
+    （キューが満杯の場合のみ背圧として待つ）。書き込みスレッドは
+    flush_rows 行ごと・最初の未フラッシュ行から flush_interval 秒ごと・
+    close() 時（正常終了/Ctrl+C/atexit）にフラッシュするため、
+    クラッシュ時に失われるのは最大1フラッシュ分。
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(
+        self,
+        flush_rows: int = 20,
+        flush_interval: float = 1.0,
+        fsync: bool = False,
+        max_queue: int = 10000,
+        lock: Optional[threading.Lock] = None,
+        on_flush=None,
+    ):
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        # 書き出し中のシンクの記録と on_flush の間だけ保持するロック（読み手との整合用）。
+        # ファイルへの書き出し・fsync はロックの外で行い、読み手をディスクI/Oで待たせない
+        self.lock = lock if lock is not None else threading.Lock()
+        # 書き出し中のシンク（self.lock を保持して読む）。読み手はこの間のファイルの変化を無視する
+        self.flushing: set = set()
+        self._on_flush = on_flush
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="BufferedWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, sink: FileAppender, row) -> None:
+        """行を書き込みキューに追加"""
+        self._raise_if_failed()
+        if self._closed:
+            raise RuntimeError("BufferedWriter is closed")
+        self._queue.put((sink, row))
+
+    def flush(self) -> None:
+        """キュー内の全行を書き出すまで待つ
+
+        close() 後は書き出し済みなのですぐ戻る。close() と競合して書き込みスレッドが
+        先に終了した場合も、印が処理されるのを待ち続けない。
+        """
+        self._raise_if_failed()
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put((self._FLUSH, done))
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                break
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        """残りを書き出してスレッドを終了（複数回呼んでもよい）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((self._STOP, None))
+        self._thread.join()
+        atexit.unregister(self.close)
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("BufferedWriter failed") from self._error
+
+    def _run(self) -> None:
+        dirty: dict = {}  # sink -> 未フラッシュ行数
+        opened: dict = {}  # これまでに書き込んだsink（終了時にclose）
+        pending = 0
+        first_pending_at = 0.0
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, first_pending_at + self.flush_interval - time.monotonic())
+            try:
+                sink, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                sink, item = None, None
+
+            if sink is self._STOP:
+                self._flush(dirty)
+                for s in opened:
+                    s.close()
+                return
+            if sink is self._FLUSH:
+                self._flush(dirty)
+                pending = 0
+                item.set()
+                continue
+            if sink is not None:
+                if self._error is None:
+                    try:
+                        sink.write(item)
+                    except Exception as e:
+                        self._error = e
+                if not pending:
+                    first_pending_at = time.monotonic()
+                opened[sink] = True
+                dirty[sink] = dirty.get(sink, 0) + 1
+                pending += 1
+
+            if pending and (
+                pending >= self.flush_rows
+                or time.monotonic() - first_pending_at >= self.flush_interval
+            ):
+                self._flush(dirty)
+                pending = 0
+
+    def _flush(self, dirty: dict) -> None:
+        if self._error is not None:
+            dirty.clear()
+            return
+        # ジャーナルを先に書き、出力が記録より先にファイルへ出ないようにする
+        sinks = sorted(dirty.items(), key=lambda item: not item[0].flush_first)
+        dirty.clear()
+        with self.lock:
+            self.flushing.update(sink for sink, _ in sinks)
+        try:
+            for sink, rows in sinks:
+                sink.flush(self.fsync)
+                with self.lock:
+                    self.flushing.discard(sink)
+                    if self._on_flush is not None:
+                        self._on_flush(sink, rows)
+        except Exception as e:
+            self._error = e
+            with self.lock:
+                self.flushing.clear()
+
+
+class NearDuplicateIndex:
+    """MinHash + LSH によるシード値の近似重複インデックス
+
+    シングルは内容語（ASCII以外の語は文字2-gram）と隣り合う内容語の2-gram。
+    プロンプトのルールで全シードに付く定型の書き出し（"I want to", "Can",
+    "Has the ability to" など）と機能語は除くため、共通の型ではなく中身で比べる。
+    NUM_PERM 個のハッシュ関数の最小値（MinHash署名）を BANDS 個の帯に分けて
+    バケットに登録し、同じバケットに入った候補だけを正確なJaccard係数で検証する
+    （件数が増えても全件比較せず、署名の推定誤差で判定がぶれない）。
+
+    NUM_PERM 個のハッシュ値はシングルごとに SHAKE-128 の出力を32bit単位に
+    切り分けて一度に得る（語彙は限られるのでシングル単位でキャッシュする）。
+    """
+
+    NUM_PERM = 32
+    BANDS = 16  # 1帯あたり2行。Jaccard ≈ 0.5 ならほぼ確実に候補に挙がる
+
+    # シードの定型の書き出し（ability / wants の出力ルール・初期シードの型）
+    _TEMPLATE_PREFIX = re.compile(
+        r"^\W*(?:i\s+want\s+to|has\s+the\s+(?:ability|power)\s+to|is\s+able\s+to|possesses|can)\b"
+    )
+    _STOPWORDS = frozenset(
+        "a an the and or but of to in on at by for with from into onto as is are be been was were "
+        "it its their his her they them he she i my me we our you your this that these those who "
+        "which what when where while than then so not no can has have had will would should could".split()
+    )
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self._rows = self.NUM_PERM // self.BANDS
+        self._signatures: list = []
+        self._shingle_sets: list = []
+        self._buckets: list = [{} for _ in range(self.BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @classmethod
+    def shingles(cls, value: str) -> set:
+        text = cls._TEMPLATE_PREFIX.sub("", value.lower())
+        words = [w for w in re.findall(r"\w+", text) if w not in cls._STOPWORDS]
+        result = set()
+        for word in words:
+            if word.isascii() or len(word) < 2:
+                result.add(word)
+            else:
+                result.update(word[i : i + 2] for i in range(len(word) - 1))
+        result.update(f"{a} {b}" for a, b in zip(words, words[1:]) if a.isascii() and b.isascii())
+        return result
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def _shingle_hashes(shingle: str) -> tuple:
+        digest = hashlib.shake_128(shingle.encode("utf-8")).digest(NearDuplicateIndex.NUM_PERM * 4)
+        return tuple(array.array("I", digest))
+
+    def signature(self, value: str, shingles: Optional[set] = None) -> Optional[tuple]:
+        """MinHash署名（シングルが空なら None）"""
+        rows = [self._shingle_hashes(s) for s in (shingles if shingles is not None else self.shingles(value))]
+        if not rows:
+            return None
+        return tuple(map(min, zip(*rows)))
+
+    def _bands(self, sig: tuple):
+        rows = self._rows
+        for band, buckets in enumerate(self._buckets):
+            yield buckets, sig[band * rows : (band + 1) * rows]
+
+    def find(self, value: str, sig: Optional[tuple] = None, shingles: Optional[set] = None) -> Optional[int]:
+        """閾値以上に似た登録済み値の番号（なければ None）"""
+        shingles = shingles if shingles is not None else self.shingles(value)
+        sig = sig if sig is not None else self.signature(value, shingles)
+        if sig is None:
+            return None
+        checked = set()
+        for buckets, key in self._bands(sig):
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                other = self._shingle_sets[candidate]
+                if len(shingles & other) / len(shingles | other) >= self.threshold:
+                    return candidate
+        return None
+
+    def add(self, value: str, sig: Optional[tuple] = None, shingles: Optional[set] = None) -> None:
+        shingles = shingles if shingles is not None else self.shingles(value)
+        sig = sig if sig is not None else self.signature(value, shingles)
+        if sig is None:
+            return
+        number = len(self._signatures)
+        self._signatures.append(sig)
+        self._shingle_sets.append(frozenset(shingles))
+        for buckets, key in self._bands(sig):
+            buckets.setdefault(key, []).append(number)
+
+    def add_if_new(self, value: str) -> bool:
+        """近似重複がなければ登録して True、あれば登録せず False"""
+        shingles = self.shingles(value)
+        sig = self.signature(value, shingles)
+        if sig is not None and self.find(value, sig, shingles) is not None:
+            return False
+        self.add(value, sig, shingles)
+        return True
+
+
+class WeightedSampler:
+    """Fenwick木（BIT）による重み付きサンプラー
+
+    要素 i の重みは 1 / (1 + 使用回数) ** decay。抽選・重み更新・末尾への追加は
+    いずれも O(log n) で、プール全体を走査しない。抽選された要素ほど重みが下がる
+    ため、まだ使われていない値（後から追加された値も初期シードも）が選ばれやすく
+    なり、プール全体を偏りなく使う。decay=0 なら一様抽選。
+    """
+
+    def __init__(self, decay: float = 1.0):
+        self.decay = decay
+        self.total = 0.0
+        self._tree = [0.0]  # 1-indexed。tree[i] は (i - lowbit(i), i] の重みの和
+        self._uses: list = []
+
+    def __len__(self) -> int:
+        return len(self._uses)
+
+    def _weight(self, uses: int) -> float:
+        return 1.0 / (1 + uses) ** self.decay
+
+    def add(self, uses: int = 0) -> None:
+        """末尾に要素を追加"""
+        i = len(self._tree)
+        weight = self._weight(uses)
+        node = weight
+        j, stop = i - 1, i - (i & -i)
+        while j > stop:
+            node += self._tree[j]
+            j -= j & -j
+        self._tree.append(node)
+        self._uses.append(uses)
+        self.total += weight
+
+    def _update(self, index: int, delta: float) -> None:
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+        self.total += delta
+
+    def sample(self, rng=random) -> int:
+        """重みに比例した確率で要素番号を返す"""
+        n = len(self._uses)
+        if not n:
+            raise IndexError("sample from an empty sampler")
+        target = rng.random() * self.total
+        pos = 0
+        step = 1 << (n.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= n and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return min(pos, n - 1)
+
+    def use(self, index: int) -> None:
+        """使用回数を1増やして重みを下げる"""
+        uses = self._uses[index]
+        self._uses[index] = uses + 1
+        self._update(index, self._weight(uses + 1) - self._weight(uses))
+
+    def draw(self, rng=random) -> int:
+        """抽選して使用回数を記録"""
+        index = self.sample(rng)
+        self.use(index)
+        return index
+
+
 class LocalStorage:
     """ローカルCSVストレージ"""
 
@@ -143,17 +2586,65 @@ class LocalStorage:
             "role": self.data_dir / "seed_role.csv",
         }
 
-        # 実行ごとに固有のディレクトリを作成して出力を保存
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        self.run_dir = self.data_dir / f"run_{timestamp}"
-        self.run_dir.mkdir(parents=True, exist_ok=True)
-        self.output_file = self.run_dir / "output.csv"
+        # シード値のメモリキャッシュと、読み込み時のファイル状態 (mtime_ns, size)
+        self._seed_pools: dict = {}
+        self._seed_stats: dict = {}
+        # 追加済みだが未フラッシュのシード値（ファイル再読込時にプールへ足し戻す）
+        self._unflushed_seeds: dict = {key: [] for key in self.seed_files}
+        self._lock = threading.Lock()
+
+        # シード種別ごとの近似重複インデックス（最初の追加時に構築）と棄却数
+        self.seed_dedup_threshold = config.seed_dedup_threshold
+        self._seed_indexes: dict = {}
+        self.seed_rejections: dict = {key: 0 for key in self.seed_files}
+        # シード種別ごとの重み付きサンプラー（プールと同じ並び。追加分は抽選時に反映）
+        self.seed_usage_decay = config.seed_usage_decay
+        self._seed_samplers: dict = {}
+
+        # 実行ごとに固有のディレクトリを作成して出力を保存（再開時は既存のものを使う）
+        if config.resume:
+            self.run_dir = Path(config.resume)
+            if not (self.run_dir / "journal.jsonl").exists():
+                raise FileNotFoundError(f"No journal.jsonl in {self.run_dir}")
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            self.run_dir = self.data_dir / f"run_{timestamp}"
+            self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.metrics_file = self.run_dir / "metrics.jsonl"
+        self.journal_file = self.run_dir / "journal.jsonl"
+        self.journal = RunJournal.load(self.journal_file)
+        if self.journal.header is None:
+            # 実行時の設定は書き込みスレッドを介さず最初に書いておく
+            self.journal.header = {
+                "type": "run",
+                "model": config.model,
+                "num_iterations": config.num_iterations,
+                "structured": config.structured,
+                "session": config.session,
+            }
+            with open(self.journal_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.journal.header, ensure_ascii=False) + "\n")
 
         # シードデータ初期化
         self._ensure_seed_data()
 
-        # 出力ファイルヘッダー作成
-        self._init_output_file()
+        # 出力ファイル作成（再開時はジャーナルから作り直す）
+        self._init_output_file(config)
+        if config.resume:
+            self._restore_seeds()
+            _truncate_partial_line(self.metrics_file)
+
+        # 追記はバックグラウンドの書き込みスレッドで行う
+        self._metrics_sink = JsonlAppender(self.metrics_file)
+        self._journal_sink = JournalAppender(self.journal_file)
+        self._seed_sinks = {key: CsvAppender(path) for key, path in self.seed_files.items()}
+        self._writer = BufferedWriter(
+            flush_rows=config.flush_rows,
+            flush_interval=config.flush_interval,
+            fsync=config.fsync,
+            lock=self._lock,
+            on_flush=self._on_flush,
+        )
 
     def _ensure_seed_data(self) -> None:
         """シードデータがなければ初期データを作成"""
@@ -217,215 +2708,1414 @@ class LocalStorage:
             ],
         }
 
-        for key, seed_file in self.seed_files.items():
-            if not seed_file.exists():
-                print(f"Creating seed file: {seed_file}")
-                with open(seed_file, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    writer.writerow([key])  # ヘッダー
-                    for value in default_seeds[key]:
-                        writer.writerow([value])
+        for key, seed_file in self.seed_files.items():
+            if not seed_file.exists():
+                print(f"Creating seed file: {seed_file}")
+                with open(seed_file, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow([key])  # ヘッダー
+                    for value in default_seeds[key]:
+                        writer.writerow([value])
+
+    def _init_output_file(self, config: Config) -> None:
+        """出力シンクを作り、ジャーナルで確定済みの行を書き込む"""
+        for path in ShardedOutput.existing(self.run_dir):
+            path.unlink()
+        self._output_sink = ShardedOutput(
+            self.run_dir,
+            config.output_format,
+            shard_rows=config.shard_rows,
+            shard_bytes=int(config.shard_mb * 1024 * 1024),
+        )
+        # 書き込みスレッドの開始前なのでこのスレッドから直接書いてよい
+        for index in range(self.journal.committed):
+            row = self.journal.characters[index]["row"]
+            if row is not None:  # 期限切れで飛ばしたキャラクター
+                self._output_sink.write(row)
+        self._output_sink.flush()
+
+    @property
+    def output_file(self) -> Path:
+        """最初の出力ファイル（分割しない場合は唯一の出力ファイル）"""
+        return self._output_sink.paths[0]
+
+    @property
+    def output_files(self) -> list:
+        return list(self._output_sink.paths)
+
+    def _restore_seeds(self) -> None:
+        """確定済みキャラクターのシードのうち、ファイルに届かなかったものを追記
+
+        近似重複で棄却された値は、ファイル上の同じ値に対して再び棄却される。
+        """
+        for attr_type, seed_file in self.seed_files.items():
+            existing = set(self._read_seed_values(seed_file))
+            near = NearDuplicateIndex(self.seed_dedup_threshold)
+            if self.seed_dedup_threshold > 0:
+                for value in existing:
+                    near.add(value)
+            missing = []
+            for index in range(self.journal.committed):
+                value = self.journal.characters[index]["seeds"].get(attr_type)
+                if value is None or value in existing:
+                    continue
+                if self.seed_dedup_threshold > 0 and not near.add_if_new(value):
+                    continue
+                existing.add(value)
+                missing.append(value)
+            if missing:
+                with open(seed_file, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    for value in missing:
+                        writer.writerow([value])
+
+    def _read_seed_values(self, seed_file: Path) -> list:
+        """シードファイルから値を読み込む"""
+        with open(seed_file, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader)  # ヘッダースキップ
+            return [row[0] for row in reader if row]
+
+    def _seed_stat(self, seed_file: Path) -> tuple:
+        stat = seed_file.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _seed_pool(self, attr_type: str) -> list:
+        """メモリ上のシード値リストを返す（ファイルが外部で変更されていれば再読込）
+
+        self._lock を保持した状態で呼ぶこと。書き込みスレッドが書き出し中のファイルは
+        読み直さない（書き出した分は _on_flush で未フラッシュ分から外れる）。
+        """
+        if attr_type in self._seed_pools and self._seed_sinks[attr_type] in self._writer.flushing:
+            return self._seed_pools[attr_type]
+        seed_file = self.seed_files[attr_type]
+        stat = self._seed_stat(seed_file)
+        if self._seed_stats.get(attr_type) != stat:
+            values = self._read_seed_values(seed_file)
+            self._seed_pools[attr_type] = values + self._unflushed_seeds[attr_type]
+            self._seed_stats[attr_type] = stat
+            # 外部で追記された値を含めて作り直す
+            self._seed_indexes.pop(attr_type, None)
+        return self._seed_pools[attr_type]
+
+    def _seed_index(self, attr_type: str) -> NearDuplicateIndex:
+        """シードプールの近似重複インデックス（self._lock を保持した状態で呼ぶこと）"""
+        pool = self._seed_pool(attr_type)
+        index = self._seed_indexes.get(attr_type)
+        if index is None:
+            index = NearDuplicateIndex(self.seed_dedup_threshold)
+            for value in pool:
+                index.add(value)
+            self._seed_indexes[attr_type] = index
+        return index
+
+    def _seed_sampler(self, attr_type: str, pool: list) -> WeightedSampler:
+        """プールに対応するサンプラー（self._lock を保持した状態で呼ぶこと）
+
+        プールへの追加分だけを末尾に足す。外部編集でプールが縮んだ場合のみ作り直す。
+        """
+        sampler = self._seed_samplers.get(attr_type)
+        if sampler is None or len(sampler) > len(pool):
+            sampler = WeightedSampler(self.seed_usage_decay)
+            self._seed_samplers[attr_type] = sampler
+        while len(sampler) < len(pool):
+            sampler.add()
+        return sampler
+
+    def get_random_attribute(self, attr_type: str) -> str:
+        """使用回数の少ない値を優先してランダムに属性を取得"""
+        with self._lock:
+            pool = self._seed_pool(attr_type)
+            return pool[self._seed_sampler(attr_type, pool).draw()]
+
+    def append_output(self, row: list) -> None:
+        """出力ファイルに行を追加（書き込みスレッドへ委譲）"""
+        self._writer.submit(self._output_sink, row)
+
+    def append_metrics(self, record: dict) -> None:
+        """推論1回分の計測値を metrics.jsonl に追加（書き込みスレッドへ委譲）"""
+        self._writer.submit(self._metrics_sink, record)
+
+    def append_journal(self, record: dict) -> None:
+        """実行ジャーナルにレコードを追加（書き込みスレッドへ委譲）"""
+        self._writer.submit(self._journal_sink, record)
+
+    def append_seed(self, attr_type: str, value: str) -> bool:
+        """シードデータに新しい値を追加（メモリ上のプールには即時反映）
+
+        既存の値と近似重複する値は追加せず False を返す。
+        """
+        with self._lock:
+            if self.seed_dedup_threshold > 0 and not self._seed_index(attr_type).add_if_new(value):
+                self.seed_rejections[attr_type] += 1
+                return False
+            self._seed_pool(attr_type).append(value)
+            self._unflushed_seeds[attr_type].append(value)
+        self._writer.submit(self._seed_sinks[attr_type], [value])
+        return True
+
+    def _on_flush(self, sink: FileAppender, rows: int) -> None:
+        """書き込みスレッドのフラッシュ完了通知（self._lock 保持中に呼ばれる）"""
+        for attr_type, seed_sink in self._seed_sinks.items():
+            if sink is seed_sink:
+                del self._unflushed_seeds[attr_type][:rows]
+                if attr_type in self._seed_stats:
+                    self._seed_stats[attr_type] = self._seed_stat(sink.path)
+
+    def flush(self) -> None:
+        """書き込み待ちの行を全てファイルへ書き出す"""
+        self._writer.flush()
+
+    def close(self) -> None:
+        """書き込みスレッドを終了（残りの行はフラッシュされる）"""
+        self._writer.close()
+
+
+# =============================================================================
+# Prompts
+# =============================================================================
+
+
+class Prompts:
+    """Ollama最適化プロンプト"""
+
+    @staticmethod
+    def character_concept(physical: str, role: str, ability: str, wants: str) -> str:
+        return f"""以下のキャラクター属性を、重要な要素を損なわないように要約し、英文1段落で出力してください。
+
+## 属性
+- 身体的特徴: {physical}
+- 役割: {role}
+- 能力: {ability}
+- 願望: {wants}
+
+## ルール
+- 英語で出力
+- 1段落のみ
+- 説明や補足は不要
+
+## 出力"""
+
+    # concept から派生する6タスクのテンプレート: (指示文, 設定セクション見出し, ルール以降)
+    # 通常は「指示 → 設定 → ルール」の順、セッションモードでは設定を共有プレフィックスに
+    # 切り出し「上記の〜」で始まる指示とルールだけを送る。
+    _DERIVED_TEMPLATES = {
+        "name": (
+            "以下のキャラクター設定にふさわしい人名を1つ生成してください。",
+            "キャラクター設定",
+            """## ルール
+- 名前のみを出力（説明不要）
+- 英語表記
+- 国籍・文化・架空言語の名前も可
+- 1行のみ
+
+## 出力例
+Kain Astralion
+Yuichi Aihara
+
+## 出力""",
+        ),
+        "profile": (
+            "以下のキャラクター設定を日本語で説明してください。",
+            "キャラクター設定",
+            """## ルール
+- 日本語で出力
+- 性別不明・They の場合は「彼は」を使用
+- 1段落のみ
+
+## 出力例
+彼はプリティーンのノンバイナリー半人半神で、デジタル栄養コンサルタントとして活動しています。
+
+## 出力""",
+        ),
+        "catchphrase": (
+            "以下のキャラクターの意思を表す印象的な決め台詞を生成してください。",
+            "キャラクター設定",
+            """## ルール
+- 日本語で出力
+- キャラクターにふさわしい口調
+- 一人称から始める
+- 1文のみ
+
+## 出力例
+私は、歴史の断片を手に取り、宇宙の隅々に宿る感情を感じ取るよ。
+
+## 出力""",
+        ),
+        "new_ability": (
+            "以下のキャラクターと対になるキャラクターが持つ特殊能力を1つ生成してください。",
+            "元キャラクター",
+            """## ルール
+- 英語で出力
+- 能力名と説明を1文で
+- 1つのみ
+
+## 出力例
+Has the ability to materialize memories: Can share past events with others.
+
+## 出力""",
+        ),
+        "new_wants": (
+            "以下のキャラクターと対になるキャラクターの切実な願望を1つ生成してください。",
+            "元キャラクター",
+            """## ルール
+- 英語で出力
+- "I want to..." の形式
+- 1文のみ
+
+## 出力例
+I want to establish a new human settlement in space.
+
+## 出力""",
+        ),
+        "new_role": (
+            "以下のキャラクターと対になるキャラクターのユニークな役割を1つ生成してください。",
+            "元キャラクター",
+            """## ルール
+- 英語で出力
+- 役割名と説明
+- 1つのみ
+
+## 出力例
+Swordsman. Skilled in the art of swordsmanship with a strong sense of duty.
+
+## 出力""",
+        ),
+    }
+
+    @classmethod
+    def _derived(cls, task: str, concept: str) -> str:
+        instruction, section, rules = cls._DERIVED_TEMPLATES[task]
+        return f"{instruction}\n\n## {section}\n{concept}\n\n{rules}"
+
+    @staticmethod
+    def name(concept: str) -> str:
+        return Prompts._derived("name", concept)
+
+    @staticmethod
+    def profile(concept: str) -> str:
+        return Prompts._derived("profile", concept)
+
+    @staticmethod
+    def catchphrase(concept: str) -> str:
+        return Prompts._derived("catchphrase", concept)
+
+    @staticmethod
+    def new_ability(concept: str) -> str:
+        return Prompts._derived("new_ability", concept)
+
+    @staticmethod
+    def new_wants(concept: str) -> str:
+        return Prompts._derived("new_wants", concept)
+
+    @staticmethod
+    def new_role(concept: str) -> str:
+        return Prompts._derived("new_role", concept)
+
+    # -------------------------------------------------------------------------
+    # セッションモード（共有プレフィックス + タスク別の指示）
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def concept_context(concept: str) -> str:
+        """1キャラクターの全派生タスクで共通のプレフィックス"""
+        return f"## キャラクター設定\n{concept}"
+
+    @classmethod
+    def followup(cls, task: str) -> str:
+        """concept_context の後に送るタスク別の指示（設定本文を含まない）"""
+        instruction, _, rules = cls._DERIVED_TEMPLATES[task]
+        return f"{instruction.replace('以下の', '上記の', 1)}\n\n{rules}"
+
+    # -------------------------------------------------------------------------
+    # 構造化出力モード（Ollamaの format にJSONスキーマを渡す）
+    # -------------------------------------------------------------------------
+
+    CHARACTER_SHEET_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "profile": {"type": "string"},
+            "catchphrase": {"type": "string"},
+        },
+        "required": ["name", "profile", "catchphrase"],
+    }
+
+    COUNTERPART_SEEDS_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "new_ability": {"type": "string"},
+            "new_wants": {"type": "string"},
+            "new_role": {"type": "string"},
+        },
+        "required": ["new_ability", "new_wants", "new_role"],
+    }
+
+    @staticmethod
+    def character_sheet(concept: str) -> str:
+        return f"""以下のキャラクター設定から、名前・プロフィール・決め台詞を生成し、JSONで出力してください。
+
+## キャラクター設定
+{concept}
+
+## ルール
+- name: キャラクターにふさわしい人名を1つ（英語表記、国籍・文化・架空言語の名前も可、説明不要）
+- profile: キャラクター設定の日本語による説明（1段落、性別不明・They の場合は「彼は」を使用）
+- catchphrase: キャラクターの意思を表す印象的な決め台詞（日本語、キャラクターにふさわしい口調、一人称から始める、1文のみ）
+
+## 出力例
+{{"name": "Kain Astralion", "profile": "彼はプリティーンのノンバイナリー半人半神で、デジタル栄養コンサルタントとして活動しています。", "catchphrase": "私は、歴史の断片を手に取り、宇宙の隅々に宿る感情を感じ取るよ。"}}
+
+## 出力"""
+
+    @staticmethod
+    def counterpart_seeds(concept: str) -> str:
+        return f"""以下のキャラクターと対になるキャラクターの特殊能力・願望・役割を1つずつ生成し、JSONで出力してください。
+
+## 元キャラクター
+{concept}
+
+## ルール
+- new_ability: 特殊能力（英語、能力名と説明を1文で）
+- new_wants: 切実な願望（英語、"I want to..." の形式、1文のみ）
+- new_role: ユニークな役割（英語、役割名と説明）
+
+## 出力例
+{{"new_ability": "Has the ability to materialize memories: Can share past events with others.", "new_wants": "I want to establish a new human settlement in space.", "new_role": "Swordsman. Skilled in the art of swordsmanship with a strong sense of duty."}}
+
+## 出力"""
+
+    # -------------------------------------------------------------------------
+    # 出力の検証（各テンプレートの「ルール」を機械的に確認できる範囲で）
+    # -------------------------------------------------------------------------
+
+    _JAPANESE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+    _FIRST_PERSON = ("私", "僕", "俺", "我", "わたし", "あたし", "ぼく", "おれ", "わし", "儂", "拙者", "うち", "自分", "余")
+
+    # ルール名 → 検査関数（True なら適合）
+    RULE_CHECKS = {
+        "single_line": lambda v: "\n" not in v,
+        "single_paragraph": lambda v: not re.search(r"\n\s*\n", v),
+        "english": lambda v: not Prompts._JAPANESE.search(v),
+        "japanese": lambda v: len(Prompts._JAPANESE.findall(v)) >= len(re.findall(r"[A-Za-z]", v)),
+        # 文末以外に文の区切りがない（「！？」のような連続は1つと数える）
+        "one_sentence": lambda v: not re.search(r"[。！？!?]+(?=\S)|[.](?=\s+\S)", v.rstrip("。！？!?.」』\"' ")),
+        "short": lambda v: len(v.split()) <= 5 and not re.search(r"[:：()（）,、。]", v),
+        "i_want_to": lambda v: v.lstrip("\"'").startswith("I want to"),
+        "first_person": lambda v: v.lstrip("「『\"' ").startswith(Prompts._FIRST_PERSON),
+    }
+
+    # フィールド（タスク名）→ 適用するルール
+    RULES = {
+        "concept": ("english", "single_paragraph"),
+        "name": ("single_line", "english", "short"),
+        "profile": ("japanese", "single_paragraph"),
+        "catchphrase": ("japanese", "single_line", "one_sentence", "first_person"),
+        "new_ability": ("english", "single_line"),
+        "new_wants": ("english", "single_line", "one_sentence", "i_want_to"),
+        "new_role": ("english", "single_line"),
+    }
+
+    @classmethod
+    def validate(cls, name: str, value: str) -> list:
+        """value が違反したフィールド name のルール名のリスト（ルールのないフィールドは常に空）"""
+        return [rule for rule in cls.RULES.get(name, ()) if not cls.RULE_CHECKS[rule](value)]
+
+
+# =============================================================================
+# Image Prompt Generation
+# =============================================================================
+
+
+def generate_image_prompt(concept: str) -> str:
+    """画像プロンプト生成（固定テンプレート）"""
+    subject = (
+        "The full-length character illustration from video games, "
+        "likely from role-playing games(JRPG) or fighting games."
+    )
+    angle = "A camera angle that captures the entire body evenly from waist height."
+    pose = (
+        "Standing upright and looking straight ahead, his pose visually conveys "
+        "role, personality, attitude, ability, cultural background and physical attractiveness."
+    )
+    background = "white background."
+    artstyle = (
+        "The art style combines delicate hand-drawn lines with exaggerated "
+        "expressions influenced by Japanese manga and anime."
+    )
+
+    return f"{subject} {angle} {pose} {background} {concept}, {artstyle}"
+
+
+# =============================================================================
+# Generation Engine
+# =============================================================================
+
+
+class TaskGraph:
+    """1キャラクター分の推論タスクを表す小さな依存グラフ
+
+    各ノードは依存ノードの結果を引数に取るコルーチン関数。依存が揃った
+    ノードから同時に実行され、run() は全ノードの完了を待って結果を返す。
+    ノードは依存先より後に追加すること。
+
+    run() に done（ノード名 → 結果）を渡すと、そのノードは実行せず結果を
+    そのまま使う。on_result は新たに完了したノードごとに呼ばれる。
+
+    background=True のノードは run() の完了を待たずに走り続け、run() の後に
+    pending（ノード名 → Future）から結果を受け取る。他のノードの依存先にはできない。
+    """
+
+    def __init__(self):
+        self._nodes: dict = {}
+        self._background: set = set()
+        self.pending: dict = {}
+
+    def add(self, name: str, fn, deps: tuple = (), background: bool = False) -> None:
+        missing = [d for d in deps if d not in self._nodes]
+        if missing:
+            raise ValueError(f"Unknown dependencies for {name}: {missing}")
+        waiting = [d for d in deps if d in self._background]
+        if waiting:
+            raise ValueError(f"{name} cannot depend on background nodes: {waiting}")
+        self._nodes[name] = (deps, fn)
+        if background:
+            self._background.add(name)
+
+    async def run(self, done: Optional[dict] = None, on_result=None) -> dict:
+        futures: dict = {}
+        done = done or {}
+
+        async def run_node(name: str):
+            if name in done:
+                return done[name]
+            deps, fn = self._nodes[name]
+            args = [await futures[d] for d in deps]
+            result = await fn(*args)
+            if on_result is not None:
+                on_result(name, result)
+            return result
+
+        for name in self._nodes:
+            futures[name] = asyncio.ensure_future(run_node(name))
+        foreground = [name for name in futures if name not in self._background]
+        try:
+            results = await asyncio.gather(*(futures[name] for name in foreground))
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            await asyncio.gather(*futures.values(), return_exceptions=True)
+            raise
+        self.pending = {name: futures[name] for name in futures if name in self._background}
+        return dict(zip(foreground, results))
+
+
+class GenerationEngine:
+    """asyncioによる並行キャラクター生成エンジン
+
+    最大 concurrency 件のキャラクターを同時に生成し、完了したものから
+    インデックス順に並べ直して出力する。output.csv の行順とシード追加順は
+    逐次実行時と同じ規則（キャラクター番号順）に保たれる。
+
+    サンプリングした属性・完了した推論・確定したキャラクターは実行ジャーナルに
+    記録され、--resume ではジャーナルに残った分を飛ばして続きから生成する。
+
+    優先度付きスケジューリング（config.priority）では、シード進化のタスクを
+    低優先度で発行してキャラクターの確定を待たせない。シードは進化タスクの完了後に
+    インデックス順で追加し、期限切れ・失敗したものは追加しない。
+    """
+
+    # concept のみに依存するタスク（conceptの生成後に同時実行される）
+    CONCEPT_TASKS = {
+        "name": Prompts.name,
+        "profile": Prompts.profile,
+        "catchphrase": Prompts.catchphrase,
+        "new_ability": Prompts.new_ability,
+        "new_wants": Prompts.new_wants,
+        "new_role": Prompts.new_role,
+    }
+
+    # 構造化出力モードのタスク（1回の推論でJSONの複数フィールドを得る）
+    STRUCTURED_TASKS = {
+        "character_sheet": (Prompts.character_sheet, Prompts.CHARACTER_SHEET_SCHEMA),
+        "counterpart_seeds": (Prompts.counterpart_seeds, Prompts.COUNTERPART_SEEDS_SCHEMA),
+    }
+
+    # 対キャラ属性タスクと追加先シードの対応
+    SEED_TASKS = {
+        "new_ability": "ability",
+        "new_wants": "wants",
+        "new_role": "role",
+    }
+
+    # 優先度付きスケジューリングでバックグラウンドに回すタスク（キャラクターの確定に不要）
+    BACKGROUND_TASKS = frozenset(SEED_TASKS) | {"counterpart_seeds"}
+
+    def __init__(self, config: Config, llm: AsyncOllamaInference, storage: LocalStorage):
+        self.config = config
+        self.llm = llm
+        self.storage = storage
+        self.journal = storage.journal
+        # 確定済みのキャラクターは飛ばす（ジャーナルでは常に先頭から連続）
+        self.resumed = self.journal.committed
+        self._next_index = self.resumed
+        self._next_commit = self.resumed
+        self._finished: dict = {}
+        # バックグラウンドのシード進化（インデックス → シード）と、その追加位置
+        self._evolved: dict = {}
+        self._next_seed_commit = self.resumed
+        self._seed_jobs: list = []
+        self.seeds_dropped = 0
+        # 時間予算（キャラクター単位で超えたら飛ばし、実行全体で超えたら新規生成をやめる）
+        self.skipped = 0
+        self.deadline_reached = False
+        self._run_deadline: Optional[float] = None
+        self.reused_calls = 0
+        # セッションモードのプリフィル集計
+        self.prompt_eval_total = 0
+        self.prompt_reused_total = 0
+        # イベントループ上で属性サンプリング・ストレージ呼び出しに費やした時間（秒）
+        self.sampling_time = 0.0
+        self.storage_time = 0.0
+        # run() 開始から最初のキャラクター確定までの秒数
+        self.first_character_time: Optional[float] = None
+        self._started = 0.0
+
+    async def run(self) -> None:
+        """全キャラクターを生成（いずれかが失敗したら残りをキャンセル）"""
+        self._started = time.perf_counter()
+        if self.config.run_deadline > 0:
+            self._run_deadline = time.monotonic() + self.config.run_deadline
+        # 適応モードでは同時推論数をリミッターが絞るので、上限まで需要を用意しておく
+        count = self.config.concurrency
+        if getattr(self.llm, "limiter", None) is not None:
+            count = max(count, self.config.max_in_flight)
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(max(1, count))]
+        try:
+            await asyncio.gather(*workers)
+            # 全キャラクターの確定後、残ったシード進化を空いた枠で流し切る
+            await asyncio.gather(*self._seed_jobs)
+        except BaseException:
+            jobs = workers + self._seed_jobs
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            raise
+
+    async def _worker(self) -> None:
+        while self._next_index < self.config.num_iterations:
+            if self._run_expired():
+                self.deadline_reached = True
+                return
+            index = self._next_index
+            self._next_index += 1
+            print(f"\n[{index + 1}/{self.config.num_iterations}] Generating character...")
+            try:
+                character, new_seeds = await self.generate_character(index)
+            except DeadlineExceeded as e:
+                if self._run_expired():
+                    # 生成途中のキャラクターはジャーナルに残り、--resume で続きから生成できる
+                    self.deadline_reached = True
+                    return
+                print(f"  [{index + 1}] Skipped: {e}")
+                self.skipped += 1
+                character, new_seeds = None, None
+            self._commit(index, character, new_seeds)
+
+    @property
+    def committed(self) -> int:
+        """書き出し済み（期限切れで飛ばしたものを含む）のキャラクター数"""
+        return self._next_commit
+
+    def _run_expired(self) -> bool:
+        return self._run_deadline is not None and time.monotonic() >= self._run_deadline
+
+    def _character_deadline(self) -> Optional[float]:
+        """1キャラクターの推論期限（キャラクター単位・実行全体の早い方）"""
+        deadlines = [self._run_deadline]
+        if self.config.character_deadline > 0:
+            deadlines.append(time.monotonic() + self.config.character_deadline)
+        return min((d for d in deadlines if d is not None), default=None)
+
+    def character_graph(
+        self,
+        physical: str,
+        role: str,
+        ability: str,
+        wants: str,
+        usage: Optional[list] = None,
+        index: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> TaskGraph:
+        """concept → 依存タスク の依存グラフを組み立てる
+
+        通常モードは concept → 6タスク（各1フィールド）、構造化出力モードは
+        concept → character_sheet / counterpart_seeds（各3フィールドをJSONで）。
+        セッションモードでは usage に派生タスクのトークン数を記録する。
+        deadline はキャラクターの推論期限（バックグラウンドのタスクには実行全体の期限を使う）。
+        """
+        llm = self.llm
+        graph = TaskGraph()
+        priority = self._priority
+
+        def until(task: str) -> Optional[float]:
+            return self._run_deadline if self._is_background(task) else deadline
+
+        async def concept():
+            prompt = Prompts.character_concept(physical, role, ability, wants)
+            return await llm.generate(
+                prompt, task="concept", index=index, priority=PRIORITY_CRITICAL, deadline=deadline
+            )
+
+        graph.add("concept", concept)
+
+        if self.config.structured:
+            for task, (template, schema) in self.STRUCTURED_TASKS.items():
+
+                async def structured(concept: str, task=task, template=template, schema=schema):
+                    generated = await llm.generate_json(
+                        template(concept),
+                        schema,
+                        task=task,
+                        index=index,
+                        priority=priority(task),
+                        deadline=until(task),
+                    )
+                    return await self._repair_fields(generated, concept, index, priority(task), until(task))
+
+                graph.add(task, structured, deps=("concept",), background=self._is_background(task))
+            return graph
+
+        if self.config.session:
+            return self._session_graph(graph, usage, index, until)
+
+        for task, template in self.CONCEPT_TASKS.items():
+
+            async def derived(concept: str, task=task, template=template):
+                return await llm.generate(
+                    template(concept), task=task, index=index, priority=priority(task), deadline=until(task)
+                )
+
+            graph.add(task, derived, deps=("concept",), background=self._is_background(task))
+        return graph
+
+    async def _repair_fields(
+        self, generated: dict, concept: str, index: Optional[int], priority: int, deadline: Optional[float]
+    ) -> dict:
+        """構造化出力のうちルールに違反したフィールドだけを単独のプロンプトで再生成"""
+        if not self.config.validate:
+            return generated
+        failing = []
+        for name, value in generated.items():
+            failed = self.llm.check(name, value)
+            if failed:
+                print(f"Regenerating {name} ({', '.join(failed)}): {value[:40]!r}")
+                failing.append(name)
+        self.llm.regenerations += len(failing)
+        values = await asyncio.gather(
+            *(
+                self.llm.generate(
+                    self.CONCEPT_TASKS[name](concept),
+                    task=name,
+                    index=index,
+                    priority=priority,
+                    deadline=deadline,
+                )
+                for name in failing
+            )
+        )
+        return {**generated, **dict(zip(failing, values))}
+
+    def _is_background(self, task: str) -> bool:
+        return self.config.priority and task in self.BACKGROUND_TASKS
+
+    def _priority(self, task: str) -> int:
+        return PRIORITY_BACKGROUND if self._is_background(task) else PRIORITY_CRITICAL
+
+    def _session_graph(
+        self, graph: TaskGraph, usage: Optional[list], index: Optional[int], until
+    ) -> TaskGraph:
+        """共有プレフィックス (system + concept) を先頭に固定したセッションモード
+
+        最初のタスクだけを先に送ってサーバー側のプロンプトキャッシュを温め、
+        残りのタスクはそのプレフィックスを再利用できる状態で同時に発行する。
+        """
+        llm = self.llm
+        first, *rest = self.CONCEPT_TASKS
+
+        async def followup(concept: str, *_warm, task: str):
+            return await llm.generate(
+                Prompts.followup(task),
+                task=task,
+                context=Prompts.concept_context(concept),
+                usage=usage,
+                index=index,
+                priority=self._priority(task),
+                deadline=until(task),
+            )
+
+        graph.add(first, functools.partial(followup, task=first), deps=("concept",))
+        for task in rest:
+            graph.add(
+                task,
+                functools.partial(followup, task=task),
+                deps=("concept", first),
+                background=self._is_background(task),
+            )
+        return graph
+
+    async def generate_character(self, index: int) -> tuple:
+        """1キャラクター分の推論を実行し (Character, 新規シード) を返す"""
+        storage = self.storage
 
-    def _init_output_file(self) -> None:
-        """出力ファイルのヘッダーを書き込む"""
-        headers = [
-            "name",
-            "profile",
-            "catchphrase",
-            "image_prompt",
-            "concept",
-            "age",
-            "gender",
-            "species",
-            "ability",
-            "wants",
-            "role",
-        ]
-        with open(self.output_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
+        # 属性取得（中断したキャラクターはジャーナルに記録した属性を再利用）
+        attributes = self.journal.attributes.get(index)
+        if attributes is None:
+            started = time.perf_counter()
+            attributes = {
+                attr: storage.get_random_attribute(attr)
+                for attr in ("age", "gender", "species", "ability", "wants", "role")
+            }
+            self.sampling_time += time.perf_counter() - started
+            storage.append_journal({"type": "start", "index": index, "attributes": attributes})
+        age, gender, species = attributes["age"], attributes["gender"], attributes["species"]
+        physical = f"{age} {gender} {species}"
+        ability, wants, role = attributes["ability"], attributes["wants"], attributes["role"]
 
-    def _read_seed_values(self, seed_file: Path) -> list:
-        """シードファイルから値を読み込む"""
-        with open(seed_file, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            next(reader)  # ヘッダースキップ
-            return [row[0] for row in reader if row]
+        def journal_call(task: str, result) -> None:
+            storage.append_journal({"type": "call", "index": index, "task": task, "result": result})
 
-    def get_random_attribute(self, attr_type: str) -> str:
-        """ランダムに属性を取得"""
-        seed_file = self.seed_files[attr_type]
-        values = self._read_seed_values(seed_file)
-        return random.choice(values)
+        # 推論（conceptのみ逐次、依存タスクは同時実行。完了済みのタスクは再実行しない）
+        done = self.journal.calls.get(index, {})
+        self.reused_calls += len(done)
+        usage: list = []
+        graph = self.character_graph(physical, role, ability, wants, usage, index, self._character_deadline())
+        results = {}
+        for task, value in (await graph.run(done, journal_call)).items():
+            # 構造化出力のタスクはフィールド名 → 値 の辞書を返す
+            if isinstance(value, dict):
+                results.update(value)
+            else:
+                results[task] = value
+        concept = results["concept"]
 
-    def append_output(self, row: list) -> None:
-        """出力ファイルに行を追加"""
-        with open(self.output_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(row)
+        character = Character(
+            name=results["name"],
+            profile=results["profile"],
+            catchphrase=results["catchphrase"],
+            image_prompt=generate_image_prompt(concept),
+            concept=concept,
+            age=age,
+            gender=gender,
+            species=species,
+            ability=ability,
+            wants=wants,
+            role=role,
+        )
 
-    def append_seed(self, attr_type: str, value: str) -> None:
-        """シードデータに新しい値を追加"""
-        seed_file = self.seed_files[attr_type]
-        with open(seed_file, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([value])
+        if usage:
+            self._report_prefix_reuse(index, usage)
+
+        if graph.pending:
+            # シード進化は確定を待たずにバックグラウンドで続ける
+            self._seed_jobs.append(asyncio.ensure_future(self._evolve_seeds(index, graph.pending)))
+            return character, None
+
+        # 対キャラの属性（全タスク完了後にまとめて追加）
+        new_seeds = {attr: results[task] for task, attr in self.SEED_TASKS.items()}
+        return character, new_seeds
+
+    async def _evolve_seeds(self, index: int, pending: dict) -> None:
+        """バックグラウンドのシード進化タスクを待ち、得られたシードを追加待ちに積む"""
+        outcomes = await asyncio.gather(*pending.values(), return_exceptions=True)
+        results = {}
+        for task, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                # 期限切れ・失敗したシード進化はキャラクターの出力には影響させない
+                if not isinstance(outcome, (TaskDropped, DeadlineExceeded)):
+                    print(f"  [{index + 1}] Seed evolution failed ({task}): {outcome}")
+                continue
+            if isinstance(outcome, BaseException):
+                raise outcome
+            if isinstance(outcome, dict):
+                results.update(outcome)
+            else:
+                results[task] = outcome
+        seeds = {attr: results[task] for task, attr in self.SEED_TASKS.items() if task in results}
+        self.seeds_dropped += len(self.SEED_TASKS) - len(seeds)
+        self._evolved[index] = seeds
+        self._commit_seeds()
+
+    def _report_prefix_reuse(self, index: int, usage: list) -> None:
+        """セッションモードのプリフィル削減量（推定）を表示・集計
+
+        最初の（キャッシュが温まる前の）リクエストが共有プレフィックス全体を評価し、
+        後続はキャッシュ済み部分を評価しない。後続の評価トークン数と最初の評価
+        トークン数との差を、再利用されたトークン数の推定値とする。
+        """
+        counts = [u["prompt_eval_count"] for u in usage]
+        evaluated = sum(counts)
+        reused = sum(max(0, counts[0] - c) for c in counts[1:])
+        self.prompt_eval_total += evaluated
+        self.prompt_reused_total += reused
+        print(
+            f"  [{index + 1}] Prefill: {evaluated} prompt tokens evaluated "
+            f"(~{reused} reused from shared prefix)"
+        )
+
+    def _commit(self, index: int, character: Optional[Character], new_seeds: Optional[dict]) -> None:
+        """完了したキャラクターをインデックス順に書き出す
+
+        new_seeds が None のキャラクターはシード進化がバックグラウンドで続いており、
+        シードは後から _commit_seeds() で追加する。character が None のものは
+        期限切れで飛ばしたキャラクター（ジャーナルには row: null で記録）。
+        """
+        if character is None:
+            self._evolved[index] = {}
+        self._finished[index] = (character, new_seeds)
+        while self._next_commit in self._finished:
+            character, new_seeds = self._finished.pop(self._next_commit)
+            started = time.perf_counter()
+            row = character.to_row() if character is not None else None
+            # ジャーナルを先に積む（同じか後のフラッシュでしか出力・シードは書かれない）
+            self.storage.append_journal(
+                {"type": "character", "index": self._next_commit, "row": row, "seeds": new_seeds or {}}
+            )
+            if row is not None:
+                self.storage.append_output(row)
+            for attr_type, value in (new_seeds or {}).items():
+                self.storage.append_seed(attr_type, value)
+            if new_seeds is not None:
+                self._next_seed_commit = self._next_commit + 1
+            self.storage_time += time.perf_counter() - started
+            if self.first_character_time is None:
+                self.first_character_time = time.perf_counter() - self._started
+            self._next_commit += 1
+            if character is not None:
+                print(f"  [{self._next_commit}/{self.config.num_iterations}] Name: {character.name}")
+        self._commit_seeds()
+
+    def _commit_seeds(self) -> None:
+        """バックグラウンドで得たシードを、確定済みキャラクターのインデックス順に追加"""
+        while self._next_seed_commit < self._next_commit and self._next_seed_commit in self._evolved:
+            index = self._next_seed_commit
+            seeds = self._evolved.pop(index)
+            started = time.perf_counter()
+            if seeds:
+                self.storage.append_journal({"type": "seeds", "index": index, "seeds": seeds})
+            for attr_type, value in seeds.items():
+                self.storage.append_seed(attr_type, value)
+            self.storage_time += time.perf_counter() - started
+            self._next_seed_commit += 1
 
 
 # =============================================================================
-# Prompts
+# Run Catalog
 # =============================================================================
 
 
-class Prompts:
-    """Ollama最適化プロンプト"""
+class RunCatalog:
+    """複数の実行ディレクトリを横断するSQLiteカタログ
 
-    @staticmethod
-    def character_concept(physical: str, role: str, ability: str, wants: str) -> str:
-        return f"""以下のキャラクター属性を、重要な要素を損なわないように要約し、英文1段落で出力してください。
+    run_* ディレクトリの出力・ジャーナル・metrics.jsonl を取り込み、キャラクターを
+    種族・役割・モデル・日時で索引付けする。プロフィール等は FTS5（trigram、
+    日本語の部分一致に対応）で全文検索できる。取り込み済みの実行は出力ファイルの
+    サイズと更新時刻（fingerprint）が変わっていなければ読み飛ばす。
+    """
 
-## 属性
-- 身体的特徴: {physical}
-- 役割: {role}
-- 能力: {ability}
-- 願望: {wants}
+    COLUMNS = Character.headers()
+    # 全文検索の対象カラム
+    FTS_COLUMNS = ("name", "profile", "catchphrase", "concept")
 
-## ルール
-- 英語で出力
-- 1段落のみ
-- 説明や補足は不要
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{c} TEXT COLLATE NOCASE" for c in self.COLUMNS)
+        fts_columns = ", ".join(self.FTS_COLUMNS)
+        new_fts = ", ".join(f"new.{c}" for c in self.FTS_COLUMNS)
+        old_fts = ", ".join(f"old.{c}" for c in self.FTS_COLUMNS)
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                model TEXT,
+                started_at TEXT,
+                ingested_at TEXT NOT NULL,
+                characters INTEGER NOT NULL,
+                calls INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                inference_seconds REAL NOT NULL,
+                eval_tokens INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS characters (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL REFERENCES runs(run_id),
+                idx INTEGER NOT NULL,
+                {columns}
+            );
+            CREATE INDEX IF NOT EXISTS characters_run ON characters(run_id, idx);
+            CREATE INDEX IF NOT EXISTS characters_species ON characters(species);
+            CREATE INDEX IF NOT EXISTS characters_role ON characters(role);
+            CREATE INDEX IF NOT EXISTS characters_name ON characters(name);
+            CREATE INDEX IF NOT EXISTS runs_started ON runs(started_at);
+            CREATE INDEX IF NOT EXISTS runs_model ON runs(model);
+            CREATE VIRTUAL TABLE IF NOT EXISTS characters_fts USING fts5(
+                {fts_columns}, content='characters', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS characters_ai AFTER INSERT ON characters BEGIN
+                INSERT INTO characters_fts(rowid, {fts_columns}) VALUES (new.id, {new_fts});
+            END;
+            CREATE TRIGGER IF NOT EXISTS characters_ad AFTER DELETE ON characters BEGIN
+                INSERT INTO characters_fts(characters_fts, rowid, {fts_columns})
+                VALUES ('delete', old.id, {old_fts});
+            END;
+            """
+        )
 
-## 出力"""
+    @staticmethod
+    def fingerprint(run_dir: Path) -> str:
+        """出力ファイルのサイズ・更新時刻（再開・追記されたら変わる）"""
+        parts = []
+        for path in ShardedOutput.existing(run_dir):
+            stat = path.stat()
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(parts)
 
     @staticmethod
-    def name(concept: str) -> str:
-        return f"""以下のキャラクター設定にふさわしい人名を1つ生成してください。
+    def _started_at(run_dir: Path) -> Optional[str]:
+        """run_YYYYMMDD_HHMMSS[_ffffff] から開始時刻（ISO 8601）を得る"""
+        stamp = run_dir.name[len("run_") :]
+        for fmt in ("%Y%m%d_%H%M%S_%f", "%Y%m%d_%H%M%S"):
+            try:
+                return datetime.strptime(stamp, fmt).isoformat()
+            except ValueError:
+                continue
+        return None
 
-## キャラクター設定
-{concept}
+    @staticmethod
+    def _run_metrics(run_dir: Path) -> dict:
+        totals = {"calls": 0, "errors": 0, "inference_seconds": 0.0, "eval_tokens": 0}
+        metrics_file = run_dir / "metrics.jsonl"
+        if not metrics_file.exists():
+            return totals
+        with open(metrics_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 書きかけの最終行
+                if record.get("status") == "cached":
+                    continue
+                totals["calls"] += 1
+                totals["errors"] += record.get("status") == "error"
+                totals["inference_seconds"] += record.get("latency", 0.0)
+                totals["eval_tokens"] += record.get("eval_count", 0)
+        return totals
 
-## ルール
-- 名前のみを出力（説明不要）
-- 英語表記
-- 国籍・文化・架空言語の名前も可
-- 1行のみ
+    def ingest(self, data_dir: Path) -> dict:
+        """data_dir 以下の新規・更新された実行を取り込み、件数を返す
 
-## 出力例
-Kain Astralion
-Yuichi Aihara
+        実行ディレクトリは読むだけで変更しない。読めない実行は報告して飛ばし（failed）、
+        残りの取り込みを続ける。
+        """
+        known = dict(self._conn.execute("SELECT run_id, fingerprint FROM runs"))
+        counts = {"ingested": 0, "skipped": 0, "failed": 0, "characters": 0}
+        for run_dir in sorted(Path(data_dir).glob("run_*")):
+            if not run_dir.is_dir():
+                continue
+            fingerprint = self.fingerprint(run_dir)
+            if not fingerprint or known.get(run_dir.name) == fingerprint:
+                counts["skipped"] += 1
+                continue
+            try:
+                counts["characters"] += self._ingest_run(run_dir, fingerprint)
+            except Exception as e:
+                print(f"Skipped unreadable run {run_dir.name}: {type(e).__name__}: {e}")
+                counts["failed"] += 1
+                continue
+            counts["ingested"] += 1
+        return counts
 
-## 出力"""
+    def _ingest_run(self, run_dir: Path, fingerprint: str) -> int:
+        header = RunJournal.read_header(run_dir / "journal.jsonl")
+        metrics = self._run_metrics(run_dir)
+        run_id = run_dir.name
+        placeholders = ", ".join("?" for _ in range(len(self.COLUMNS) + 2))
+        rows = (
+            (run_id, idx, *character.to_row())
+            for idx, character in enumerate(read_characters(run_dir))
+        )
+        with self._conn:
+            # 再開・追記された実行は丸ごと入れ替える
+            self._conn.execute("DELETE FROM characters WHERE run_id = ?", (run_id,))
+            self._conn.executemany(
+                f"INSERT INTO characters (run_id, idx, {', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                rows,
+            )
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM characters WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    str(run_dir),
+                    fingerprint,
+                    header.get("model"),
+                    self._started_at(run_dir),
+                    datetime.now().isoformat(timespec="seconds"),
+                    count,
+                    metrics["calls"],
+                    metrics["errors"],
+                    metrics["inference_seconds"],
+                    metrics["eval_tokens"],
+                ),
+            )
+        return count
 
-    @staticmethod
-    def profile(concept: str) -> str:
-        return f"""以下のキャラクター設定を日本語で説明してください。
+    def query(
+        self,
+        species: Optional[str] = None,
+        role: Optional[str] = None,
+        name: Optional[str] = None,
+        model: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        text: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """条件に合うキャラクターを (run_id, idx) 順に返す
 
-## キャラクター設定
-{concept}
+        species・name は大文字小文字を区別しない完全一致、role は前方一致
+        （"Healer" → "Healer. A compassionate soul ..."）、since/until は実行の
+        開始日時（ISO 8601 の前方部分、例 "2026-10"）、text は全文検索
+        （3文字以上は FTS5 の索引、3文字未満は部分一致の走査）。
+        """
+        clauses, params = [], []
+        if species:
+            clauses.append("c.species = ?")
+            params.append(species)
+        if role:
+            clauses.append("c.role LIKE ?")
+            params.append(role.replace("%", "").replace("_", "") + "%")
+        if name:
+            clauses.append("c.name = ?")
+            params.append(name)
+        if model:
+            clauses.append("r.model = ?")
+            params.append(model)
+        if since:
+            clauses.append("r.started_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("r.started_at < ?")
+            params.append(until)
+        if text and len(text) >= 3:
+            clauses.append("c.id IN (SELECT rowid FROM characters_fts WHERE characters_fts MATCH ?)")
+            params.append('"' + text.replace('"', '""') + '"')
+        elif text:
+            # trigram は3文字未満を検索できないため部分一致で走査する
+            clauses.append("(" + " OR ".join(f"c.{c} LIKE ?" for c in self.FTS_COLUMNS) + ")")
+            params += [f"%{text}%"] * len(self.FTS_COLUMNS)
+        sql = (
+            f"SELECT c.run_id, c.idx, r.model, r.started_at, {', '.join('c.' + c for c in self.COLUMNS)}"
+            " FROM characters c JOIN runs r ON r.run_id = c.run_id"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY c.run_id, c.idx"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cursor = self._conn.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
 
-## ルール
-- 日本語で出力
-- 性別不明・They の場合は「彼は」を使用
-- 1段落のみ
+    def runs(self) -> list:
+        cursor = self._conn.execute("SELECT * FROM runs ORDER BY run_id")
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
 
-## 出力例
-彼はプリティーンのノンバイナリー半人半神で、デジタル栄養コンサルタントとして活動しています。
+    def close(self) -> None:
+        self._conn.close()
 
-## 出力"""
 
-    @staticmethod
-    def catchphrase(concept: str) -> str:
-        return f"""以下のキャラクターの意思を表す印象的な決め台詞を生成してください。
+def catalog_main(argv: list) -> int:
+    """python ollama_hero_gen.py catalog <ingest|query|runs> ..."""
+    import argparse
 
-## キャラクター設定
-{concept}
+    parser = argparse.ArgumentParser(
+        prog="ollama_hero_gen.py catalog",
+        description="実行ディレクトリを横断するキャラクターカタログ（SQLite）",
+    )
+    parser.add_argument("--db", default=None, help="カタログのパス（デフォルト: $DATA_DIR/catalog.sqlite）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ingest", help="新規・更新された run_* ディレクトリを取り込む")
+    sub.add_parser("runs", help="取り込み済みの実行と計測値の一覧")
+    query = sub.add_parser("query", help="条件で検索して表示またはエクスポート")
+    query.add_argument("--species", help="種族（完全一致）")
+    query.add_argument("--role", help="役割（前方一致。例: Healer）")
+    query.add_argument("--name", help="名前（完全一致）")
+    query.add_argument("--model", help="モデル名")
+    query.add_argument("--since", help="この日時以降に開始した実行（例: 2026-10-01）")
+    query.add_argument("--until", help="この日時より前に開始した実行")
+    query.add_argument("--text", "-t", help="name/profile/catchphrase/concept の全文検索")
+    query.add_argument("--limit", type=int, default=None)
+    query.add_argument("--export", "-o", default=None, help="結果を書き出すファイル（.csv / .jsonl）")
+    args = parser.parse_args(argv)
 
-## ルール
-- 日本語で出力
-- キャラクターにふさわしい口調
-- 一人称から始める
-- 1文のみ
+    config = Config.from_env()
+    data_dir = Path(config.data_dir)
+    catalog = RunCatalog(Path(args.db) if args.db else data_dir / "catalog.sqlite")
+    try:
+        if args.command == "ingest":
+            counts = catalog.ingest(data_dir)
+            print(
+                f"Ingested {counts['ingested']} runs ({counts['characters']} characters), "
+                f"skipped {counts['skipped']} unchanged runs"
+                + (f", {counts['failed']} unreadable" if counts["failed"] else "")
+            )
+        elif args.command == "runs":
+            for run in catalog.runs():
+                print(
+                    f"{run['run_id']}  {run['model'] or '-':20} {run['characters']:6d} chars "
+                    f"{run['calls']:7d} calls {run['errors']:4d} errors {run['inference_seconds']:9.1f}s"
+                )
+        else:
+            filters = {
+                key: getattr(args, key)
+                for key in ("species", "role", "name", "model", "since", "until", "text", "limit")
+            }
+            rows = catalog.query(**filters)
+            if args.export:
+                count = 0
+                with open(args.export, "w", newline="", encoding="utf-8") as f:
+                    if args.export.endswith(".jsonl"):
+                        for row in rows:
+                            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                            count += 1
+                    else:
+                        writer = None
+                        for row in rows:
+                            if writer is None:
+                                writer = csv.DictWriter(f, fieldnames=list(row))
+                                writer.writeheader()
+                            writer.writerow(row)
+                            count += 1
+                print(f"Exported {count} characters to {args.export}")
+            else:
+                for row in rows:
+                    print(f"{row['run_id']}#{row['idx']}  {row['name']}  ({row['species']}, {row['role'][:40]})")
+    finally:
+        catalog.close()
+    return 0
 
-## 出力例
-私は、歴史の断片を手に取り、宇宙の隅々に宿る感情を感じ取るよ。
 
-## 出力"""
+# =============================================================================
+# Prompt Profiler
+# =============================================================================
 
-    @staticmethod
-    def new_ability(concept: str) -> str:
-        return f"""以下のキャラクターと対になるキャラクターが持つ特殊能力を1つ生成してください。
 
-## 元キャラクター
-{concept}
+class PromptProfiler(_InferenceBase):
+    """Prompts の各テンプレートを代表的な入力で組み立て、プロンプトトークン数を計測する
 
-## ルール
-- 英語で出力
-- 能力名と説明を1文で
-- 1つのみ
+    リクエストは生成時と同じ組み立て（システムプロンプト + ユーザーメッセージ）で、
+    通常 → 構造化出力 → セッションの順に数える。先に数えたリクエストとメッセージ単位で
+    共通する先頭部分はサーバーのプロンプトキャッシュで再利用されるものとして除くため、
+    各値は「その呼び出しで実際にプリフィルされるトークン数」になる。
 
-## 出力例
-Has the ability to materialize memories: Can share past events with others.
+    server=True なら推論バックエンド（config.backend）に num_predict=1 で送り、応答の
+    prompt_eval_count を使う。それ以外はローカルの推定（estimate_tokens）で数える。
+    """
 
-## 出力"""
+    # 代表的な入力（初期シードから1組。concept は実際の出力と同程度の長さの英文1段落）
+    SAMPLE_ATTRIBUTES = {
+        "physical": "Young Adult Female Elf",
+        "role": "Healer. A compassionate soul devoted to saving lives",
+        "ability": "Can communicate with animals",
+        "wants": "I want to protect the innocent",
+    }
+    SAMPLE_CONCEPT = (
+        "A young adult female elf who serves as a compassionate healer, devoting her life to "
+        "saving others in the war-torn borderlands. She can communicate with animals, and "
+        "relies on birds and wolves to find the wounded hidden deep in the forest. Quiet but "
+        "unyielding, she carries the memory of a village she could not save, and her deepest "
+        "wish is to protect the innocent from the conflicts of the powerful."
+    )
 
-    @staticmethod
-    def new_wants(concept: str) -> str:
-        return f"""以下のキャラクターと対になるキャラクターの切実な願望を1つ生成してください。
+    # 1メッセージあたりのチャットテンプレート（ロール名・区切りトークン）の目安
+    MESSAGE_OVERHEAD = 4
+    # 推定用の分割: 英単語は8文字ごと、数字は3桁ごと、それ以外（日本語・記号）は1文字を1トークン
+    _TOKEN_PATTERN = re.compile(r"[A-Za-z]{1,8}|\d{1,3}|\S")
 
-## 元キャラクター
-{concept}
+    # 1キャラクターあたりのリクエスト（生成モード → テンプレート名）
+    MODES = {
+        "standard": ("concept", *GenerationEngine.CONCEPT_TASKS),
+        "structured": ("concept", *GenerationEngine.STRUCTURED_TASKS),
+        "session": ("concept", *(f"session.{task}" for task in GenerationEngine.CONCEPT_TASKS)),
+    }
 
-## ルール
-- 英語で出力
-- "I want to..." の形式
-- 1文のみ
+    def __init__(self, config: Config, server: bool = False):
+        self.config = config
+        self.server = server
+        # 数えたリクエストのメッセージ列（プロンプトキャッシュで再利用される先頭部分の判定用）
+        self._sent: list = []
 
-## 出力例
-I want to establish a new human settlement in space.
+    @property
+    def counter(self) -> str:
+        """計測方法の名前（予算ファイルに記録し、異なる方法の値とは比較しない）"""
+        return f"{self.config.backend}:{self.config.model}" if self.server else "estimate"
 
-## 出力"""
+    @classmethod
+    def estimate_tokens(cls, messages: list) -> int:
+        """トークナイザーを使わないトークン数の推定（gpt-oss の o200k 系で概ね上振れする）"""
+        return sum(cls.MESSAGE_OVERHEAD + len(cls._TOKEN_PATTERN.findall(m["content"])) for m in messages)
+
+    def requests(self) -> dict:
+        """テンプレート名 → 代表的な入力で組み立てたメッセージ列（生成時の送信順）"""
+        concept = self.SAMPLE_CONCEPT
+        requests = {"concept": self._messages(Prompts.character_concept(**self.SAMPLE_ATTRIBUTES))}
+        for task, template in GenerationEngine.CONCEPT_TASKS.items():
+            requests[task] = self._messages(template(concept))
+        for task, (template, _) in GenerationEngine.STRUCTURED_TASKS.items():
+            requests[task] = self._messages(template(concept))
+        for task in GenerationEngine.CONCEPT_TASKS:
+            requests[f"session.{task}"] = self._messages(
+                Prompts.followup(task), context=Prompts.concept_context(concept)
+            )
+        return requests
+
+    def estimate(self, messages: list) -> int:
+        """1リクエストでプリフィルされるトークン数の推定"""
+        reused = max((self._shared_messages(messages, sent) for sent in self._sent), default=0)
+        self._sent.append(messages)
+        return self.estimate_tokens(messages[reused:])
+
+    async def measure(self, requests: list) -> list:
+        """サーバーが報告した各リクエストの prompt_eval_count（送信順に1件ずつ）"""
+        client = create_backend(self.config, self.config.hosts[0])
+        counts = []
+        try:
+            for messages in requests:
+                response = await client.chat(
+                    model=self.config.model,
+                    messages=messages,
+                    options={"num_predict": 1},
+                    keep_alive=self.config.keep_alive,
+                )
+                counts.append(response.get("prompt_eval_count") or 0)
+        finally:
+            await client.close()
+        return counts
 
     @staticmethod
-    def new_role(concept: str) -> str:
-        return f"""以下のキャラクターと対になるキャラクターのユニークな役割を1つ生成してください。
+    def _shared_messages(messages: list, sent: list) -> int:
+        """先頭から一致するメッセージ数（最後のメッセージは常に評価されるため数えない）"""
+        shared = 0
+        for a, b in zip(messages[:-1], sent):
+            if a != b:
+                break
+            shared += 1
+        return shared
 
-## 元キャラクター
-{concept}
+    def profile(self) -> dict:
+        """{"templates": テンプレート別, "per_character": 生成モード別} のトークン数"""
+        requests = self.requests()
+        if self.server:
+            templates = dict(zip(requests, asyncio.run(self.measure(list(requests.values())))))
+        else:
+            templates = {name: self.estimate(messages) for name, messages in requests.items()}
+        per_character = {
+            mode: sum(templates[name] for name in names) for mode, names in self.MODES.items()
+        }
+        return {"counter": self.counter, "templates": templates, "per_character": per_character}
 
-## ルール
-- 英語で出力
-- 役割名と説明
-- 1つのみ
+    @staticmethod
+    def over_budget(profile: dict, budget: dict) -> list:
+        """予算を超えた (区分, 名前, トークン数, 予算) のリスト（予算のない項目は対象外）"""
+        over = []
+        for section in ("templates", "per_character"):
+            limits = budget.get(section, {})
+            for name, tokens in profile[section].items():
+                if name in limits and tokens > limits[name]:
+                    over.append((section, name, tokens, limits[name]))
+        return over
 
-## 出力例
-Swordsman. Skilled in the art of swordsmanship with a strong sense of duty.
+    @staticmethod
+    def budget_from(profile: dict, headroom: float) -> dict:
+        """計測値に headroom（割合）の余裕を持たせた予算"""
+        def limits(section: str) -> dict:
+            return {name: math.ceil(tokens * (1 + headroom)) for name, tokens in profile[section].items()}
 
-## 出力"""
+        return {"counter": profile["counter"], "templates": limits("templates"), "per_character": limits("per_character")}
 
 
-# =============================================================================
-# Image Prompt Generation
-# =============================================================================
+# 同梱のプロンプト予算（prompts サブコマンドの既定）
+PROMPT_BUDGET_FILE = Path(__file__).with_name("prompt_budget.json")
 
 
-def generate_image_prompt(concept: str) -> str:
-    """画像プロンプト生成（固定テンプレート）"""
-    subject = (
-        "The full-length character illustration from video games, "
-        "likely from role-playing games(JRPG) or fighting games."
+def prompts_main(argv: list) -> int:
+    """python ollama_hero_gen.py prompts [--server] [--budget PATH] [--save-budget]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ollama_hero_gen.py prompts",
+        description="Prompts の各テンプレートとキャラクター1体あたりのプロンプトトークン数を計測し、予算と比較する",
     )
-    angle = "A camera angle that captures the entire body evenly from waist height."
-    pose = (
-        "Standing upright and looking straight ahead, his pose visually conveys "
-        "role, personality, attitude, ability, cultural background and physical attractiveness."
+    parser.add_argument(
+        "--server",
+        action="store_true",
+        help="推論サーバー（INFERENCE_BACKEND）の prompt_eval_count で計測（既定はローカル推定）",
     )
-    background = "white background."
-    artstyle = (
-        "The art style combines delicate hand-drawn lines with exaggerated "
-        "expressions influenced by Japanese manga and anime."
+    parser.add_argument(
+        "--budget",
+        default=str(PROMPT_BUDGET_FILE),
+        help="予算ファイル（JSON）。いずれかの値が予算を超えたら終了コード1",
+    )
+    parser.add_argument(
+        "--save-budget",
+        action="store_true",
+        help="比較せず、現在の計測値に --headroom の余裕を足して予算ファイルに書き出す",
     )
+    parser.add_argument("--headroom", type=float, default=0.1, help="予算の余裕（既定: 0.1 = 10%%）")
+    args = parser.parse_args(argv)
 
-    return f"{subject} {angle} {pose} {background} {concept}, {artstyle}"
+    profiler = PromptProfiler(Config.from_env(), server=args.server)
+    profile = profiler.profile()
+    budget_path = Path(args.budget)
+
+    if args.save_budget:
+        budget = PromptProfiler.budget_from(profile, args.headroom)
+        budget_path.write_text(json.dumps(budget, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Budget saved: {budget_path}")
+        return 0
+
+    budget = json.loads(budget_path.read_text(encoding="utf-8")) if budget_path.exists() else {}
+    if budget and budget.get("counter") != profile["counter"]:
+        print(
+            f"Budget {budget_path} was measured with {budget.get('counter')}, not {profile['counter']}; "
+            f"re-run with the same counter or save a new budget (--save-budget)"
+        )
+        return 2
+
+    over = PromptProfiler.over_budget(profile, budget)
+    flagged = {(section, name) for section, name, _, _ in over}
+    print(f"Prompt tokens ({profile['counter']})")
+    for section, title in (("templates", "template"), ("per_character", "per character")):
+        print(f"\n{title:24} {'tokens':>7} {'budget':>7}")
+        limits = budget.get(section, {})
+        for name, tokens in profile[section].items():
+            mark = "  OVER" if (section, name) in flagged else ""
+            print(f"{name:24} {tokens:7d} {limits.get(name, '-'):>7}{mark}")
+
+    if over:
+        print(f"\n{len(over)} prompt(s) over budget ({budget_path})")
+        return 1
+    return 0
 
 
 # =============================================================================
@@ -433,80 +4123,204 @@ def generate_image_prompt(concept: str) -> str:
 # =============================================================================
 
 
-def main(iterations: Optional[int] = None, model: Optional[str] = None) -> None:
+def build_config(
+    iterations: Optional[int] = None,
+    model: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    cache: Optional[bool] = None,
+    task_options: Optional[list] = None,
+    structured: Optional[bool] = None,
+    session: Optional[bool] = None,
+    resume: Optional[str] = None,
+    warmup: Optional[bool] = None,
+    output_format: Optional[str] = None,
+    shard_rows: Optional[int] = None,
+    adaptive: Optional[bool] = None,
+    priority: Optional[bool] = None,
+    seed_deadline: Optional[float] = None,
+    validate: Optional[bool] = None,
+    character_deadline: Optional[float] = None,
+    run_deadline: Optional[float] = None,
+    hedge: Optional[bool] = None,
+    backend: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> Config:
+    """.env の設定に --resume の実行ディレクトリの設定と CLI 引数を重ねる"""
     config = Config.from_env()
 
-    if iterations is not None or model is not None:
-        config = Config(
-            model=model if model is not None else config.model,
-            host=config.host,
-            data_dir=config.data_dir,
-            num_iterations=iterations if iterations is not None else config.num_iterations,
+    # 再開時はシードを共有する data ディレクトリと、元の生成件数・モードを引き継ぐ
+    if resume:
+        header = RunJournal.load(Path(resume) / "journal.jsonl").header or {}
+        config = replace(
+            config,
+            resume=resume,
+            data_dir=str(Path(resume).parent),
+            num_iterations=header.get("num_iterations", config.num_iterations),
+            structured=header.get("structured", config.structured),
+            session=header.get("session", config.session),
         )
 
+    # CLIの --task-option は .env の TASK_OPTIONS より優先
+    if task_options:
+        merged = {task: dict(opts) for task, opts in config.task_options.items()}
+        for spec in task_options:
+            task, key, value = parse_task_option(spec)
+            merged.setdefault(task, {})[key] = value
+        config = replace(config, task_options=merged)
+
+    overrides = {
+        "num_iterations": iterations,
+        "model": model,
+        "concurrency": concurrency,
+        "cache": cache,
+        "structured": structured,
+        "session": session,
+        "warmup": warmup,
+        "output_format": output_format,
+        "shard_rows": shard_rows,
+        "adaptive": adaptive,
+        "priority": priority,
+        "seed_deadline": seed_deadline,
+        "validate": validate,
+        "character_deadline": character_deadline,
+        "run_deadline": run_deadline,
+        "hedge": hedge,
+        "backend": backend,
+        "batch_size": batch_size,
+    }
+    return replace(config, **{k: v for k, v in overrides.items() if v is not None})
+
+
+def main(config: Config) -> None:
     print(f"Starting generation with model: {config.model}")
+    if config.backend != "ollama":
+        print(f"Backend: {config.backend} ({config.host})")
     print(f"Iterations: {config.num_iterations}")
+    if config.adaptive:
+        print(f"Concurrency: adaptive (start {config.concurrency}, max {config.max_in_flight})")
+    else:
+        print(f"Concurrency: {config.concurrency}")
+    if config.batch_size > 1:
+        print(f"Batching: up to {config.batch_size} prompts per request ({config.batch_window * 1000:g}ms window)")
+    if config.priority:
+        deadline = f"{config.seed_deadline:g}s" if config.seed_deadline > 0 else "none"
+        print(f"Priority scheduling: on (seed evolution in background, deadline {deadline})")
+    if config.structured:
+        print("Structured output: on (3 calls per character)")
+    elif config.session:
+        print("Session prefix reuse: on")
     print(f"Data directory: {config.data_dir}")
 
-    llm = OllamaInference(config)
-    storage = LocalStorage(config)
+    storage = asyncio.run(run_generation(config)).storage
 
-    print(f"Run directory: {storage.run_dir}")
-    print(f"Output file: {storage.output_file}")
-
-    for i in range(config.num_iterations):
-        print(f"\n[{i + 1}/{config.num_iterations}] Generating character...")
+    print(f"\n処理が完了しました。")
+    print(f"実行ディレクトリ: {storage.run_dir}")
+    outputs = storage.output_files
+    more = f" ほか{len(outputs) - 1}ファイル" if len(outputs) > 1 else ""
+    print(f"出力ファイル: {outputs[0]}{more}")
 
-        # 属性取得
-        age = storage.get_random_attribute("age")
-        gender = storage.get_random_attribute("gender")
-        species = storage.get_random_attribute("species")
-        physical = f"{age} {gender} {species}"
-        ability = storage.get_random_attribute("ability")
-        wants = storage.get_random_attribute("wants")
-        role = storage.get_random_attribute("role")
-
-        # 推論
-        concept = llm.generate(Prompts.character_concept(physical, role, ability, wants))
-        name = llm.generate(Prompts.name(concept))
-        profile = llm.generate(Prompts.profile(concept))
-        catchphrase = llm.generate(Prompts.catchphrase(concept))
-        image_prompt = generate_image_prompt(concept)
-
-        # 出力
-        row = [
-            name,
-            profile,
-            catchphrase,
-            image_prompt,
-            concept,
-            age,
-            gender,
-            species,
-            ability,
-            wants,
-            role,
-        ]
-        storage.append_output(row)
 
-        # 対キャラの属性生成
-        new_ability = llm.generate(Prompts.new_ability(concept))
-        new_wants = llm.generate(Prompts.new_wants(concept))
-        new_role = llm.generate(Prompts.new_role(concept))
+async def run_generation(config: Config) -> GenerationEngine:
+    """モデル確認 → 実行ディレクトリ作成 → 生成 → 後始末 までのパイプライン全体"""
+    llm = AsyncOllamaInference(config)
+    try:
+        await llm.ensure_model_available()
+        storage = LocalStorage(config)
+        llm.metrics = MetricsRecorder(on_record=storage.append_metrics)
 
-        storage.append_seed("ability", new_ability)
-        storage.append_seed("wants", new_wants)
-        storage.append_seed("role", new_role)
+        print(f"Run directory: {storage.run_dir}")
+        print(f"Output file: {storage.output_file}")
 
-        print(f"  Name: {name}")
+        # 最初のキャラクターがモデルのロード待ちにならないよう先に読み込む
+        for result in await llm.preload(warmup=config.warmup):
+            line = f"Model preload ({result['host']}): {result['preload']:.1f}s (load {result['preload_load']:.1f}s)"
+            if "warmup" in result:
+                line += f", warm-up {result['warmup']:.1f}s"
+            print(line)
 
-    print(f"\n処理が完了しました。")
-    print(f"実行ディレクトリ: {storage.run_dir}")
-    print(f"出力ファイル: {storage.output_file}")
+        engine = GenerationEngine(config, llm, storage)
+        if config.resume:
+            pending = [i for i in storage.journal.attributes if i >= engine.resumed]
+            print(
+                f"Resuming: {engine.resumed}/{config.num_iterations} characters done, "
+                f"{len(pending)} in progress"
+            )
+        try:
+            await engine.run()
+        finally:
+            # Ctrl+C・例外時も書き込み待ちの行をフラッシュする
+            storage.close()
+            llm.metrics.print_summary()
+            if llm.cache is not None:
+                stats = llm.cache.stats()
+                print(
+                    f"\nResponse cache: {stats['hits']} hits / {stats['misses']} misses "
+                    f"(hit rate {stats['hit_rate']:.1%}, evictions {stats['evictions']})"
+                )
+            if engine.first_character_time is not None:
+                print(f"Time to first character: {engine.first_character_time:.1f}s")
+            rejected = {k: v for k, v in storage.seed_rejections.items() if v}
+            if rejected:
+                detail = ", ".join(f"{k} {v}" for k, v in rejected.items())
+                print(f"Seed dedup: {sum(rejected.values())} near-duplicates rejected ({detail})")
+            if llm.limiter is not None:
+                limiter = llm.limiter
+                print(
+                    f"Adaptive concurrency: final limit {limiter.limit}, peak {limiter.peak} "
+                    f"({limiter.increases} increases / {limiter.decreases} decreases)"
+                )
+            if llm.hedger is not None:
+                hedge = llm.hedger.stats()
+                print(
+                    f"Hedging: {hedge['fired']} hedges fired ({hedge['rate']:.1%} of calls), "
+                    f"{hedge['won']} won, ~{hedge['saved']:.1f}s tail latency saved (est.)"
+                )
+            if llm.batcher is not None:
+                batch = llm.batcher.stats()
+                print(
+                    f"Batching: {batch['requests']} requests in {batch['batches']} batches "
+                    f"(mean {batch['mean']:.1f}, largest {batch['largest']})"
+                )
+            if engine.skipped:
+                print(f"Skipped: {engine.skipped} characters exceeded the per-character deadline")
+            if llm.breaker.trips:
+                print(
+                    f"Circuit breaker: opened {llm.breaker.trips} times, "
+                    f"requests paused {llm.breaker.paused_time:.1f}s"
+                )
+            if engine.deadline_reached:
+                print(
+                    f"Run deadline reached: {engine.committed}/{config.num_iterations} characters; "
+                    f"continue with --resume {storage.run_dir}"
+                )
+            if config.validate:
+                detail = ", ".join(f"{k} {v}" for k, v in sorted(llm.rule_failures.items()))
+                print(
+                    f"Validation: {llm.regenerations} fields regenerated, {llm.unresolved} unresolved"
+                    + (f" ({detail})" if detail else "")
+                )
+            if config.priority:
+                print(f"Seed evolution: {engine.seeds_dropped} seeds dropped (deadline or failure)")
+            if engine.reused_calls:
+                print(f"Journal: {engine.reused_calls} completed calls reused")
+            if engine.prompt_eval_total:
+                print(
+                    f"Prefill: {engine.prompt_eval_total} prompt tokens evaluated, "
+                    f"~{engine.prompt_reused_total} reused from shared prefixes"
+                )
+        return engine
+    finally:
+        await llm.close()
 
 
 if __name__ == "__main__":
     import argparse
+    import sys
+
+    if sys.argv[1:2] == ["catalog"]:
+        sys.exit(catalog_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["prompts"]:
+        sys.exit(prompts_main(sys.argv[2:]))
 
     # 利用可能なモデル一覧
     AVAILABLE_MODELS = [
@@ -544,6 +4358,163 @@ if __name__ == "__main__":
             f"（デフォルト: gpt-oss:20b）"
         ),
     )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=None,
+        help="同時に生成するキャラクター数（OLLAMA_NUM_PARALLEL に合わせる。デフォルト: 1）",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=None,
+        help="推論結果を data/response_cache.sqlite にキャッシュし、同一リクエストを再利用する",
+    )
+    parser.add_argument(
+        "--task-option",
+        action="append",
+        default=None,
+        metavar="TASK.KEY=VALUE",
+        help=(
+            "タスク別の生成オプションを上書き（複数指定可）。"
+            "例: --task-option name.num_predict=256 --task-option 'name.stop=[\"\\n\"]'"
+        ),
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        default=None,
+        help=(
+            "構造化出力モード: name/profile/catchphrase と new_ability/new_wants/new_role を"
+            "それぞれJSONで1回ずつ生成（1キャラあたり7回→3回）"
+        ),
+    )
+    parser.add_argument(
+        "--session",
+        action="store_true",
+        default=None,
+        help=(
+            "セッションモード: システムプロンプト+conceptを共通プレフィックスとして先頭に固定し、"
+            "サーバーのプロンプトキャッシュを再利用（--structured 指定時は無効）"
+        ),
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default=None,
+        choices=list(OUTPUT_FORMATS),
+        help="出力形式（デフォルト: csv）。jsonl.zst は zstandard、parquet は pyarrow が必要",
+    )
+    parser.add_argument(
+        "--shard-rows",
+        type=int,
+        default=None,
+        metavar="N",
+        help="N件ごとに出力ファイルを分割（output-00000.<ext> …）",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        default=None,
+        help="同時推論数をレイテンシ・スループットから自動調整（--concurrency は初期値）",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=None,
+        help="タスク別 p95 を超えて返らない呼び出しを別ホスト・スロットへ重複送信し、先に返った方を使う",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(INFERENCE_BACKENDS),
+        default=None,
+        help="推論バックエンド: ollama（既定）/ openai（/v1/chat/completions 互換の llama.cpp server, vLLM 等）/ fake（決定的な疑似応答）",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="複数キャラクターの同じタスクのプロンプトを最大この件数まで1回のバッチ推論で送る（--backend openai / fake のみ。ollama で 2 以上を指定するとエラー）",
+    )
+    parser.add_argument(
+        "--character-deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="1キャラクターの推論の時間予算。超えたキャラクターは飛ばして次へ進む",
+    )
+    parser.add_argument(
+        "--run-deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="実行全体の時間予算。超えたら新しいキャラクターの生成をやめる（--resume で続行可）",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        default=None,
+        help="出力をプロンプトのルールで検証し、違反したフィールドだけを再生成（VALIDATION_ATTEMPTS 回まで）",
+    )
+    parser.add_argument(
+        "--priority",
+        action="store_true",
+        default=None,
+        help=(
+            "キャラクターの確定に必要な推論を優先し、シード進化（new_ability 等）は空いた枠で"
+            "バックグラウンド実行（--concurrency はサーバー全体の並列スロット数）"
+        ),
+    )
+    parser.add_argument(
+        "--seed-deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="--priority 時、この秒数内に開始できなかったシード進化を破棄",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        default=None,
+        help="起動時に SYSTEM_PROMPT を送ってサーバーのプロンプトキャッシュを温める",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        metavar="RUN_DIR",
+        help=(
+            "中断した実行ディレクトリ（data/run_*）を再開。journal.jsonl に記録済みの"
+            "キャラクター・推論結果は再実行しない"
+        ),
+    )
     args = parser.parse_args()
 
-    main(iterations=args.iterations, model=args.model)
+    config = build_config(
+        iterations=args.iterations,
+        model=args.model,
+        concurrency=args.concurrency,
+        cache=args.cache,
+        task_options=args.task_option,
+        structured=args.structured,
+        session=args.session,
+        resume=args.resume,
+        warmup=args.warmup,
+        output_format=args.output_format,
+        shard_rows=args.shard_rows,
+        adaptive=args.adaptive,
+        priority=args.priority,
+        seed_deadline=args.seed_deadline,
+        validate=args.validate,
+        character_deadline=args.character_deadline,
+        run_deadline=args.run_deadline,
+        hedge=args.hedge,
+        backend=args.backend,
+        batch_size=args.batch_size,
+    )
+    try:
+        check_batching(config)
+    except ValueError as e:
+        parser.error(str(e))
+    main(config)